@@ -1,24 +1,22 @@
 from cdo import Cdo
 import os
+from cdobatch.executor import failure_report
 from cdobatch.node import Node
 from cdobatch.operator import Operator
 
 
 def log_errors(results):
 
-    failed_shelves = set()
-
     for s in results:
         if isinstance(s, str):
             print(s)
 
-        elif s.error is not None:
-            print(s.error, s.stdout)
+    # failures grouped by the shelf variable of each command
+    failed_shelves = failure_report(results, key="shelf")
 
-            # collect failed names
-            for name in shelves["names"]:
-                if name in s.stdout or "(returncode:1)" in s.stdout:
-                    failed_shelves.add(name)
+    for name, failures in failed_shelves.items():
+        for f in failures:
+            print(name, f["failure"], f["attempts"], f["errmsg"])
 
     if len(failed_shelves) > 0:
         print("failed shelves")
@@ -30,7 +28,8 @@ def iceshelf_iterate(shelves):
     root.find_files()
 
     out_root = Node("means", "means")
-    out_shelves = Node("shelves", "shelves")
+    # only read by the means below, kept uncompressed in scratch space
+    out_shelves = Node("shelves", "shelves", intermediate=True)
     out_seasonal = Node("mean_seasonal", "seasonal")
     out_yearly = Node("mean_yearly", "yearly")
 
@@ -45,13 +44,16 @@ def iceshelf_iterate(shelves):
     sellonlat.vectorize(shelves["coords"], type="params", dir="vertical", root=sel_root)
 
     shelf_out_names = []
+    shelf_vars = []
     for n in shelves["names"]:
-        shelf_out_names.append(n + "_{input_basename}.nc")
+        shelf_out_names.append("{shelf}_{input_basename}.nc")
+        shelf_vars.append({"shelf": n})
 
     sel_root.fork_apply("sellonlatbox", "out_name_format", shelf_out_names)
+    sel_root.fork_apply("sellonlatbox", "op_out_name_vars", shelf_vars)
 
     sel_root.configure(root)
-    out = sel_root.run(cdo)
+    out = sel_root.run(cdo, workers=8, retries=3, fuse=True)
 
     log_errors(out)
 
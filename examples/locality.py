@@ -0,0 +1,31 @@
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.schedule import group_by_input, simulate_bytes_read
+
+# estimate the storage reads of a sellonlatbox fan-out over large inputs when
+# run in configured order versus grouped by input file
+
+GB = 1024**3
+
+files = [f"tas_Amon_model{i}_ssp585_r1i1p1f1_201501-210012.nc" for i in range(20)]
+root_node = Node("root", "tas/MODELS_filtered/ssp585/month_avg", files)
+sizes = {root_node.get_root_path() + "/" + f: 4 * GB for f in files}
+
+sel_root = Operator()
+sellonlat = Operator("sellonlatbox")
+boxes = [f"{lon},{lon + 10},-90,-60" for lon in range(0, 360, 6)]
+sellonlat.vectorize(boxes, type="params", dir="vertical", root=sel_root)
+sel_root.configure(root_node)
+
+cmds = sel_root.cdo_cmds
+default = list(range(len(cmds)))
+grouped = [i for g in group_by_input(cmds) for i in g]
+
+for cache in [16 * GB, 64 * GB]:
+    before = simulate_bytes_read(cmds, default, cache, sizes)
+    after = simulate_bytes_read(cmds, grouped, cache, sizes)
+    print(
+        f"{len(cmds)} commands, {cache // GB} GB page cache: "
+        f"configured order {before / GB:.0f} GB read, "
+        f"grouped by input {after / GB:.0f} GB read"
+    )
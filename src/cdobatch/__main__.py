@@ -1,3 +1,5 @@
+import sys
+
 import cdobatch.console as console
 
-console.main()
+sys.exit(console.main())
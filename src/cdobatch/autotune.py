@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any
+
+from .chunks import chain_names
+from .log import log
+
+
+def read_cpu_times(path="/proc/stat") -> tuple[int, int] | None:
+    """
+    :param path str: kernel CPU statistics
+    :return: jiffies spent waiting on I/O and in total over all CPUs, None if
+    they can't be read (e.g. not on Linux)
+    :rtype: tuple[int, int] | None
+    """
+    try:
+        with open(path, "r") as f:
+            fields = f.readline().split()
+    except OSError:
+        return None
+
+    if len(fields) < 6 or fields[0] != "cpu":
+        return None
+
+    times = [int(t) for t in fields[1:]]
+    return times[4], sum(times)
+
+
+class Autotuner:
+    path: str | None
+    levels: dict
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_workers=64,
+        start: int | None = None,
+        interval=10.0,
+        min_samples=4,
+        max_iowait=0.3,
+        tolerance=0.05,
+    ):
+        """
+        Adjust the number of commands run at once per chain of operators from
+        the measured throughput, climbing towards the level with the most
+        commands per second. More workers are not added while the CPUs spend
+        more than max_iowait of their time waiting on I/O, as storage is then
+        saturated. Chosen levels are kept in a JSON file and used as the
+        starting point of the next run.
+
+        :param path str: JSON file with the levels of earlier runs, created on
+        save
+        :param max_workers int: highest number of commands run at once
+        :param start int: level to start operators without a saved level at,
+        defaults to a quarter of max_workers
+        :param interval float: seconds between adjustments of an operator
+        :param min_samples int: commands of an operator finished before its
+        level is adjusted
+        :param max_iowait float: share of CPU time waiting on I/O above which
+        no workers are added
+        :param tolerance float: relative improvement in throughput needed to
+        keep moving in the same direction
+        """
+        self.path = path
+        self.max_workers = max(1, max_workers)
+        self.start = start if start is not None else max(1, self.max_workers // 4)
+        self.interval = interval
+        self.min_samples = min_samples
+        self.max_iowait = max_iowait
+        self.tolerance = tolerance
+
+        # operators: current level, step, direction, measurements
+        self.levels = {}
+        self.saved = {}
+
+        if path is not None and os.path.isfile(path):
+            with open(path, "r") as f:
+                self.saved = json.load(f)
+
+    def get_state(self, name: str) -> dict:
+        s = self.levels.get(name)
+        if s is None:
+            level = self.saved.get(name, {}).get("level", self.start)
+            s = {
+                "level": min(max(1, level), self.max_workers),
+                "step": max(1, level // 2),
+                "direction": 1,
+                "last_rate": None,
+                "count": 0,
+                "t0": time.monotonic(),
+                "cpu0": read_cpu_times(),
+                "rates": {},
+                "history": [],
+            }
+            self.levels[name] = s
+
+        return s
+
+    def get_name(self, c: dict) -> str:
+        """
+        :param c dict: cdo command dictionary
+        :return: operators of the command, levels are kept per chain of
+        operators so piped operators (e.g. -remapbil in -yearmean) are tuned
+        too
+        :rtype: str
+        """
+        return " ".join(chain_names(c))
+
+    def limit(self, c: dict) -> int:
+        """
+        :param c dict: cdo command dictionary about to start
+        :return: number of commands with the same operators which may run at
+        once with it
+        :rtype: int
+        """
+        return self.get_state(self.get_name(c))["level"]
+
+    def record(self, c: dict, r: Any = None):
+        """
+        Count a finished command, adjusting the level of its operator once
+        enough time and commands have passed
+
+        :param c dict: cdo command dictionary which finished
+        :param r CdoResult: its result
+        """
+        name = self.get_name(c)
+        s = self.get_state(name)
+        s["count"] += 1
+
+        now = time.monotonic()
+        elapsed = now - s["t0"]
+        if elapsed < self.interval or s["count"] < self.min_samples:
+            return
+
+        iowait = None
+        cpu = read_cpu_times()
+        if cpu is not None and s["cpu0"] is not None:
+            total = cpu[1] - s["cpu0"][1]
+            if total > 0:
+                iowait = (cpu[0] - s["cpu0"][0]) / total
+
+        self.adjust(name, s["count"] / elapsed, iowait)
+
+        s["count"] = 0
+        s["t0"] = now
+        s["cpu0"] = cpu
+
+    def adjust(self, name: str, rate: float, iowait: float | None = None) -> int:
+        """
+        Move the level of an operator one step after measuring its throughput
+        at the current level
+
+        :param name str: operators of the commands, see get_name
+        :param rate float: commands per second finished at the current level
+        :param iowait float: share of CPU time spent waiting on I/O
+        :return: the new level
+        :rtype: int
+        """
+        s = self.get_state(name)
+        level = s["level"]
+
+        # rates at a level are averaged with earlier measurements
+        previous = s["rates"].get(str(level))
+        s["rates"][str(level)] = rate if previous is None else (previous + rate) / 2
+        s["history"].append([level, rate, iowait])
+
+        saturated = iowait is not None and iowait > self.max_iowait
+        last = s["last_rate"]
+
+        if last is not None and rate < last * (1 + self.tolerance):
+            # no better than the last level, turn around with a smaller step
+            s["direction"] = -s["direction"]
+            s["step"] = max(1, s["step"] // 2)
+
+        if saturated and s["direction"] > 0:
+            s["direction"] = -1
+
+        s["last_rate"] = rate
+        s["level"] = min(max(1, level + s["direction"] * s["step"]), self.max_workers)
+
+        return s["level"]
+
+    def best_levels(self) -> dict:
+        """
+        :return: level with the highest measured throughput of each operator
+        :rtype: dict
+        """
+        best = {}
+        for name, s in self.levels.items():
+            if len(s["rates"]) == 0:
+                best[name] = s["level"]
+            else:
+                best[name] = int(max(s["rates"], key=s["rates"].get))
+
+        return best
+
+    def report(self):
+        for name, level in sorted(self.best_levels().items()):
+            log(f"{name}: {level} workers")
+
+    def save(self):
+        if self.path is None:
+            return
+
+        levels = dict(self.saved)
+        for name, level in self.best_levels().items():
+            levels[name] = {
+                "level": level,
+                "rates": self.levels[name]["rates"],
+            }
+
+        tmp = f"{self.path}.{os.getpid()}.partial"
+        with open(tmp, "w") as f:
+            json.dump(levels, f, indent=2)
+        os.replace(tmp, self.path)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import os
+import shlex
+import uuid
+
+
+def batch_groups(
+    cmds: list[dict],
+    order: list[int],
+    max_batch: int,
+    max_bytes: int,
+    sizes: dict | None = None,
+) -> list[list[int]]:
+    """
+    Group small commands to run in one process. Commands are taken in run
+    order, commands reading more than max_bytes run on their own.
+
+    :param cmds list[dict]: cdo command dictionaries
+    :param order list[int]: order in which command indices are run
+    :param max_batch int: maximum number of commands in a batch
+    :param max_bytes int: maximum size of the files a batched command reads
+    :param sizes dict: size of each input file, read from the filesystem if
+    not given
+    :return: indices of the commands in each group
+    :rtype: list[list[int]]
+    """
+    if sizes is None:
+        sizes = {}
+
+    groups = []
+    batch = []
+
+    for i in order:
+        size = 0
+        for f in cmds[i].get("files", []):
+            if f not in sizes:
+                sizes[f] = os.path.getsize(f) if os.path.isfile(f) else 0
+            size += sizes[f]
+
+        if size > max_bytes:
+            groups.append([i])
+            continue
+
+        batch.append(i)
+        if len(batch) >= max_batch:
+            groups.append(batch)
+            batch = []
+
+    if len(batch) > 0:
+        groups.append(batch)
+
+    return groups
+
+
+def command_argv(
+    cdo_bin: str,
+    c: dict,
+    inputs: dict | None = None,
+    output: str | None = None,
+    silent=False,
+) -> list[str]:
+    """
+    :param cdo_bin str: path of the cdo binary
+    :param c dict: cdo command dictionary
+    :param inputs dict: input files to read from a different path instead
+    :param output str: path to write the output to instead of the command's
+    output
+    :param silent bool: pass -s to cdo
+    :return: the arguments of the cdo process running the command
+    :rtype: list[str]
+    """
+    argv = [cdo_bin]
+
+    if silent:
+        argv.append("-s")
+
+    argv.extend(shlex.split(c["options"]))
+
+    op = f'-{c["func_name"]}'
+    if c["param"] != "":
+        op += f',{c["param"]}'
+    argv.append(op)
+
+    for t in shlex.split(c["input"]):
+        if inputs:
+            t = inputs.get(t, t)
+        argv.append(t)
+
+    if c["output"] != "":
+        argv.append(c["output"] if output is None else output)
+
+    return argv
+
+
+class BatchScript:
+    marker: str
+    script: str
+    count: int
+
+    def __init__(self, argvs: list[list[str]]):
+        """
+        Shell script running commands one after another in a single shell,
+        the output and exit status of each command are delimited by markers
+
+        :param argvs list[list[str]]: arguments of each command
+        """
+        self.marker = f"cdobatch-{uuid.uuid4().hex}"
+        self.count = len(argvs)
+
+        lines = []
+        for i, argv in enumerate(argvs):
+            lines.append(f"printf '\\n{self.marker} begin {i}\\n'")
+            lines.append(" ".join(shlex.quote(a) for a in argv) + " 2>&1 </dev/null")
+            lines.append(f"printf '\\n{self.marker} end {i} %d\\n' $?")
+
+        self.script = "\n".join(lines) + "\n"
+
+    def split(self, text: str) -> list[tuple[str, int | None]]:
+        """
+        Split the output of the script into the output of each command
+
+        :param text str: everything the script wrote
+        :return: output and exit status of each command, the status is None
+        for commands which never finished
+        :rtype: list[tuple[str, int | None]]
+        """
+        outputs = [("", None)] * self.count
+        current = None
+        lines = []
+
+        for line in text.split("\n"):
+            if not line.startswith(self.marker):
+                if current is not None:
+                    lines.append(line)
+                continue
+
+            parts = line.split(" ")
+            if parts[1] == "begin":
+                current = int(parts[2])
+                lines = []
+            elif parts[1] == "end" and current is not None:
+                # the newline printed before the marker ends the last line
+                outputs[current] = ("\n".join(lines), int(parts[3]))
+                current = None
+
+        if current is not None:
+            # the shell died while running this command
+            outputs[current] = ("\n".join(lines), None)
+
+        return outputs
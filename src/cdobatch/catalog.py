@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+
+from cdo import Cdo
+
+try:
+    from cdo.cdo import getCdoVersion, parse_version
+except ImportError:
+    getCdoVersion = None
+    parse_version = None
+
+# private methods of Cdo replaced by CachedCdo, as in python-cdo 1.6
+PRIVATE_METHODS = [
+    "_Cdo__getOperators",
+    "_Cdo__getConfig",
+    "_Cdo__exit_success",
+    "_Cdo__loadOptionalLibs",
+]
+
+# catalogs already read in this process, python-cdo creates a new Cdo
+# instance for every operator call
+_catalogs = {}
+_optional_libs = {}
+
+
+def is_supported() -> bool:
+    """
+    :return: True if the installed python-cdo has the private methods
+    CachedCdo replaces, otherwise CachedCdo behaves like Cdo
+    :rtype: bool
+    """
+    if getCdoVersion is None:
+        return False
+
+    return all(hasattr(Cdo, m) for m in PRIVATE_METHODS)
+
+
+SUPPORTED = is_supported()
+
+
+def cache_dir() -> str:
+    """
+    :return: directory the operator catalogs of cdo binaries are cached in
+    :rtype: str
+    """
+    base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "cdobatch")
+
+
+def get_catalog_path(cdo_bin: str) -> str | None:
+    """
+    :param cdo_bin str: cdo binary, a path or a name on PATH
+    :return: cache file of the binary's catalog, keyed by its path, size and
+    modification time so upgrades are picked up. None if the binary isn't
+    found.
+    :rtype: str | None
+    """
+    path = shutil.which(cdo_bin)
+    if path is None:
+        return None
+
+    path = os.path.realpath(path)
+    st = os.stat(path)
+
+    key = hashlib.sha1(f"{path}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()
+    return os.path.join(cache_dir(), f"cdo-{key[:16]}.json")
+
+
+def load_catalog(cdo: Cdo, probe) -> dict:
+    """
+    :param cdo Cdo: instance whose binary is described
+    :param probe Callable: creates the catalog by running the binary
+    :return: the operators, supported libraries, configuration and version of
+    the binary
+    :rtype: dict
+    """
+    path = get_catalog_path(cdo.CDO)
+
+    if path in _catalogs:
+        return _catalogs[path]
+
+    catalog = None
+    if path is not None and os.path.isfile(path):
+        try:
+            with open(path, "r") as f:
+                catalog = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            catalog = None
+
+    if catalog is None:
+        catalog = probe()
+
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            tmp = f"{path}.{os.getpid()}.partial"
+            with open(tmp, "w") as f:
+                json.dump(catalog, f)
+            os.replace(tmp, path)
+
+    _catalogs[path] = catalog
+    return catalog
+
+
+class CachedCdo(Cdo):
+    """
+    Cdo reading the operator list, libraries and configuration of the cdo
+    binary from a cache on disk instead of running the binary each time an
+    instance is created (once per operator call in python-cdo). Falls back to
+    probing like Cdo with versions of python-cdo it doesn't support, see
+    is_supported.
+    """
+
+    def _catalog(self) -> dict:
+        def probe():
+            return {
+                "operators": Cdo._Cdo__getOperators(self),
+                "libs": Cdo.getSupportedLibs(self),
+                "config": Cdo._Cdo__getConfig(self),
+                "version": getCdoVersion(self.CDO),
+            }
+
+        return load_catalog(self, probe)
+
+    def _Cdo__getOperators(self):
+        return self._catalog()["operators"]
+
+    def getSupportedLibs(self):
+        if not SUPPORTED:
+            return Cdo.getSupportedLibs(self)
+
+        return self._catalog()["libs"]
+
+    def _Cdo__getConfig(self):
+        return self._catalog()["config"]
+
+    def version(self, verbose=False):
+        if verbose or not SUPPORTED:
+            return Cdo.version(self, verbose)
+
+        return self._catalog()["version"]
+
+    def _Cdo__exit_success(self, operatorName):
+        # diff* operators exit with 1 on differences from cdo 1.9.6 onwards
+        if parse_version(self.version()) < parse_version("1.9.6"):
+            return 0
+        if operatorName[0:4] != "diff":
+            return 0
+        return 1
+
+    def _Cdo__loadOptionalLibs(self):
+        # netCDF4 and xarray are looked for by the first instance only
+        if self.CDO not in _optional_libs:
+            Cdo._Cdo__loadOptionalLibs(self)
+            _optional_libs[self.CDO] = {
+                k: getattr(self, k)
+                for k in ["hasNetcdf", "cdf", "hasXarray", "xa_open", "np"]
+                if hasattr(self, k)
+            }
+
+        for k, v in _optional_libs[self.CDO].items():
+            setattr(self, k, v)
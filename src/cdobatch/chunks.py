@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+
+# operators whose result for a time step only depends on time steps of the
+# same year, chains made of these give the same result when each year range
+# is processed on its own and the results are merged. Statistics over
+# seasons (DJF spans two years), whole series or running windows are not.
+TIME_LOCAL_OPERATORS = {
+    # selection
+    "selname",
+    "selvar",
+    "selcode",
+    "selparam",
+    "sellevel",
+    "sellevidx",
+    "sellonlatbox",
+    "selindexbox",
+    "selgrid",
+    "selzaxis",
+    "selyear",
+    "selmon",
+    "selmonth",
+    "selday",
+    "selhour",
+    "seldate",
+    "select",
+    # arithmetic with constants and expressions of one time step
+    "addc",
+    "subc",
+    "mulc",
+    "divc",
+    "abs",
+    "sqr",
+    "sqrt",
+    "exp",
+    "ln",
+    "log10",
+    "int",
+    "nint",
+    "expr",
+    "aexpr",
+    "setrtomiss",
+    "setctomiss",
+    "setmisstoc",
+    "setmissval",
+    # metadata
+    "copy",
+    "setname",
+    "chname",
+    "setunit",
+    "setcode",
+    "setattribute",
+    "setcalendar",
+    # spatial
+    "fldmean",
+    "fldsum",
+    "fldmin",
+    "fldmax",
+    "fldstd",
+    "zonmean",
+    "zonsum",
+    "mermean",
+    "vertmean",
+    "vertsum",
+    "invertlat",
+    "remapbil",
+    "remapbic",
+    "remapcon",
+    "remapnn",
+    "remapdis",
+    "remaplaf",
+    # daily, monthly and yearly statistics, chunks are whole years
+    "daymean",
+    "daysum",
+    "daymin",
+    "daymax",
+    "monmean",
+    "monsum",
+    "monmin",
+    "monmax",
+    "yearmean",
+    "yearsum",
+    "yearmin",
+    "yearmax",
+}
+
+
+def year_chunks(first: int, last: int, size: int) -> list[tuple[int, int]]:
+    """
+    :param first int: first year
+    :param last int: last year, inclusive
+    :param size int: years per chunk
+    :return: first and last year of each chunk
+    :rtype: list[tuple[int, int]]
+    """
+    return [(y, min(y + size - 1, last)) for y in range(first, last + 1, size)]
+
+
+def chain_names(c: dict) -> list[str]:
+    """
+    :param c dict: cdo command dictionary
+    :return: names of all operators in the command
+    :rtype: list[str]
+    """
+    names = [c["func_name"]]
+    for t in c.get("input", "").split():
+        if t.startswith("-") and len(t) > 1 and not t[1].isdigit():
+            names.append(t[1:].split(",")[0])
+
+    return names
+
+
+def is_splittable(c: dict) -> bool:
+    """
+    :param c dict: cdo command dictionary
+    :return: True if the command reads one file, writes one and only uses
+    time local operators
+    :rtype: bool
+    """
+    if c["output"] == "" or len(c.get("files", [])) != 1:
+        return False
+
+    if not c["input"].endswith(c["files"][0]):
+        return False
+
+    return all(n in TIME_LOCAL_OPERATORS for n in chain_names(c))
+
+
+def default_chunk_dir() -> str:
+    """
+    :return: directory on disk for time chunks, chunks of long files may not
+    fit in RAM backed scratch space
+    :rtype: str
+    """
+    return os.path.join(tempfile.gettempdir(), "cdobatch", "chunks")
+
+
+def get_chunk_path(chunk_dir: str, output: str, first: int, last: int) -> str:
+    """
+    :return: path of the part of output covering the years first to last
+    :rtype: str
+    """
+    key = hashlib.sha1(output.encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(output))[0]
+    return os.path.join(chunk_dir, f"{key}_{name}.{first}-{last}.nc")
@@ -1,2 +1,206 @@
-def main():
-    pass
+import argparse
+
+# subcommands import what they need when they run, so quick commands like
+# status don't load cdo or the executor
+
+
+def index(args):
+    from .log import log
+    from .record import Record
+
+    r = Record(args.dir)
+    r.index()
+
+    r.path = args.output or f"{args.dir.rstrip('/')}/dataset.json"
+    r.dump()
+
+    log(f"indexed {len(r.root_nodes[0].files)} files into {r.path}")
+
+
+def parse_chain(ops: list) -> list:
+    """
+    :param ops list[str]: operators as name[,param], outermost first like on
+    a cdo command line
+    :return: the operators
+    :rtype: list[Operator]
+    """
+    from .operator import Operator
+
+    chain = []
+    for o in ops:
+        name, _, param = o.lstrip("-").partition(",")
+        chain.append(Operator(name, param))
+
+    return chain
+
+
+def plan(args):
+    from .log import log
+    from .node import Node
+    from .record import Record
+
+    r = Record(args.record)
+    r.load()
+
+    node = r.get_node(args.node)
+    if node is None:
+        log(f"no node {args.node} in {args.record}")
+        return 1
+
+    chain = parse_chain(args.ops)
+    root = chain[0]
+    if len(chain) > 1:
+        root.extend(chain[1:])
+
+    root.op_out_node = Node("out", args.out, intermediate=args.intermediate)
+    root.op_options = args.options
+    if args.format != "":
+        root.out_name_format = args.format
+
+    root.configure(node, route_mode=args.route, plan=args.plan)
+    log(f"{len(root.cdo_cmds)} commands in {args.plan}")
+
+
+def load(args):
+    from .operator import Operator
+
+    return Operator.from_plan(args.plan)
+
+
+def dry_run(args):
+    op = load(args)
+
+    for c in op.run_dry():
+        print(c)
+
+
+def run(args):
+    from .catalog import CachedCdo
+    from .executor import failure_report
+    from .log import log
+
+    op = load(args)
+    results = op.run(
+        CachedCdo(args.cdo),
+        journal=args.journal,
+        resume=args.resume,
+        workers=args.workers,
+        retries=args.retries,
+        order=args.order,
+        progress=args.progress or True,
+        autotune=args.autotune,
+    )
+
+    failures = failure_report(results)
+    for cmd, entries in failures.items():
+        log(f"failed: {cmd}: {entries[-1]['errmsg']}")
+
+    ran = len([r for r in results if r is not None])
+    log(f"{ran - len(failures)} of {ran} commands succeeded")
+
+    if len(failures) > 0:
+        return 1
+
+
+def status(args):
+    from .journal import Journal
+
+    journal = Journal(args.journal)
+    journal.load()
+
+    counts = {Journal.DONE: 0, Journal.FAILED: 0, "pending": 0}
+
+    op = load(args)
+    for c in op.cdo_cmds:
+        state = journal.states.get(op.make_cdo_cmd_str(c), "pending")
+        counts[state] = counts.get(state, 0) + 1
+
+    print(
+        f"{len(op.cdo_cmds)} commands: {counts[Journal.DONE]} done, "
+        f"{counts[Journal.FAILED]} failed, {counts['pending']} pending"
+    )
+
+
+def worker(args):
+    from .catalog import CachedCdo
+    from .log import log
+    from .workqueue import WorkQueue, run_worker
+
+    queue = WorkQueue(args.queue, lease=args.lease, retries=args.retries)
+    count = run_worker(
+        queue,
+        CachedCdo(),
+        worker=args.id,
+        batch=args.batch,
+        poll=args.poll,
+        exit_when_empty=not args.wait,
+    )
+    log(f"worker ran {count} commands")
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="cdobatch")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("index", help="index the netCDF files of a directory")
+    p.add_argument("dir", help="directory to index")
+    p.add_argument("-o", "--output", help="record file, defaults to dir/dataset.json")
+    p.set_defaults(func=index)
+
+    p = subparsers.add_parser("plan", help="create the commands of an operator chain")
+    p.add_argument("record", help="record file with the input node")
+    p.add_argument("node", help="name of the input node")
+    p.add_argument("plan", help="plan file to write")
+    p.add_argument("ops", nargs="+", help="operators as name[,param], outermost first")
+    p.add_argument("--out", required=True, help="output directory")
+    p.add_argument("--format", default="", help="output name format")
+    p.add_argument("--options", default="", help="cdo options")
+    p.add_argument("--route", default="default", help="routing mode")
+    p.add_argument(
+        "--intermediate", action="store_true", help="outputs are intermediate"
+    )
+    p.set_defaults(func=plan)
+
+    p = subparsers.add_parser("dry-run", help="print the command lines of a plan")
+    p.add_argument("plan", help="plan file")
+    p.set_defaults(func=dry_run)
+
+    p = subparsers.add_parser("run", help="run the commands of a plan")
+    p.add_argument("plan", help="plan file")
+    p.add_argument("--journal", default=None, help="journal file")
+    p.add_argument("--resume", action="store_true", help="skip finished commands")
+    p.add_argument("--workers", type=int, default=1, help="parallel commands")
+    p.add_argument("--retries", type=int, default=0, help="transient retries")
+    p.add_argument("--order", default="default", help="default, input or cost")
+    p.add_argument("--cdo", default="cdo", help="cdo binary")
+    p.add_argument("--progress", default=None, help="JSON file of the latest progress")
+    p.add_argument(
+        "--autotune",
+        default=None,
+        help="JSON file of worker levels, tunes workers per operator up to --workers",
+    )
+    p.set_defaults(func=run)
+
+    p = subparsers.add_parser("status", help="progress of a plan from its journal")
+    p.add_argument("plan", help="plan file")
+    p.add_argument("journal", help="journal file")
+    p.set_defaults(func=status)
+
+    p = subparsers.add_parser("worker", help="run commands from a shared work queue")
+    p.add_argument("queue", help="path to the work queue database")
+    p.add_argument("--id", default=None, help="worker id, defaults to host:pid")
+    p.add_argument("--batch", type=int, default=1, help="commands claimed at once")
+    p.add_argument("--lease", type=float, default=600.0, help="lease in seconds")
+    p.add_argument("--retries", type=int, default=2, help="transient retries")
+    p.add_argument("--poll", type=float, default=5.0, help="seconds between polls")
+    p.add_argument(
+        "--wait", action="store_true", help="keep polling when the queue is empty"
+    )
+    p.set_defaults(func=worker)
+
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,377 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
+
+import heapq
+import io
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable
+
+TRANSIENT = "transient"
+DETERMINISTIC = "deterministic"
+
+# cdo/netcdf/libc messages seen when shared filesystems hiccup, the same
+# command usually succeeds when retried
+TRANSIENT_PATTERNS = [
+    re.compile(p, re.IGNORECASE)
+    for p in [
+        r"input/output error",
+        r"remote i/o error",
+        r"stale (nfs )?file handle",
+        r"resource temporarily unavailable",
+        r"device or resource busy",
+        r"too many open files",
+        r"connection (timed out|reset|refused)",
+        r"netcdf: hdf error",
+        r"netcdf: i/o failure",
+        r"hdf5-diag",
+        r"interrupted system call",
+    ]
+]
+
+
+class DependencyError(Exception):
+    """
+    A command was not run because a command it reads the output of failed
+    """
+
+
+class _ThreadOutput(io.TextIOBase):
+    """
+    Stream that sends writes to a per thread buffer, used in place of
+    sys.stdout/sys.stderr so parallel cdo calls don't mix their output
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, s):
+        target = getattr(self.local, "buffer", None)
+        if target is None:
+            target = self.stream
+
+        return target.write(s)
+
+    def flush(self):
+        if getattr(self.local, "buffer", None) is None:
+            self.stream.flush()
+
+
+@contextmanager
+def captured_output():
+    """
+    Capture stdout and stderr of the calling thread
+
+    :return: the stderr and stdout buffers
+    :rtype: tuple[io.StringIO, io.StringIO]
+    """
+    err = io.StringIO()
+    out = io.StringIO()
+
+    if isinstance(sys.stdout, _ThreadOutput) and isinstance(sys.stderr, _ThreadOutput):
+        sys.stdout.local.buffer = out
+        sys.stderr.local.buffer = err
+        try:
+            yield err, out
+        finally:
+            sys.stdout.local.buffer = None
+            sys.stderr.local.buffer = None
+    else:
+        with redirect_stderr(err), redirect_stdout(out):
+            yield err, out
+
+
+def classify_failure(error: Any, output: str = "") -> str:
+    """
+    Decide if a failed cdo call is worth retrying
+
+    :param error Any: the exception raised by cdo
+    :param output str: anything cdo wrote while running
+    :return: "transient" for I/O errors that may succeed on retry, otherwise
+    "deterministic"
+    :rtype: str
+    """
+    returncode = getattr(error, "returncode", None)
+    if isinstance(returncode, int) and returncode < 0:
+        # killed by a signal, not caused by the command itself
+        return TRANSIENT
+
+    text = " ".join([str(getattr(error, "stderr", "")), str(error), output])
+    for p in TRANSIENT_PATTERNS:
+        if p.search(text):
+            return TRANSIENT
+
+    return DETERMINISTIC
+
+
+def execute(
+    cmds: list[dict],
+    run_one: Callable[[dict], Any],
+    workers=1,
+    retries=0,
+    backoff=1.0,
+    on_result: Callable[[int, Any], None] | None = None,
+    groups: list[list[int]] | None = None,
+    run_group: Callable[[list[dict]], list] | None = None,
+    deps: dict | None = None,
+    on_start: Callable[[int], None] | None = None,
+    on_retry: Callable[[int, Any], None] | None = None,
+    concurrency: Callable[[dict], int] | None = None,
+    skip: Callable[[dict, Exception], Any] | None = None,
+    concurrency_key: Callable[[dict], Any] | None = None,
+) -> list:
+    """
+    Run commands on a thread pool. Transient failures are put back in the
+    queue after an exponential backoff, other commands keep running in the
+    meantime.
+
+    :param cmds list[dict]: cdo command dictionaries
+    :param run_one Callable: runs a single command and returns its result,
+    results need an error attribute
+    :param workers int: number of commands to run at once
+    :param retries int: maximum number of retries for transient failures
+    :param backoff float: seconds to wait before the first retry, doubled for
+    each following retry
+    :param on_result Callable: called in the calling thread with the command
+    index and the final result of each command
+    :param groups list[list[int]]: indices of commands to run back to back on
+    the same worker, in the given order. Defaults to one command per group in
+    command order.
+    :param run_group Callable: runs the commands of a group and returns their
+    results, defaults to calling run_one on each command
+    :param deps dict: indices of the commands each command index waits for,
+    groups start once the commands they wait for outside the group have
+    final results
+    :param on_start Callable: called with the index of each command when an
+    attempt to run it starts
+    :param on_retry Callable: called with the index and result of each
+    attempt which failed and is retried
+    :param concurrency Callable: number of groups of the same kind (see
+    concurrency_key) as a command which may run at once, at most workers.
+    Called before each start and when a group finishes.
+    :param skip Callable: makes the failed result of a command, given the
+    DependencyError it failed with, when a command it waits for failed. The
+    command isn't run. If None, such commands run anyway.
+    :param concurrency_key Callable: kind of a command limited by concurrency,
+    defaults to its operator
+    :return: final result of each command, in command order
+    :rtype: list
+    """
+    results = [None] * len(cmds)
+    attempts = [0] * len(cmds)
+
+    if groups is None:
+        groups = [[i] for i in range(len(cmds))]
+
+    pending = deque(groups)
+    delayed = []
+    running = {}
+
+    if deps is None:
+        deps = {}
+
+    # groups waiting for other commands and how many they still wait for
+    waiting = {}
+    dependents = {}
+    forced = set()
+
+    def hold(group):
+        if id(group) in forced:
+            return False
+
+        members = set(group)
+        unmet = {
+            d
+            for i in group
+            for d in deps.get(i, ())
+            if d not in members and results[d] is None
+        }
+        if len(unmet) == 0:
+            return False
+
+        waiting[id(group)] = [group, len(unmet)]
+        for d in unmet:
+            dependents.setdefault(d, []).append(id(group))
+        return True
+
+    def release(i):
+        for g in dependents.pop(i, []):
+            waiting[g][1] -= 1
+            if waiting[g][1] == 0:
+                pending.appendleft(waiting.pop(g)[0])
+
+    def skip_failed(group):
+        # fail commands waiting for failed commands without running them
+        ready = []
+        for i in group:
+            failed = [
+                d
+                for d in deps.get(i, ())
+                if results[d] is not None and results[d].error is not None
+            ]
+            if len(failed) == 0:
+                ready.append(i)
+                continue
+
+            r = skip(cmds[i], DependencyError(f"{len(failed)} dependencies failed"))
+            r.attempts = 0
+            r.failure = DETERMINISTIC
+            results[i] = r
+            if on_result is not None:
+                on_result(i, r)
+
+            release(i)
+
+        return ready
+
+    if concurrency_key is None:
+
+        def concurrency_key(c):
+            return c.get("func_name")
+
+    # running groups of each kind and groups waiting for one of them to finish
+    active = {}
+    parked = {}
+
+    def park(group):
+        c = cmds[group[0]]
+        key = concurrency_key(c)
+        if active.get(key, 0) < max(1, concurrency(c)):
+            active[key] = active.get(key, 0) + 1
+            return False
+
+        parked.setdefault(key, deque()).append(group)
+        return True
+
+    def unpark(group):
+        c = cmds[group[0]]
+        key = concurrency_key(c)
+        active[key] -= 1
+
+        # as many groups as can start now, in the order they were parked
+        queue = parked.get(key)
+        free = max(1, concurrency(c)) - active[key]
+        ready = []
+        while queue and len(ready) < free:
+            ready.append(queue.popleft())
+        if queue is not None and len(queue) == 0:
+            del parked[key]
+
+        pending.extendleft(reversed(ready))
+
+    if run_group is None:
+
+        def run_group(group_cmds):
+            return [run_one(c) for c in group_cmds]
+
+    out = _ThreadOutput(sys.stdout)
+    err = _ThreadOutput(sys.stderr)
+
+    with redirect_stdout(out), redirect_stderr(err), ThreadPoolExecutor(
+        max_workers=max(1, workers)
+    ) as pool:
+        while pending or delayed or running or waiting or parked:
+            now = time.monotonic()
+            while len(delayed) > 0 and delayed[0][0] <= now:
+                pending.append([heapq.heappop(delayed)[1]])
+
+            if len(waiting) > 0 and not (pending or delayed or running):
+                # nothing left which could satisfy the rest, e.g. a cycle
+                for group, _ in waiting.values():
+                    forced.add(id(group))
+                    pending.append(group)
+                waiting.clear()
+                dependents.clear()
+
+            while len(pending) > 0 and len(running) < workers:
+                group = pending.popleft()
+                if hold(group):
+                    continue
+
+                if skip is not None:
+                    group = skip_failed(group)
+                    if len(group) == 0:
+                        continue
+
+                if concurrency is not None and park(group):
+                    continue
+
+                for i in group:
+                    attempts[i] += 1
+                    if on_start is not None:
+                        on_start(i)
+                running[pool.submit(run_group, [cmds[i] for i in group])] = group
+
+            timeout = None
+            if len(delayed) > 0:
+                timeout = max(0.0, delayed[0][0] - now)
+
+            if len(running) == 0:
+                if timeout is not None:
+                    time.sleep(timeout)
+                continue
+
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for f in done:
+                group = running.pop(f)
+                if concurrency is not None:
+                    unpark(group)
+
+                for i, r in zip(group, f.result()):
+                    r.attempts = attempts[i]
+
+                    if r.error is not None:
+                        r.failure = classify_failure(r.error, r.stdout)
+
+                        if r.failure == TRANSIENT and attempts[i] <= retries:
+                            delay = backoff * 2 ** (attempts[i] - 1)
+                            heapq.heappush(delayed, (time.monotonic() + delay, i))
+                            if on_retry is not None:
+                                on_retry(i, r)
+                            continue
+
+                    results[i] = r
+                    if on_result is not None:
+                        on_result(i, r)
+
+                    release(i)
+
+    return results
+
+
+def failure_report(results: list, key: str | None = None) -> dict:
+    """
+    Collect the failed commands from a run
+
+    :param results list[CdoResult]: results returned by Operator.run
+    :param key str: operator variable to group failures by (e.g. a custom
+    out_name_vars field or "input_basename"), groups by command line if None
+    :return: lists of failures, keyed by the value of the variable
+    :rtype: dict
+    """
+    report = {}
+
+    for r in results:
+        if isinstance(r, str) or r.error is None:
+            continue
+
+        entry = {
+            "cmd": r.cmd_str,
+            "failure": r.failure,
+            "attempts": r.attempts,
+            "errmsg": r.errmsg,
+            "vars": r.vars,
+        }
+
+        k = r.cmd_str if key is None else r.vars.get(key)
+        report.setdefault(k, []).append(entry)
+
+    return report
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import shlex
+
+from .batch import command_argv
+from .log import log
+from .plan import dedupe_commands
+
+
+def get_build_commands(ops: list) -> list[dict]:
+    """
+    Collect the configured commands of several stages. Commands without an
+    output file can't be tracked by a build tool and are left out, of
+    commands writing the same output only the first is kept.
+
+    :param ops list[Operator]: configured operators, stages reading the
+    outputs of other stages depend on them through their files
+    :return: cdo command dictionaries
+    :rtype: list[dict]
+    """
+    cmds = []
+    skipped = 0
+
+    for op in ops:
+        for c in op.cdo_cmds:
+            if c["output"] == "":
+                skipped += 1
+            else:
+                cmds.append(c)
+
+    if skipped > 0:
+        log(f"{skipped} commands without an output file are not exported")
+
+    cmds, report = dedupe_commands(cmds)
+
+    conflicts = set()
+    for output, writers in report["conflicts"].items():
+        log(f"{len(writers)} different commands write {output}, keeping the first")
+        conflicts.update(id(w) for w in writers[1:])
+
+    return [c for c in cmds if id(c) not in conflicts]
+
+
+def get_shell_command(c: dict, cdo_bin="cdo") -> str:
+    """
+    :param c dict: cdo command dictionary
+    :param cdo_bin str: cdo binary to run
+    :return: shell command writing the output under a temporary name first,
+    so failed commands leave no output behind
+    :rtype: str
+    """
+    tmp = f"{c['output']}.partial"
+    argv = command_argv(cdo_bin, c, output=tmp)
+
+    return " ".join(
+        [" ".join(shlex.quote(a) for a in argv), "&&", "mv"]
+        + [shlex.quote(tmp), shlex.quote(c["output"])]
+    )
+
+
+def ninja_escape_path(p: str) -> str:
+    return p.replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+
+
+def export_ninja(ops: list, path: str, cdo_bin="cdo") -> int:
+    """
+    Write the commands of configured operators as a build.ninja file. Each
+    command is a build statement with its input files as explicit inputs,
+    stages are ordered by ninja through the files they share.
+
+    :param ops list[Operator]: configured operators
+    :param path str: path of the ninja file
+    :param cdo_bin str: cdo binary to run
+    :return: number of build statements written
+    :rtype: int
+    """
+    cmds = get_build_commands(ops)
+
+    lines = [
+        "rule cdo",
+        "  command = $cmd",
+        "  description = CDO $out",
+        "  restat = 1",
+        "",
+    ]
+
+    for c in cmds:
+        inputs = " ".join(ninja_escape_path(f) for f in c["files"])
+        lines.append(f"build {ninja_escape_path(c['output'])}: cdo {inputs}".rstrip())
+        lines.append(f"  cmd = {get_shell_command(c, cdo_bin).replace('$', '$$')}")
+
+    lines.append("")
+    lines.append("default " + " ".join(ninja_escape_path(c["output"]) for c in cmds))
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return len(cmds)
+
+
+def export_make(ops: list, path: str, cdo_bin="cdo") -> int:
+    """
+    Write the commands of configured operators as a Makefile, see
+    export_ninja. Paths can't contain spaces.
+
+    :param ops list[Operator]: configured operators
+    :param path str: path of the Makefile
+    :param cdo_bin str: cdo binary to run
+    :return: number of rules written
+    :rtype: int
+    """
+    cmds = get_build_commands(ops)
+
+    def escape(p):
+        return p.replace("$", "$$")
+
+    lines = [
+        ".PHONY: all",
+        "all: " + " ".join(escape(c["output"]) for c in cmds),
+        "",
+    ]
+
+    for c in cmds:
+        lines.append(
+            f"{escape(c['output'])}: {' '.join(escape(f) for f in c['files'])}"
+        )
+        lines.append("\t@mkdir -p $(@D)")
+        lines.append(f"\t{escape(get_shell_command(c, cdo_bin))}")
+        lines.append("")
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+    return len(cmds)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+import re
+
+# width of normalized timestamps, YYYYMMDDhhmmss
+TIME_WIDTH = 14
+
+
+def compile_template(template: str) -> re.Pattern:
+    """
+    Turn a file name template into a regular expression with a named group
+    for each facet. Facets match anything but "/", so templates can describe
+    directories too. A facet used more than once must have the same value
+    everywhere.
+
+    :param template str: e.g. "{var}_{freq}_{model}_{scenario}_{member}_{start}-{end}.nc"
+    :return: compiled expression matching whole relative paths
+    :rtype: re.Pattern
+    """
+    pattern = ""
+    pos = 0
+    seen = set()
+
+    for m in re.finditer(r"\{(\w+)\}", template):
+        name = m.group(1)
+        pattern += re.escape(template[pos : m.start()])
+
+        # facets used twice (e.g. a directory per variable) must match
+        if name in seen:
+            pattern += f"(?P={name})"
+        else:
+            pattern += f"(?P<{name}>[^/]+?)"
+            seen.add(name)
+
+        pos = m.end()
+
+    pattern += re.escape(template[pos:])
+    return re.compile(pattern)
+
+
+def time_key(t: str, fill: str) -> str:
+    """
+    Normalize a timestamp of any precision (e.g. "1990", "199001",
+    "19900115") so timestamps compare as strings
+
+    :param t str: digits of the timestamp, other characters are dropped
+    :param fill str: "0" for the start of a range, "9" for its end
+    :return: the timestamp padded to TIME_WIDTH digits
+    :rtype: str
+    """
+    digits = "".join(c for c in t if c.isdigit())
+    return digits[:TIME_WIDTH].ljust(TIME_WIDTH, fill)
+
+
+class FacetIndex:
+    template: str
+    names: list[str]
+    columns: dict
+    inverted: dict
+    unmatched: list[int]
+    count: int
+    time_facets: tuple[str, str]
+    by_start: list[int]
+    starts: list[str]
+
+    def __init__(self, template: str, files: list[str], start="start", end="end"):
+        """
+        Parse the facets of each file into one column per facet, with an
+        inverted index from each value to the positions of the files having
+        it. Files not matching the template are kept in unmatched.
+
+        :param template str: file name template, see compile_template
+        :param files list[str]: relative file paths
+        :param start str: facet holding the first timestamp of a file
+        :param end str: facet holding the last timestamp of a file
+        """
+        regex = compile_template(template)
+
+        self.template = template
+        self.names = list(regex.groupindex)
+        self.columns = {n: [] for n in self.names}
+        self.inverted = {n: {} for n in self.names}
+        self.unmatched = []
+        self.count = len(files)
+
+        for i, f in enumerate(files):
+            m = regex.fullmatch(f)
+
+            for n in self.names:
+                v = None if m is None else m.group(n)
+                self.columns[n].append(v)
+
+                if v is not None:
+                    self.inverted[n].setdefault(v, []).append(i)
+
+            if m is None:
+                self.unmatched.append(i)
+
+        # positions sorted by start time to prune time range queries
+        self.time_facets = (start, end)
+        self.by_start = []
+        self.starts = []
+
+        if start in self.columns and end in self.columns:
+            times = [
+                (time_key(s, "0"), i)
+                for i, s in enumerate(self.columns[start])
+                if s is not None
+            ]
+            times.sort()
+            self.by_start = [i for _, i in times]
+            self.starts = [t for t, _ in times]
+
+    def values(self, name: str) -> list[str]:
+        """
+        :param name str: facet name
+        :return: distinct values of the facet
+        :rtype: list[str]
+        """
+        return sorted(self.inverted.get(name, {}))
+
+    def select(self, start=None, end=None, **facets) -> list[int]:
+        """
+        Find the files with the given facet values, overlapping a time range
+
+        :param start str: keep files ending at or after this time
+        :param end str: keep files starting at or before this time
+        :param facets: facet values to match, a list matches any of its values
+        :return: positions of the matching files, in file order
+        :rtype: list[int]
+        """
+        selected = None
+
+        # smallest sets first keeps the intersections small
+        sets = []
+        for name, wanted in facets.items():
+            if name not in self.inverted:
+                print("Unknown facet", name)
+                return []
+
+            if isinstance(wanted, str):
+                wanted = [wanted]
+
+            positions = set()
+            for v in wanted:
+                positions.update(self.inverted[name].get(v, []))
+            sets.append(positions)
+
+        for s in sorted(sets, key=len):
+            selected = s if selected is None else selected & s
+
+        if start is not None or end is not None:
+            in_range = self.select_time(start, end)
+            selected = in_range if selected is None else selected & in_range
+
+        if selected is None:
+            return list(range(self.count))
+
+        return sorted(selected)
+
+    def select_time(self, start=None, end=None) -> set[int]:
+        """
+        :return: positions of the files overlapping the time range
+        :rtype: set[int]
+        """
+        if len(self.starts) == 0:
+            print("Time range needs the facets", *self.time_facets)
+            return set()
+
+        # files starting after the end of the range can't overlap
+        last = len(self.starts)
+        if end is not None:
+            last = bisect_right(self.starts, time_key(end, "9"))
+
+        candidates = self.by_start[:last]
+        if start is None:
+            return set(candidates)
+
+        q_start = time_key(start, "0")
+        ends = self.columns[self.time_facets[1]]
+
+        return {i for i in candidates if time_key(ends[i], "9") >= q_start}
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from typing import Any, Callable
+
+# bumped whenever an edge is added to any operator graph, indexes built at an
+# older generation are rebuilt on next use
+_generation = 0
+
+
+def graph_changed():
+    global _generation
+    _generation += 1
+
+
+def generation() -> int:
+    return _generation
+
+
+class GraphIndex:
+    ops: list
+    index: dict
+    next: list[list[int]]
+    leaves: list[int]
+    path_counts: list[int] | None
+    generation: int
+
+    def __init__(self, root: Any):
+        """
+        Index of all operators reachable from root, built without recursion.
+        Operators are stored in topological order (root first) and edges as
+        arrays of positions in that order.
+
+        :param root Operator: the root of the graph
+        """
+        self.generation = _generation
+
+        # iterative post order, reversed gives a topological order
+        order = []
+        seen = {id(root)}
+        stack = [(root, iter(root.op_next))]
+
+        while len(stack) > 0:
+            op, children = stack[-1]
+
+            for c in children:
+                if id(c) not in seen:
+                    seen.add(id(c))
+                    stack.append((c, iter(c.op_next)))
+                    break
+            else:
+                stack.pop()
+                order.append(op)
+
+        order.reverse()
+
+        self.ops = order
+        self.index = {id(o): i for i, o in enumerate(order)}
+        self.next = [[self.index[id(c)] for c in o.op_next] for o in order]
+        self.leaves = [i for i, n in enumerate(self.next) if len(n) == 0]
+        self.path_counts = None
+
+    def count_paths(self) -> list[int]:
+        """
+        Count the paths from each operator to the leaves, without enumerating
+        them
+
+        :return: number of paths starting at each position
+        :rtype: list[int]
+        """
+        if self.path_counts is None:
+            counts = [1] * len(self.ops)
+
+            for i in reversed(range(len(self.ops))):
+                if len(self.next[i]) > 0:
+                    counts[i] = sum(counts[c] for c in self.next[i])
+
+            self.path_counts = counts
+
+        return self.path_counts
+
+    def sum_over_paths(self, weight: Callable[[Any], int]) -> list[int]:
+        """
+        Sum a weight of each operator over every path to the leaves, without
+        enumerating the paths
+
+        :param weight Callable: weight of an operator
+        :return: total weight of all paths starting at each position
+        :rtype: list[int]
+        """
+        counts = self.count_paths()
+        totals = [0] * len(self.ops)
+
+        for i in reversed(range(len(self.ops))):
+            totals[i] = weight(self.ops[i]) * counts[i]
+            totals[i] += sum(totals[c] for c in self.next[i])
+
+        return totals
+
+    def is_current(self) -> bool:
+        return self.generation == _generation
+
+    def iter_paths(self, start=0):
+        """
+        Generate every path from the operator at position start to a leaf, in
+        depth first order
+
+        :param start int: position of the first operator of the paths
+        :return: generator of operator lists
+        """
+        path = []
+        stack = [(start, 0)]
+
+        while len(stack) > 0:
+            i, depth = stack.pop()
+
+            del path[depth:]
+            path.append(self.ops[i])
+
+            if len(self.next[i]) == 0:
+                yield path[:]
+                continue
+
+            for c in reversed(self.next[i]):
+                stack.append((c, depth + 1))
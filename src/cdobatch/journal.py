@@ -0,0 +1,115 @@
+from __future__ import annotations
+import json
+import os
+
+
+class Journal:
+    path: str
+    sync_every: int
+    states: dict
+
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, path, sync_every=32):
+        """
+        Create an append-only execution journal. Each line records the state of
+        a single command keyed by its rendered command line. The last entry for
+        a command wins.
+
+        :param path str: path of the journal file
+        :param sync_every int: number of entries to buffer between fsyncs
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.states = {}
+
+        self._file = None
+        self._pending = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def load(self):
+        """
+        Read the states of all commands recorded in the journal so far
+        """
+        self.states = {}
+
+        if not os.path.isfile(self.path):
+            return
+
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be torn if the writer was killed
+                    continue
+
+                self.states[entry["cmd"]] = entry["state"]
+
+    def open(self):
+        """
+        Load any existing entries and open the journal for appending
+        """
+        if self._file is not None:
+            return
+
+        self.load()
+
+        parent = os.path.dirname(self.path)
+        if parent != "":
+            os.makedirs(parent, exist_ok=True)
+
+        self._file = open(self.path, "a")
+
+    def record(self, cmd: str, state: str, **info):
+        """
+        Append the state of a command to the journal
+
+        :param cmd str: the rendered command line
+        :param state str: state of the command ("done" or "failed")
+        :param info: any extra fields to store with the entry
+        """
+        if self._file is None:
+            self.open()
+
+        entry = {"cmd": cmd, "state": state}
+        entry.update(info)
+
+        self._file.write(json.dumps(entry) + "\n")
+        self.states[cmd] = state
+
+        self._pending += 1
+        if self._pending >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        """
+        Flush all buffered entries to disk
+        """
+        if self._file is None or self._pending == 0:
+            return
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self):
+        if self._file is None:
+            return
+
+        self.sync()
+        self._file.close()
+        self._file = None
+
+    def is_done(self, cmd: str) -> bool:
+        return self.states.get(cmd) == Journal.DONE
+
+    def get_state(self, cmd: str) -> str | None:
+        return self.states.get(cmd)
@@ -1,6 +1,8 @@
 from __future__ import annotations
 import os
 
+from .facets import FacetIndex
+
 
 class Node:
     parent: Node
@@ -8,12 +10,26 @@ class Node:
     name: str
     path: str
     files: list
+    intermediate: bool
+    consumers: set
+    facets: FacetIndex | None
 
-    def __init__(self, name, path, files=None):
+    def __init__(self, name, path, files=None, intermediate=False):
+        """
+        :param name str: name of the node
+        :param path str: path of the node, relative to its parent
+        :param files list: files of the node, relative to its path
+        :param intermediate bool: files of this node are only read by later
+        stages, they are written uncompressed to a RAM disk and deleted once
+        every operator configured on the node has run
+        """
         self.name = name
         self.path = path
         self.children = []
         self.parent = None
+        self.intermediate = intermediate
+        self.consumers = set()
+        self.facets = None
 
         if files is None:
             self.files = []
@@ -21,23 +37,78 @@ class Node:
             self.files = files
 
     def find_node(self, name: str) -> Node | None:
-        if name == self.name:
-            return self
+        # depth first, children in order
+        stack = [self]
 
-        for c in self.children:
-            n = c.find_node(name)
-            if n is not None:
+        while len(stack) > 0:
+            n = stack.pop()
+            if n.name == name:
                 return n
 
+            stack.extend(reversed(n.children))
+
         return None
 
+    def get_tree_path(self):
+        # path of the node as declared, before moving intermediate nodes
+        parts = []
+        n = self
+
+        while n is not None:
+            parts.append(n.path)
+            n = n.parent
+
+        return os.path.join(*reversed(parts))
+
     def get_root_path(self):
+        root_path = self.get_tree_path()
+
+        if self.is_intermediate():
+            # keep the node's layout under the scratch directory
+            return os.path.join(scratch_root(), root_path.lstrip(os.sep))
+
+        return root_path
+
+    def is_intermediate(self) -> bool:
+        n = self
+        while n is not None:
+            if n.intermediate:
+                return True
+            n = n.parent
+
+        return False
 
-        # this is the root node
-        if self.parent is None:
-            return self.path
+    def add_consumer(self, op):
+        """
+        Register an operator reading this node, files of intermediate nodes are
+        kept until every consumer has released them
+        """
+        self.consumers.add(id(op))
 
-        return os.path.join(self.parent.get_root_path(), self.path)
+    def release(self, op):
+        """
+        Release the files of an intermediate node for an operator which has
+        finished reading them. The files are deleted once all consumers have
+        released them.
+        """
+        self.consumers.discard(id(op))
+
+        if len(self.consumers) == 0 and self.is_intermediate():
+            self.clean()
+
+    def clean(self):
+        """
+        Delete the files of this node from disk
+        """
+        import shutil
+
+        shutil.rmtree(self.get_root_path(), ignore_errors=True)
+
+        stack = [self]
+        while len(stack) > 0:
+            n = stack.pop()
+            n.files = []
+            stack.extend(n.children)
 
     def path_split(self, paths, node_names=None):
         # split off filesystem parts using paths into len(paths) nodes
@@ -96,33 +167,115 @@ class Node:
         # get all files
         for root, _, files in os.walk(self.get_root_path()):
             for file in files:
-                if file.endswith(".nc") and file not in self.files:
-                    self.files.append(
-                        os.path.relpath(os.path.join(root, file), self.path)
-                    )
+                if not file.endswith(".nc"):
+                    continue
+
+                rel = os.path.relpath(os.path.join(root, file), self.get_root_path())
+                if rel not in self.files:
+                    self.files.append(rel)
 
         paths = [c.path for c in self.children]
         names = [c.name for c in self.children]
 
         self.path_split(paths, names)
 
+    def index_facets(self, template: str, start="start", end="end"):
+        """
+        Parse the facets of the node's files with a file name template, e.g.
+        "{var}_{freq}_{model}_{scenario}_{member}_{start}-{end}.nc". Index
+        again after the files change.
+
+        :param template str: file name template, facets in braces
+        :param start str: facet holding the first timestamp of a file
+        :param end str: facet holding the last timestamp of a file
+        """
+        self.facets = FacetIndex(template, self.files, start, end)
+
+    def query(self, name="", start=None, end=None, **facets) -> Node | None:
+        """
+        Select files by facet values and time range without scanning the
+        files, see index_facets. The new node shares this node's path and is
+        not added to its children, so find_files and to_dict are unaffected.
+
+        :param name str: name of the new node
+        :param start str: keep files ending at or after this time
+        :param end str: keep files starting at or before this time
+        :param facets: facet values to match, a list matches any of its values
+        :return: a node with the matching files
+        :rtype: Node | None
+        """
+        if self.facets is None:
+            print("Node has no facet index", self.name)
+            return None
+
+        selected = self.facets.select(start, end, **facets)
+
+        if name == "":
+            for v in facets.values():
+                name += "_" + (v if isinstance(v, str) else "+".join(v))
+            name = self.name + name
+
+        n = Node(name, "", [self.files[i] for i in selected])
+        n.parent = self
+        return n
+
     def add_child(self, node):
         node.parent = self
         self.children.append(node)
 
     @classmethod
     def from_dict(cls, d):
-        n = cls(d["name"], d["path"], d["files"])
+        root = cls(d["name"], d["path"], d["files"], d.get("intermediate", False))
+        stack = [(root, d)]
 
-        for c_d in d["children"]:
-            n.add_child(Node.from_dict(c_d))
+        while len(stack) > 0:
+            n, n_d = stack.pop()
 
-        return n
+            for c_d in n_d["children"]:
+                c = cls(
+                    c_d["name"],
+                    c_d["path"],
+                    c_d["files"],
+                    c_d.get("intermediate", False),
+                )
+                n.add_child(c)
+                stack.append((c, c_d))
+
+        return root
 
     def to_dict(self):
-        return {
-            "name": self.name,
-            "path": self.path,
-            "files": self.files,
-            "children": [c.to_dict() for c in self.children],
-        }
+        def make_dict(n):
+            d = {
+                "name": n.name,
+                "path": n.path,
+                "files": n.files,
+                "children": [],
+            }
+
+            if n.intermediate:
+                d["intermediate"] = True
+
+            return d
+
+        root = make_dict(self)
+        stack = [(self, root)]
+
+        while len(stack) > 0:
+            n, n_d = stack.pop()
+
+            for c in n.children:
+                c_d = make_dict(c)
+                n_d["children"].append(c_d)
+                stack.append((c, c_d))
+
+        return root
+
+
+def scratch_root() -> str:
+    """
+    :return: directory intermediate nodes are stored under
+    :rtype: str
+    """
+    from .staging import default_scratch_dir
+
+    return os.path.join(default_scratch_dir(), "cdobatch")
@@ -1,15 +1,87 @@
 from __future__ import annotations
 
-from contextlib import redirect_stdout, redirect_stderr
-
 import copy
 import io
 import os
-import numpy as np
-from typing import Any
+import time
+from typing import TYPE_CHECKING, Any, Callable
 
+from .graph import GraphIndex, graph_changed
+from .log import log
 from .node import Node
-from cdo import *
+from .plan import dedupe_commands, load_plan, node_fingerprint, plan_key, save_plan
+from .sweep import Sweep, VAR_TYPES
+
+# modules only needed to run commands are imported when commands run, so
+# building and inspecting plans stays fast
+if TYPE_CHECKING:
+    import numpy as np
+    from cdo import Cdo
+
+    from .runner import RunOptions
+    from .store import ResultStore
+
+# parts of a command identifying its result in a ResultStore
+STORE_KEYS = ["func_name", "param", "input", "options", "files"]
+
+# options selecting compressed or netCDF4 output, dropped for intermediate
+# outputs
+COMPRESSION_OPTIONS = ["-z", "-f", "--format"]
+
+
+def get_input_name(path: str) -> str:
+    """
+    :return: file name of path without its extension, the input_basename of
+    output names
+    :rtype: str
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def get_link_count(path: str) -> int:
+    """
+    :return: number of hardlinks to a file, 0 if it doesn't exist
+    :rtype: int
+    """
+    try:
+        return os.stat(path).st_nlink
+    except OSError:
+        return 0
+
+
+def writes_prefix(c: dict) -> bool:
+    """
+    :param c dict: cdo command dictionary
+    :return: True if the output of the command is the prefix of the files it
+    writes (e.g. splityear) rather than a file
+    :rtype: bool
+    """
+    return c["func_name"].startswith("split")
+
+
+def intermediate_options(options: str) -> str:
+    """
+    Replace output format and compression options with fast settings for
+    files which are only read by later stages
+
+    :param options str: cdo options of a command
+    :return: the options writing uncompressed netCDF (64-bit offset classic)
+    :rtype: str
+    """
+    kept = []
+    parts = options.split()
+
+    i = 0
+    while i < len(parts):
+        if parts[i] in COMPRESSION_OPTIONS:
+            # skip the option and its value
+            i += 2
+            continue
+
+        kept.append(parts[i])
+        i += 1
+
+    return " ".join(["-f nc2"] + kept)
 
 
 class CdoResult:
@@ -22,7 +94,15 @@ class CdoResult:
 
     op: Any
 
-    def __init__(self, op, result, error, errout, stdout):
+    cmd: dict
+    cmd_str: str
+    vars: dict
+    attempts: int
+    failure: str
+    duration: float
+    predicted: float | None
+
+    def __init__(self, op, result, error, errout, stdout, cmd=None):
         self.op = op
         self.result = result
         self.error = error
@@ -31,8 +111,29 @@ class CdoResult:
         self.errout = errout.getvalue()
         self.stdout = stdout.getvalue()
 
+        if cmd is None:
+            cmd = {}
+
+        self.cmd = cmd
+        self.cmd_str = ""
+        if "func_name" in cmd:
+            self.cmd_str = op.make_cdo_cmd_str(cmd)
+        self.vars = cmd.get("vars", {})
+
+        self.attempts = 1
+        self.failure = ""
+
+        # seconds the command ran and the cost model's estimate, None without
+        # timings to estimate from
+        self.duration = 0.0
+        self.predicted = None
+
         if error is not None:
-            self.errmsg = [l for l in self.stdout.splitlines() if l != ""][-1]
+            lines = [l for l in self.stdout.splitlines() if l != ""]
+            if len(lines) > 0:
+                self.errmsg = lines[-1]
+            else:
+                self.errmsg = str(error)
         else:
             self.errmsg = ""
 
@@ -49,7 +150,14 @@ class Operator:
     op_options: str
     op_input_file: str
 
-    visited: bool
+    op_graph: GraphIndex | None
+    op_in_node: Node | None
+    op_plan_key: str
+    op_store: ResultStore | None
+    op_store_keys: dict
+
+    op_sweep: Sweep
+    op_fork_dim: str
 
     cdo_cmds: list[dict]
 
@@ -79,12 +187,19 @@ class Operator:
         self.op_options = options
         self.op_input_file = ""
 
-        self.visited = False
+        self.op_graph = None
+        self.op_in_node = None
+        self.op_plan_key = ""
+        self.op_store = None
+        self.op_store_keys = {}
 
         self.op_next = []
         self.op_prev = []
         self.cdo_cmds = []
 
+        self.op_sweep = Sweep()
+        self.op_fork_dim = ""
+
         if out_name_vars is None:
             self.op_out_name_vars = {}
         else:
@@ -162,7 +277,7 @@ class Operator:
             vars = kwargs["vars"]
         else:
             if isinstance(kwargs["vars"][0], list):
-                vars = [np.array(kwargs["vars"]).flatten().tolist()]
+                vars = [[v for row in kwargs["vars"] for v in row]]
             else:
                 vars = [kwargs["vars"]]
 
@@ -205,38 +320,65 @@ class Operator:
                 print("Unknown var")
 
     def permute_on(self, op: Operator, **kwargs):
-        # TODO
-        # adds permutations to operator chain
-        # var count should equal number of inputs
-        # each permutation corresponds to 1 cdo command
-        if "ops" in kwargs:
-            # var is operator
-            pass
-        elif "params" in kwargs:
-            # var is param
-            pass
-        elif "inputs" in kwargs:
-            # var is input file name
-            pass
-        else:
+        """
+        Add a cartesian dimension to the sweep of this operator. Each value of
+        the dimension creates 1 cdo command for every combination of the other
+        dimensions. Nothing is expanded until commands are generated.
+
+        Provide only one of ops, params, inputs or out_format.
+
+        :param op Operator: the operator in this operator's graph to modify
+        :param name str: name of the dimension, usable in out_name_format
+        :param ops list: operator names to use
+        :param params list: params to use
+        :param inputs list|Node: input files to use, or a node of input files
+        :param out_format list: output name formats to use
+        """
+        var_type, values = self.get_sweep_var(kwargs)
+        if var_type is None:
             print("Unknown var")
+            return
+
+        self.op_sweep.add(op, var_type, values, name=kwargs.get("name", ""))
 
     def fork_on(self, op: Operator, **kwargs):
-        # TODO
-        # splits inputs and applies different variables to
-        # different paths
-        # each fork is 1 additional CDO command
-        if "ops" in kwargs:
-            # var is operator
-            pass
-        elif "params" in kwargs:
-            # var is param
-            pass
-        elif "inputs" in kwargs:
-            # var is input file name
-            pass
-        else:
+        """
+        Add a dimension zipped with all other fork dimensions of this
+        operator's sweep, the i-th values of each fork dimension are applied
+        together. Each fork is 1 additional cdo command.
+
+        Provide only one of ops, params, inputs or out_format.
+
+        :param op Operator: the operator in this operator's graph to modify
+        :param name str: name of the dimension, usable in out_name_format
+        :param ops list: operator names to use
+        :param params list: params to use
+        :param inputs list|Node: input files to use, or a node of input files
+        :param out_format list: output name formats to use
+        """
+        var_type, values = self.get_sweep_var(kwargs)
+        if var_type is None:
             print("Unknown var")
+            return
+
+        name = kwargs.get("name", "")
+
+        if self.op_fork_dim == "":
+            if name == "":
+                name = "fork"
+            self.op_fork_dim = name
+            self.op_sweep.add(op, var_type, values, name=name)
+        else:
+            self.op_sweep.add(
+                op, var_type, values, name=name, zip_with=self.op_fork_dim
+            )
+
+    def get_sweep_var(self, kwargs: dict) -> tuple[str | None, Any]:
+        for t in VAR_TYPES:
+            if t in kwargs:
+                return t, kwargs[t]
+
+        return None, None
 
     def vector_apply(self, filter_op: str, var_name: str, var: Any, type="all"):
         """
@@ -248,28 +390,22 @@ class Operator:
         """
 
         if type == "all":
-            if self.op_name == filter_op:
-                setattr(self, var_name, var)
-
             # apply single variable to all
-            for o in self.op_next:
-                o.vector_apply(filter_op, var_name, var, type)
+            ops = self.get_graph().ops
         elif type == "horizontal":
-            if self.op_name == filter_op:
-                setattr(self, var_name, var)
-
-            if len(self.op_next) == 0:
-                return
-
-            self.op_next[0].vector_apply(filter_op, var_name, var, type)
-
+            # follow the first fork of each operator
+            ops = [self]
+            while len(ops[-1].op_next) > 0:
+                ops.append(ops[-1].op_next[0])
         elif type == "vertical":
-            for o in self.op_next:
-                if o.op_name == filter_op:
-                    setattr(o, var_name, var)
-
+            ops = self.op_next
         else:
             print("Unknown type", type)
+            return
+
+        for o in ops:
+            if o.op_name == filter_op:
+                setattr(o, var_name, var)
 
     def fork_apply(self, filter_op: str, var_name: str, vars: list[Any], type="all"):
         """
@@ -299,19 +435,22 @@ class Operator:
     def set_prev_op(self, p):
         self.op_prev.append(p)
 
-    def get_leaves(self):
-        def recurse_find(op, ends):
-            if len(op.op_next) == 0:
-                ends.add(op)
-                return ends
+    def get_graph(self) -> GraphIndex:
+        """
+        Get the index of the operator graph starting at this operator. The
+        index is built once and rebuilt after any operator graph changes.
 
-            for o in op.op_next:
-                ends.update(recurse_find(o, ends))
+        :return: the graph index
+        :rtype: GraphIndex
+        """
+        if self.op_graph is None or not self.op_graph.is_current():
+            self.op_graph = GraphIndex(self)
 
-            return ends
+        return self.op_graph
 
-        ends = set()
-        return list(recurse_find(self, ends))
+    def get_leaves(self):
+        g = self.get_graph()
+        return [g.ops[i] for i in g.leaves]
 
     def append(self, op: Operator):
         """
@@ -321,6 +460,7 @@ class Operator:
         """
         op.set_prev_op(self)
         self.op_next.append(op)
+        graph_changed()
 
     def extend_leaves(self, ops: list[Operator]):
         leaves = self.get_leaves()
@@ -344,31 +484,77 @@ class Operator:
             ops[i].append(ops[i + 1])
             ops[i + 1].set_prev_op(ops[i])
 
-    def get_output_name(self, input_path: str) -> str:
+    def get_output_name(
+        self,
+        input_path: str,
+        name_vars: dict | None = None,
+        input_name: str | None = None,
+        output_root: str | None = None,
+    ) -> str:
         """
         Get the output name for the provided input file at input_path.
         Applies any custom variable fields
 
         :param input_path str: path of the file to generate an output for
+        :param name_vars dict: variables to use in addition to the operator's
+        out_name_vars
+        :param input_name str: base name of input_path without extension, if
+        already known
+        :param output_root str: root path of the output node, if already known
         :return: the full path and name of the output file
         :rtype: str
         """
         if self.op_out_node is None:
             return ""
 
+        if name_vars is None:
+            name_vars = {}
+
         # get full output path from the root node
-        output_path = self.op_out_node.get_root_path()
+        if output_root is None:
+            output_root = self.op_out_node.get_root_path()
 
         # file name of input
-        input_name = os.path.splitext(os.path.basename(input_path))[0]
-        return os.path.join(
-            output_path,
-            # apply custom input format
-            # TODO: provide more customizability features
-            self.out_name_format.format(
-                input_basename=input_name, **self.op_out_name_vars
-            ),
-        )
+        if input_name is None:
+            input_name = get_input_name(input_path)
+
+        values = dict(self.op_out_name_vars, **name_vars)
+        values["input_basename"] = input_name
+
+        # apply custom input format
+        # TODO: provide more customizability features
+        return os.path.join(output_root, self.out_name_format.format_map(values))
+
+    def get_output_names(
+        self, input_paths: list[str], name_vars: dict | None = None
+    ) -> list[str]:
+        """
+        Get the output names of many input files at once, the output root and
+        the variables are looked up once
+
+        :param input_paths list[str]: paths of the files to generate outputs for
+        :param name_vars dict: variables to use in addition to the operator's
+        out_name_vars
+        :return: the full path and name of each output file
+        :rtype: list[str]
+        """
+        if self.op_out_node is None:
+            return [""] * len(input_paths)
+
+        output_root = self.op_out_node.get_root_path()
+
+        values = dict(self.op_out_name_vars)
+        if name_vars is not None:
+            values.update(name_vars)
+
+        names = []
+        for f in input_paths:
+            values["input_basename"] = get_input_name(f)
+            names.append(
+                os.path.join(output_root, self.out_name_format.format_map(values))
+            )
+
+        return names
 
     def get_commands(
         self, op_paths: list[list[Operator]], working_path: list[Operator]
@@ -377,46 +563,54 @@ class Operator:
         Use depth first search to create all paths through the operator network
 
         :param op_paths list[Operator]: all paths created so far
-        :param working_path list[Operator]: the current path being explored
+        :param working_path list[Operator]: operators to prepend to each path
         :return: A list of all operator paths
         :rtype: list[Operator]
         """
+        for p in self.get_graph().iter_paths():
+            op_paths.append(working_path + p)
 
-        self.visited = True
-
-        # start with this operator
-        working_path.append(self)
+        return op_paths
 
-        if len(self.op_next) == 0:
-            # base case, no operators are chained to this node
-            op_paths.append(working_path[:])
-        else:
-            # DFS on each fork
-            for n in self.op_next:
-                if not n.visited:
-                    op_paths = n.get_commands(op_paths, working_path[:])
+    def print_graph(self):
+        for o in self.get_graph().ops:
+            print(
+                o,
+                o.op_name,
+                o.op_param,
+                o.op_input_file,
+                o.op_next,
+                o.out_name_format,
+                o.op_out_node,
+            )
+
+    def get_pipe_arg(self) -> str:
+        """
+        :return: the part of a command line this operator adds when it is
+        piped into another operator
+        :rtype: str
+        """
+        if self.op_name == "":
+            return ""
 
-        working_path = working_path[:-1]
-        self.visited = False
+        arg = f"-{self.op_name}"
 
-        return op_paths
+        if self.op_param != "":
+            arg += f",{self.op_param}"
 
-    def print_graph(self):
-        print(
-            self,
-            self.op_name,
-            self.op_param,
-            self.op_input_file,
-            self.op_next,
-            self.out_name_format,
-            self.op_out_node,
-        )
+        if self.op_input_file != "":
+            arg += f" {self.op_input_file}"
 
-        for o in self.op_next:
-            o.print_graph()
+        return arg + " "
 
     def create_command(
-        self, input_path: str, p: list[Operator], use_input_file: bool
+        self,
+        input_path: str,
+        p: list[Operator],
+        use_input_file: bool,
+        name_vars: dict | None = None,
+        input_name: str | None = None,
+        output_root: str | None = None,
     ) -> dict:
         """
         Create a command from an operator chain
@@ -426,6 +620,11 @@ class Operator:
         :param use_input_file bool: the root operator (self) will add an input
         file if True, often False if the root operator is only taking the
         chain's output as input
+        :param name_vars dict: extra output name variables, e.g. the values of
+        a sweep
+        :param input_name str: base name of input_path without extension, if
+        already known
+        :param output_root str: root path of the output node, if already known
 
         :return: a dictionary of all cdo command components
         :rtype: dict
@@ -435,40 +634,213 @@ class Operator:
         cmd["func_name"] = self.op_name
         cmd["param"] = self.op_param
 
-        cmd["output"] = self.get_output_name(input_path)
+        if name_vars is None:
+            name_vars = {}
+
+        if input_name is None:
+            input_name = get_input_name(input_path)
+
+        cmd["output"] = self.get_output_name(
+            input_path, name_vars, input_name, output_root
+        )
         cmd["options"] = self.op_options
+
+        if self.op_out_node is not None and self.op_out_node.is_intermediate():
+            cmd["options"] = intermediate_options(self.op_options)
         cmd["input"] = ""
+        # every file read by the command
+        cmd["files"] = []
+
+        # variables identifying this command, used for reporting
+        cmd["vars"] = {
+            "input_basename": input_name,
+            "op_name": self.op_name,
+            "op_param": self.op_param,
+        }
+        cmd["vars"].update(self.op_out_name_vars)
+        cmd["vars"].update(name_vars)
 
         # skip first item in chain
         for o in p[1:]:
-            if o.op_name == "":
-                continue
-
-            needs_space = True
             # build piped input
-            cmd["input"] += f"-{o.op_name}"
-
-            if o.op_param != "":
-                needs_space = False
-                cmd["input"] += f",{o.op_param} "
+            cmd["input"] += o.get_pipe_arg()
 
-            if o.op_input_file != "":
-                needs_space = False
-                cmd["input"] += f"{o.op_input_file} "
-
-            # fix missing space when no param and no input files are provided
-            if needs_space:
-                cmd["input"] += " "
+            if o.op_name != "" and o.op_input_file != "":
+                cmd["files"].append(o.op_input_file)
 
         if use_input_file:
             cmd["input"] += input_path
+            cmd["files"].append(input_path)
 
         # ensure no whitespace around the command
         cmd["input"] = cmd["input"].strip()
 
         return cmd
 
-    def configure(self, node: Node, route_mode="default", use_input_file=True):
+    def get_root_ops(self) -> list[Operator]:
+        """
+        :return: operators creating commands, the forks of an empty operator
+        or this operator itself
+        :rtype: list[Operator]
+        """
+        if self.op_name == "":
+            for o in self.op_next:
+                o.op_out_node = self.op_out_node
+            return self.op_next[:]
+
+        return [self]
+
+    def iter_commands(self, node: Node, route_mode="default", use_input_file=True):
+        """
+        Generate the cdo commands of configure one at a time, expanding the
+        operator paths and the sweep of this operator lazily
+
+        :param node Node: the node of input files on which to operator on
+        :param route_mode str: the routing mode ("default" or
+        "file_fork_mapped") to use when applying input files to operator paths
+        :param use_input_file bool: the root operator will add an input file if
+        True
+        :return: generator of cdo command dictionaries
+        """
+        if route_mode not in ["default", "file_fork_mapped"]:
+            print("Unknown route mode", route_mode)
+            return
+
+        root_path = node.get_root_path()
+
+        # shared by every path and sweep point of an input file
+        input_paths = [os.path.join(root_path, f) for f in node.files]
+        input_names = [get_input_name(f) for f in node.files]
+
+        for o in self.get_root_ops():
+            g = o.get_graph()
+
+            output_root = None
+            if o.op_out_node is not None:
+                output_root = o.op_out_node.get_root_path()
+
+            op_path = None
+            if route_mode == "file_fork_mapped":
+                op_path = list(g.iter_paths())
+
+            for i in range(len(node.files)):
+                input_path = input_paths[i]
+
+                if route_mode == "default":
+                    # create a command for each path for each input file
+                    paths = g.iter_paths()
+                else:
+                    # map each input file to a different path
+                    paths = [op_path[i]]
+
+                for p in paths:
+                    for point in self.op_sweep.points():
+                        # translate op path, node, input file into cdo arguments
+                        with self.op_sweep.applied(point) as named:
+                            yield o.create_command(
+                                input_path,
+                                p,
+                                use_input_file,
+                                named,
+                                input_names[i],
+                                output_root,
+                            )
+
+    def plan_size(
+        self, node: Node, route_mode="default", use_input_file=True
+    ) -> tuple[int, int]:
+        """
+        Compute the number of commands configure creates and the total length
+        of their command lines without enumerating the operator paths. Paths
+        are counted by dynamic programming over the operator graph, so graphs
+        with many diamonds are cheap to size.
+
+        :param node Node: the node of input files on which to operator on
+        :param route_mode str: the routing mode ("default" or "file_fork_mapped")
+        :param use_input_file bool: the root operator will add an input file if
+        True
+        :return: number of commands and estimated number of characters in all
+        command lines
+        :rtype: tuple[int, int]
+        """
+        root_path = node.get_root_path()
+        input_paths = [os.path.join(root_path, f) for f in node.files]
+
+        count = 0
+        chars = 0
+
+        # command line lengths are estimated from the first point of the sweep
+        with self.op_sweep.applied(next(self.op_sweep.points())) as named:
+            for o in self.get_root_ops():
+                o_count, o_chars = o.get_paths_size(
+                    input_paths, route_mode, use_input_file, named
+                )
+                count += o_count
+                chars += o_chars
+
+        n_points = len(self.op_sweep)
+        return count * n_points, chars * n_points
+
+    def get_paths_size(
+        self,
+        input_paths: list[str],
+        route_mode: str,
+        use_input_file: bool,
+        name_vars: dict,
+    ) -> tuple[int, int]:
+        """
+        Compute the number of commands and command line characters of the
+        operator paths starting at this operator, see plan_size
+        """
+        n_files = len(input_paths)
+
+        g = self.get_graph()
+        n_paths = g.count_paths()[0]
+
+        # piped chain of every path, this operator is the cdo function
+        chain = g.sum_over_paths(lambda x: len(x.get_pipe_arg()))[0]
+        chain -= len(self.get_pipe_arg()) * n_paths
+
+        head = self.create_command("", [self], False, name_vars)
+        head["output"] = ""
+        head_len = len(self.make_cdo_cmd_str(head)) + 1
+
+        tail = sum(len(o) + 1 for o in self.get_output_names(input_paths, name_vars))
+        if use_input_file:
+            tail += sum(len(f) for f in input_paths)
+
+        if route_mode == "file_fork_mapped":
+            chars = n_files * head_len + tail
+            if n_paths > 0:
+                chars += n_files * chain // n_paths
+            return n_files, chars
+
+        chars = n_files * (n_paths * head_len + chain) + n_paths * tail
+        return n_files * n_paths, chars
+
+    def count_commands(self, node: Node, route_mode="default") -> int:
+        """
+        Count the commands configure creates without generating them
+
+        :param node Node: the node of input files on which to operator on
+        :param route_mode str: the routing mode ("default" or "file_fork_mapped")
+        :return: number of cdo commands
+        :rtype: int
+        """
+        return self.plan_size(node, route_mode)[0]
+
+    def configure(
+        self,
+        node: Node,
+        route_mode="default",
+        use_input_file=True,
+        max_commands=None,
+        plan: str | None = None,
+        time_chunks=0,
+        years: tuple[int, int] | None = None,
+        store: ResultStore | str | None = None,
+        chunk_dir: str | None = None,
+    ):
         """
         Find all operator paths in the operator graph starting from this
         operator. Creates a set of cdo commands to run.
@@ -479,40 +851,340 @@ class Operator:
         :param use_input_file bool: the root operator will add an input file if
         True, often False if the root operator is only taking the chain's output
         as input
+        :param max_commands int: refuse to build plans with more commands than
+        this, use iter_commands to stream larger plans
+        :param plan str: plan file to load the commands from, the commands are
+        created and saved to it if the file is missing or stale (the graph or
+        the files of node changed)
+        :param time_chunks int: split commands on a single long file into
+        chunks of this many years run in parallel, see split_time. 0 disables
+        splitting.
+        :param years tuple[int, int]: first and last year of the input files,
+        read from the start and end facets of node if None (see
+        Node.index_facets)
+        :param store ResultStore|str: result store (or path of one) to link
+        outputs from instead of running their commands, see use_store
+        :param chunk_dir str: directory time chunks are written to, see
+        split_time
+        :raises ValueError: if the plan has more than max_commands commands
+
+        Operators configured on an intermediate node are its consumers, the
+        node's files are deleted once all of them have run without errors. All
+        consumers must be configured before the first one runs.
         """
+        self.op_in_node = node
+        if node.is_intermediate():
+            node.add_consumer(self)
+
+        if plan is not None:
+            self.op_plan_key = plan_key(
+                self, node, route_mode, use_input_file, time_chunks, years, chunk_dir
+            )
+
+            saved = load_plan(plan)
+            if saved is not None and saved["key"] == self.op_plan_key:
+                self.cdo_cmds = saved["cmds"]
+                self.use_store(store)
+                return
+
+            if saved is not None:
+                log(f"plan {plan} is stale, creating commands")
+
+        if max_commands is not None:
+            count, _ = self.plan_size(node, route_mode, use_input_file)
+            if count > max_commands:
+                raise ValueError(
+                    f"plan has {count} commands, more than max_commands "
+                    f"({max_commands}), use iter_commands to stream it"
+                )
+
         # depth first search to build all cdo commands
+        self.cdo_cmds = list(self.iter_commands(node, route_mode, use_input_file))
 
-        root_ops = []
+        if time_chunks > 0:
+            self.split_time(time_chunks, years, chunk_dir)
 
-        self.cdo_cmds = []
+        if plan is not None:
+            self.save_plan(plan)
 
-        if self.op_name == "":
-            for o in self.op_next:
-                o.op_out_node = self.op_out_node
-                root_ops.append(o)
-        else:
-            root_ops.append(self)
+        self.use_store(store)
 
-        for o in root_ops:
-            for i in range(len(node.files)):
-                input_file = node.files[i]
-                input_path = os.path.join(node.get_root_path(), input_file)
-                op_path = []
-                working_set = []
+    def use_store(self, store: ResultStore | str | None) -> int:
+        """
+        Link the outputs of commands which already ran on the same inputs from
+        a result store and drop these commands. Outputs of the remaining
+        commands are added to the store when they run successfully.
+
+        :param store ResultStore|str: result store (or path of one), None
+        disables it
+        :return: number of outputs linked from the store
+        :rtype: int
+        """
+        self.op_store = None
+        self.op_store_keys = {}
 
-                # find all paths through operator graph
-                op_path = o.get_commands(op_path, working_set)
+        if store is None:
+            return 0
 
-                if route_mode == "default":
-                    # translate op path, node, input file into cdo arguments
-                    for p in op_path:
-                        # create a command for each path for each input file
-                        cmd = o.create_command(input_path, p, use_input_file)
-                        self.cdo_cmds.append(cmd)
-                elif route_mode == "file_fork_mapped":
-                    # map each input file to a different path
-                    cmd = o.create_command(input_path, op_path[i], use_input_file)
-                    self.cdo_cmds.append(cmd)
+        if isinstance(store, str):
+            from .store import ResultStore
+
+            store = ResultStore(store)
+
+        self.op_store = store
+        linked = set()
+
+        for c in self.cdo_cmds:
+            # time chunks are stored as the command they were split from
+            if c["output"] == "" or "chunk_of" in c:
+                continue
+
+            key = store.get_key(c.get("store_cmd", c))
+            if key is None:
+                continue
+
+            if store.fetch(key, c["output"]):
+                linked.add(c["output"])
+            else:
+                self.op_store_keys[c["output"]] = key
+
+        if len(linked) > 0:
+            self.cdo_cmds = [
+                c
+                for c in self.cdo_cmds
+                if c["output"] not in linked and c.get("chunk_of") not in linked
+            ]
+            log(f"{len(linked)} outputs linked from {store.store_dir}")
+
+        return len(linked)
+
+    def get_year_spans(self, years: tuple[int, int] | None = None) -> dict:
+        """
+        :param years tuple[int, int]: first and last year of all input files,
+        read from the start and end facets of the input node (or of the node it
+        was selected from with Node.query) if None
+        :return: first and last year of each input file path
+        :rtype: dict
+        """
+        node = self.op_in_node
+        if node is None:
+            return {}
+
+        root_path = node.get_root_path()
+        paths = [os.path.join(root_path, f) for f in node.files]
+
+        if years is not None:
+            return {p: years for p in paths}
+
+        # nodes selected with Node.query share the index of the node they
+        # were selected from
+        indexed = node
+        while (
+            indexed.facets is None and indexed.path == "" and indexed.parent is not None
+        ):
+            indexed = indexed.parent
+
+        if indexed.facets is None or len(indexed.facets.starts) == 0:
+            return {}
+
+        start, end = indexed.facets.time_facets
+        starts = indexed.facets.columns[start]
+        ends = indexed.facets.columns[end]
+        positions = {f: i for i, f in enumerate(indexed.files)}
+
+        spans = {}
+        for p, f in zip(paths, node.files):
+            i = positions.get(f)
+            if i is None:
+                continue
+
+            s, e = starts[i], ends[i]
+            if s is not None and s[:4].isdigit() and e[:4].isdigit():
+                spans[p] = (int(s[:4]), int(e[:4]))
+
+        return spans
+
+    def split_time(
+        self,
+        chunk_years: int,
+        years: tuple[int, int] | None = None,
+        chunk_dir: str | None = None,
+    ):
+        """
+        Split configured commands reading one long file into commands
+        selecting chunk_years years each, which run in parallel, and a
+        mergetime command joining their outputs. Only chains of operators in
+        chunks.TIME_LOCAL_OPERATORS are split. Chunks are written uncompressed
+        to chunk_dir and deleted once merged.
+
+        :param chunk_years int: years per chunk
+        :param years tuple[int, int]: first and last year of the input files,
+        see get_year_spans
+        :param chunk_dir str: directory for the chunks, defaults to
+        chunks.default_chunk_dir on disk as chunks of long files may not fit
+        in RAM
+        :return: number of commands split
+        :rtype: int
+        """
+        from .chunks import (
+            default_chunk_dir,
+            get_chunk_path,
+            is_splittable,
+            year_chunks,
+        )
+
+        if chunk_dir is None:
+            chunk_dir = default_chunk_dir()
+
+        spans = self.get_year_spans(years)
+        if len(spans) == 0 and len(self.cdo_cmds) > 0:
+            log(
+                f"no years known for the files of {self.op_in_node.name}, "
+                "time_chunks needs years or start and end facets"
+            )
+
+        cmds = []
+        split = 0
+
+        for c in self.cdo_cmds:
+            f = c["files"][0] if len(c.get("files", [])) > 0 else ""
+            chunks = []
+            if f in spans and is_splittable(c):
+                chunks = year_chunks(*spans[f], chunk_years)
+
+            if len(chunks) < 2:
+                cmds.append(c)
+                continue
+
+            parts = []
+            for first, last in chunks:
+                part = dict(c)
+                part["input"] = c["input"][: -len(f)] + f"-selyear,{first}/{last} " + f
+                part["output"] = get_chunk_path(chunk_dir, c["output"], first, last)
+                part["options"] = intermediate_options(c["options"])
+                part["files"] = [f]
+                part["vars"] = dict(c["vars"], chunk=f"{first}-{last}")
+                part["chunk_of"] = c["output"]
+
+                cmds.append(part)
+                parts.append(part["output"])
+
+            cmds.append(
+                {
+                    "func_name": "mergetime",
+                    "param": "",
+                    "input": " ".join(parts),
+                    "output": c["output"],
+                    "options": c["options"],
+                    "files": parts,
+                    "vars": dict(c["vars"]),
+                    # deleted once merged
+                    "chunks": parts,
+                    "store_cmd": {k: c[k] for k in STORE_KEYS},
+                }
+            )
+            split += 1
+
+        self.cdo_cmds = cmds
+        return split
+
+    def save_plan(self, path: str):
+        """
+        Save the configured commands with the input and output nodes they were
+        created for, see configure and from_plan
+
+        :param path str: path of the plan file
+        """
+
+        def binding(n):
+            if n is None:
+                return None
+
+            return {
+                "name": n.name,
+                "path": n.get_tree_path(),
+                "files": n.files,
+                "intermediate": n.is_intermediate(),
+                "fingerprint": node_fingerprint(n),
+            }
+
+        save_plan(
+            path,
+            {
+                "key": self.op_plan_key,
+                "op": {
+                    "name": self.op_name,
+                    "param": self.op_param,
+                    "options": self.op_options,
+                },
+                "in_node": binding(self.op_in_node),
+                "out_node": binding(self.op_out_node),
+                "cmds": self.cdo_cmds,
+            },
+        )
+
+    @classmethod
+    def from_plan(cls, path: str, node: Node | None = None) -> Operator:
+        """
+        Load a saved plan without building the operator graph, e.g. in a
+        worker or to resume a run
+
+        :param path str: path of the plan file
+        :param node Node: input node to check the plan against, rebuilt from
+        the plan if None
+        :return: an operator with the planned commands, ready to run
+        :rtype: Operator
+        :raises ValueError: if there is no plan or node's files changed since
+        the plan was saved
+        """
+        saved = load_plan(path)
+        if saved is None:
+            raise ValueError(f"no plan in {path}")
+
+        def rebuild(b):
+            if b is None:
+                return None
+            return Node(b["name"], b["path"], b["files"], b["intermediate"])
+
+        if node is None:
+            node = rebuild(saved["in_node"])
+        elif node_fingerprint(node) != saved["in_node"]["fingerprint"]:
+            raise ValueError(f"plan {path} is stale, the files of {node.name} changed")
+
+        op = cls(
+            saved["op"]["name"],
+            saved["op"]["param"],
+            out_node=rebuild(saved["out_node"]),
+            options=saved["op"]["options"],
+        )
+        op.cdo_cmds = saved["cmds"]
+        op.op_plan_key = saved["key"]
+
+        op.op_in_node = node
+        if node is not None and node.is_intermediate():
+            node.add_consumer(op)
+
+        return op
+
+    def bind_outputs(self):
+        """
+        Add the planned outputs of the configured commands to the files of the
+        output node, so later stages can be configured on the node before
+        this operator has run (e.g. to export all stages, see export)
+        """
+        node = self.op_out_node
+        if node is None:
+            return
+
+        root_path = node.get_root_path()
+
+        for c in self.cdo_cmds:
+            if c["output"] == "":
+                continue
+
+            rel = os.path.relpath(c["output"], root_path)
+            if rel not in node.files:
+                node.files.append(rel)
 
     def make_cdo_cmd_str(self, c: dict) -> str:
         """
@@ -537,6 +1209,28 @@ class Operator:
 
         return cmd_str
 
+    def dedupe(self) -> dict:
+        """
+        Remove identical commands (same operator chain, inputs, options and
+        output) from the configured commands and warn about different commands
+        writing to the same output file
+
+        :return: report of the duplicates removed and conflicting outputs
+        :rtype: dict
+        """
+        self.cdo_cmds, report = dedupe_commands(self.cdo_cmds)
+
+        if report["duplicates"] > 0:
+            log(
+                f"removed {report['duplicates']} duplicate commands, "
+                f"{report['unique']} of {report['commands']} left"
+            )
+
+        for output, writers in report["conflicts"].items():
+            log(f"{len(writers)} different commands write {output}")
+
+        return report
+
     def run_dry(self) -> list[str]:
         """
         Perform a dry run of all operations. Creates command lines.
@@ -552,66 +1246,272 @@ class Operator:
 
         return results
 
-    def preprocess(self):
+    def preprocess(self, threads=8) -> int:
         """
-        Creates all output directories necessary
+        Creates all output directories necessary, each directory once. Warns
+        about output files written by more than one command.
+
+        :param threads int: number of threads creating directories
+        :return: number of directories created or found
+        :rtype: int
         """
-        for c in self.cdo_cmds:
-            if c["output"] != "":
-                os.makedirs(os.path.dirname(c["output"]), exist_ok=True)
+        outputs = [c["output"] for c in self.cdo_cmds if c["output"] != ""]
+
+        unique = set(outputs)
+        if len(unique) < len(outputs):
+            log(
+                f"{len(outputs) - len(unique)} commands write an output of "
+                "another command, see dedupe"
+            )
+
+        dirs = sorted({os.path.dirname(o) for o in unique})
+
+        # parents are created with their deepest subdirectory
+        leaves = [
+            d
+            for i, d in enumerate(dirs)
+            if d != ""
+            and not (i + 1 < len(dirs) and dirs[i + 1].startswith(d + os.sep))
+        ]
+
+        def makedirs(d):
+            os.makedirs(d, exist_ok=True)
+
+        if len(leaves) <= threads:
+            for d in leaves:
+                makedirs(d)
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(makedirs, leaves))
 
-    def run_real(self, cdo: Cdo) -> list[CdoResult]:
+        return len(leaves)
+
+    def run_command(
+        self, cdo: Cdo, c: dict, inputs: dict | None = None, output: str | None = None
+    ) -> CdoResult:
         """
-        Apply cdo to input files and write output
+        Run a single cdo command
 
         :param cdo Cdo: cdo instance to use
-        :return: list of results from each run of cdo
-        :rtype: list[CdoResult]
+        :param c dict: cdo command dictionary
+        :param inputs dict: input files to read from a different path instead,
+        e.g. a staged copy
+        :param output str: path to write the output to instead of the
+        command's output, e.g. in scratch space
+        :return: result of the cdo call
+        :rtype: CdoResult
         """
-        results = []
-        for c in self.cdo_cmds:
-            # get function corresponding to the operator
-            cdo_func = getattr(cdo, c["func_name"])
+        from cdo import CDOException
+
+        from .executor import captured_output
+
+        # get function corresponding to the operator
+        cdo_func = getattr(cdo, c["func_name"])
 
+        start = time.monotonic()
+
+        # catch all CDO related exceptions
+        try:
             # capture stdout and stderr
-            err = io.StringIO()
-            out = io.StringIO()
+            with captured_output() as (err, out):
+                args = []
+                kwargs = {}
+
+                if c["param"] != "":
+                    args.append(c["param"])
+
+                if c["input"] != "":
+                    kwargs["input"] = c["input"]
+
+                    if inputs:
+                        kwargs["input"] = " ".join(
+                            inputs.get(t, t) for t in c["input"].split(" ")
+                        )
+
+                if c["output"] != "":
+                    kwargs["output"] = c["output"]
+
+                    if output is not None:
+                        kwargs["output"] = output
 
-            # catch all CDO related exceptions
-            try:
-                # capture stdout and stderr
-                with redirect_stderr(err), redirect_stdout(out):
-                    args = []
-                    kwargs = {}
+                if c["options"] != "":
+                    kwargs["options"] = c["options"]
 
-                    if c["param"] != "":
-                        args.append(c["param"])
+                r = cdo_func(*args, **kwargs)
 
-                    if c["input"] != "":
-                        kwargs["input"] = c["input"]
+        except CDOException as e:
+            result = CdoResult(self, None, e, err, out, c)
+        else:
+            result = CdoResult(self, r, None, err, out, c)
+
+        result.duration = time.monotonic() - start
+        return result
+
+    def run_batch(
+        self,
+        cdo: Cdo,
+        cmds: list[dict],
+        inputs: dict | None = None,
+        outputs: list[str | None] | None = None,
+    ) -> list[CdoResult]:
+        """
+        Run commands one after another in a single shell process instead of
+        one python-cdo call each, for commands so small that starting them
+        costs more than running them. Output and status of each command are
+        split back into separate results.
+
+        :param cdo Cdo: cdo instance to use, for its binary and silent mode
+        :param cmds list[dict]: cdo command dictionaries
+        :param inputs dict: input files to read from a different path instead
+        :param outputs list[str|None]: path each command writes to instead of
+        its output
+        :return: results of each command
+        :rtype: list[CdoResult]
+        """
+        import subprocess
+
+        from cdo import CDOException
+
+        from .batch import BatchScript, command_argv
 
-                    if c["output"] != "":
-                        kwargs["output"] = c["output"]
+        if outputs is None:
+            outputs = [None] * len(cmds)
 
-                    if c["options"] != "":
-                        kwargs["options"] = c["options"]
+        cdo_bin = getattr(cdo, "CDO", "cdo")
+        silent = getattr(cdo, "silent", False)
 
-                    r = cdo_func(*args, **kwargs)
+        script = BatchScript(
+            [command_argv(cdo_bin, c, inputs, o, silent) for c, o in zip(cmds, outputs)]
+        )
+
+        start = time.monotonic()
+        p = subprocess.run(
+            ["sh"], input=script.script, stdout=subprocess.PIPE, text=True
+        )
+        # only the time of the whole batch is known
+        duration = (time.monotonic() - start) / max(1, len(cmds))
 
-            except CDOException as e:
-                results.append(CdoResult(self, None, e, err, out))
+        results = []
+        for c, o, (text, status) in zip(cmds, outputs, script.split(p.stdout)):
+            if status is None:
+                # the batch was killed before the command finished
+                status = p.returncode if p.returncode < 0 else -1
+
+            result = None
+            error = None
+            if status != 0:
+                error = CDOException(text, text, status)
+            elif c["output"] != "":
+                result = c["output"] if o is None else o
             else:
-                results.append(CdoResult(self, r, None, err, out))
+                result = text.strip().split(os.linesep)
 
-            # update the output node with any new output files
-            if self.op_out_node is not None:
-                self.op_out_node.find_files()
+            r = CdoResult(self, result, error, io.StringIO(), io.StringIO(text), c)
+            r.duration = duration
+            results.append(r)
 
         return results
 
+    def run_fused(
+        self,
+        cdo: Cdo,
+        cmds: list[dict],
+        scratch_dir: str,
+        run_one: Callable[[dict, dict | None], CdoResult] | None = None,
+    ) -> list:
+        """
+        Run commands reading the same input file on a decoded copy of the
+        input. The input is copied once as uncompressed netCDF to scratch_dir
+        (ideally a RAM disk) so each command skips reading and decompressing
+        the original.
+
+        :param cdo Cdo: cdo instance to use
+        :param cmds list[dict]: cdo command dictionaries sharing an input file
+        :param scratch_dir str: directory for the decoded copy
+        :param run_one Callable: runs a command given a map of input files to
+        replace, defaults to run_command
+        :return: results of each command
+        :rtype: list[CdoResult]
+        """
+        from .schedule import primary_input
+
+        if run_one is None:
+
+            def run_one(c, inputs):
+                return self.run_command(cdo, c, inputs)
+
+        input_path = primary_input(cmds[0])
+        if len(cmds) == 1 or input_path == "":
+            return [run_one(c, None) for c in cmds]
+
+        staged = self.decode_input(cdo, input_path, scratch_dir)
+        if staged is None:
+            # read the original input instead
+            return [run_one(c, None) for c in cmds]
+
+        try:
+            return [run_one(c, {input_path: staged}) for c in cmds]
+        finally:
+            os.remove(staged)
+
+    def decode_input(self, cdo: Cdo, input_path: str, scratch_dir: str) -> str | None:
+        """
+        Copy an input file as uncompressed netCDF (64-bit offset, see
+        intermediate_options), see run_fused
+
+        :param cdo Cdo: cdo instance to use
+        :param input_path str: input file
+        :param scratch_dir str: directory for the decoded copy
+        :return: path of the decoded copy, None if it couldn't be made
+        :rtype: str | None
+        """
+        import tempfile
+
+        fd, staged = tempfile.mkstemp(suffix=".nc", dir=scratch_dir)
+        os.close(fd)
+
+        copy = self.run_command(
+            cdo,
+            {
+                "func_name": "copy",
+                "param": "",
+                "input": input_path,
+                "output": staged,
+                "options": intermediate_options(""),
+            },
+        )
+
+        if copy.error is not None:
+            os.remove(staged)
+            return None
+
+        return staged
+
+    def run_real(
+        self, cdo: Cdo, options: RunOptions | None = None, **kwargs
+    ) -> list[CdoResult]:
+        """
+        Apply cdo to input files and write output
+
+        :param cdo Cdo: cdo instance to use
+        :param options RunOptions: execution options, see runner.RunOptions
+        :param kwargs: execution options used when options is None
+        :return: list of results from each run of cdo, commands skipped when
+        resuming or removed as duplicates have no result
+        :rtype: list[CdoResult]
+        """
+        from .runner import Run, RunOptions
+
+        if options is None:
+            options = RunOptions(**kwargs)
+
+        return Run(self, cdo, options).run()
+
     def run(
-        self, cdo: Cdo, create_outputs_only=False, dry_run=False
-    ) -> (list[CdoResult] | list[str] | None):
+        self, cdo: Cdo, create_outputs_only=False, dry_run=False, **kwargs
+    ) -> list[CdoResult] | list[str] | None:
         """
         Run cdo, either dry run or actually operate. Can also only create output
         directories first.
@@ -621,6 +1521,8 @@ class Operator:
         run
         :param dry_run bool: perform dry run if True, doesn't write or create
         any output artifacts
+        :param kwargs: execution options passed to run_real, see
+        runner.RunOptions
         """
         if dry_run:
             return self.run_dry()
@@ -630,4 +1532,54 @@ class Operator:
             # don't do anything else
             return
 
-        return self.run_real(cdo)
+        return self.run_real(cdo, **kwargs)
+
+    def run_table(
+        self,
+        cdo: Cdo,
+        tab: str | None = None,
+        columns: list[str] | None = None,
+        keys: list[str] | None = None,
+        path: str | None = None,
+        **kwargs,
+    ) -> np.ndarray:
+        """
+        Run commands printing small results (e.g. showyear, ntime, or fldmean
+        with tab) and collect them into one table instead of output files,
+        see table.results_table
+
+        :param cdo Cdo: cdo instance to use
+        :param tab str: outputtab keys (e.g. "date,value"), commands writing
+        output files print their results with outputtab instead. None runs the
+        commands as configured.
+        :param columns list[str]: names of the values in a row, defaults to the
+        keys of tab or a single "value" column
+        :param keys list[str]: operator variables to key rows by, defaults to all
+        :param path str: also write the table to this CSV or Parquet (.parquet,
+        needs pyarrow) file
+        :param kwargs: execution options passed to run_real
+        :return: structured array with a row per printed value or line
+        :rtype: np.ndarray
+        """
+        from .table import results_table, to_table_command, write_table
+
+        cmds = self.cdo_cmds
+        if tab is not None:
+            # commands without an output file already print their results
+            self.cdo_cmds = [
+                to_table_command(c, tab) if c["output"] != "" else c for c in cmds
+            ]
+            if columns is None:
+                columns = tab.split(",")
+
+        try:
+            results = self.run_real(cdo, **kwargs)
+        finally:
+            self.cdo_cmds = cmds
+
+        table = results_table(results, columns, keys)
+
+        if path is not None:
+            write_table(table, path)
+
+        return table
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+
+PLAN_VERSION = 1
+
+
+def command_key(c: dict) -> str:
+    """
+    Hash the parts of a command which determine what it computes
+
+    :param c dict: cdo command dictionary
+    :return: hash of the operator chain, inputs and options
+    :rtype: str
+    """
+    parts = [c["func_name"], c["param"], c["input"], c["options"]]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def dedupe_commands(cmds: list[dict]) -> tuple[list[dict], dict]:
+    """
+    Collapse identical commands and find commands writing different results
+    to the same output file. The first of each set of identical commands is
+    kept, in order.
+
+    :param cmds list[dict]: cdo command dictionaries
+    :return: the unique commands and a report with the number of commands,
+    unique commands, duplicates removed and the commands of each conflicting
+    output
+    :rtype: tuple[list[dict], dict]
+    """
+    seen = set()
+    writers = {}
+    unique = []
+
+    for c in cmds:
+        key = command_key(c)
+
+        if (key, c["output"]) in seen:
+            continue
+
+        seen.add((key, c["output"]))
+        unique.append(c)
+
+        if c["output"] != "":
+            writers.setdefault(c["output"], []).append(c)
+
+    conflicts = {o: w for o, w in writers.items() if len(w) > 1}
+
+    report = {
+        "commands": len(cmds),
+        "unique": len(unique),
+        "duplicates": len(cmds) - len(unique),
+        "conflicts": conflicts,
+    }
+
+    return unique, report
+
+
+def node_fingerprint(node) -> str:
+    """
+    Hash the files of a node which commands are created for, plans built for
+    a node are stale once its files change
+
+    :param node Node: input node of a plan
+    :return: hash of the node's path and its list of files
+    :rtype: str
+    """
+    parts = [node.get_tree_path(), node.is_intermediate(), node.files]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def graph_fingerprint(op) -> str:
+    """
+    Hash everything in an operator graph and its sweep which changes the
+    commands it creates, without creating them
+
+    :param op Operator: root of the graph
+    :return: hash of the operators, edges and sweep dimensions
+    :rtype: str
+    """
+    g = op.get_graph()
+    h = hashlib.sha1()
+
+    for o, n in zip(g.ops, g.next):
+        out_path = None
+        if o.op_out_node is not None:
+            out_path = [o.op_out_node.get_tree_path(), o.op_out_node.is_intermediate()]
+
+        parts = [
+            o.op_name,
+            o.op_param,
+            o.op_input_file,
+            o.op_options,
+            o.out_name_format,
+            o.op_out_name_vars,
+            out_path,
+            n,
+        ]
+        h.update(json.dumps(parts, default=str).encode())
+
+    for group in op.op_sweep.groups:
+        for d in group:
+            h.update(
+                json.dumps(
+                    [d.name, d.attr, g.index.get(id(d.op)), d.values], default=str
+                ).encode()
+            )
+
+    return h.hexdigest()
+
+
+def save_plan(path: str, plan: dict):
+    """
+    Write a plan as gzipped JSON, through a temporary file so readers never
+    see a partial plan
+
+    :param path str: path of the plan file
+    :param plan dict: plan to write, see Operator.save_plan
+    """
+    plan = dict(plan, version=PLAN_VERSION)
+
+    tmp = f"{path}.{os.getpid()}.partial"
+    with gzip.open(tmp, "wt", compresslevel=1) as f:
+        json.dump(plan, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load_plan(path: str) -> dict | None:
+    """
+    :param path str: path of the plan file
+    :return: the plan, None if there is no readable plan of this version
+    :rtype: dict | None
+    """
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with gzip.open(path, "rt") as f:
+            plan = json.load(f)
+    except (OSError, EOFError, json.JSONDecodeError):
+        return None
+
+    if plan.get("version") != PLAN_VERSION:
+        return None
+
+    return plan
+
+
+def plan_key(op, node, route_mode: str, use_input_file: bool, *options) -> str:
+    """
+    :param options: any other configure options changing the commands
+    :return: hash of everything which determines the commands configure
+    creates for an operator and input node
+    :rtype: str
+    """
+    parts = [graph_fingerprint(op), node_fingerprint(node), route_mode, use_input_file]
+    parts.extend(options)
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+from collections import deque
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any
+
+# durations kept per operator for percentiles
+MAX_DURATIONS = 10000
+
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    :param values list[float]: sorted values
+    :param p float: percentile, 0 to 100
+    :return: the value below which p percent of the values are
+    :rtype: float
+    """
+    if len(values) == 0:
+        return 0.0
+
+    i = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[i]
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+
+    if h > 0:
+        return f"{h}h{m:02d}m"
+    return f"{m}m{s:02d}s"
+
+
+class Progress:
+    """
+    Reports the progress of a run: commands done, running and failed
+    (including those skipped as their dependencies failed), commands and
+    bytes per second and the time left. The executor only updates counters
+    and queues finished results, sizes and latency percentiles are worked out
+    by a reporter thread every interval seconds.
+    """
+
+    total: int
+    started: int
+    retried: int
+    done: int
+    failed: int
+    skipped: int
+
+    def __init__(self, path: str | None = None, interval=5.0, stream=None, window=60.0):
+        """
+        :param path str: JSON file updated with the latest report, including
+        the latency percentiles of each operator
+        :param interval float: seconds between reports
+        :param stream: stream for one line reports, defaults to stderr. False
+        disables them.
+        :param window float: seconds the rates are averaged over
+        """
+        self.path = path
+        self.interval = interval
+        self.stream = sys.stderr if stream is None else stream
+        self.window = window
+
+        self.total = 0
+        self.started = 0
+        self.retried = 0
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+
+        # written by the executor, drained by the reporter
+        self.finished = deque()
+
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.durations = {}
+        self.sizes = {}
+        self.samples = deque()
+
+        self.start_time = 0.0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self, total: int):
+        """
+        :param total int: number of commands in the run
+        """
+        self.total = total
+        self.start_time = time.monotonic()
+        self.samples.append((self.start_time, 0, 0, 0))
+
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.report_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop reporting and write a final report
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def on_start(self, i: int):
+        self.started += 1
+
+    def on_retry(self, i: int, r: Any):
+        self.retried += 1
+        self.finished.append(r)
+
+    def on_result(self, i: int, r: Any):
+        if r.error is None:
+            self.done += 1
+        else:
+            self.failed += 1
+
+        # commands failed as their dependencies failed were never started
+        if getattr(r, "attempts", 1) == 0:
+            self.skipped += 1
+            return
+        self.finished.append(r)
+
+    def get_size(self, path: str, cache=True) -> int:
+        if cache and path in self.sizes:
+            return self.sizes[path]
+
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+
+        if cache:
+            self.sizes[path] = size
+        return size
+
+    def drain(self):
+        # account for results finished since the last report
+        while len(self.finished) > 0:
+            r = self.finished.popleft()
+            c = r.cmd
+
+            self.bytes_read += sum(self.get_size(f) for f in c.get("files", []))
+            if c.get("output", "") != "":
+                self.bytes_written += self.get_size(c["output"], cache=False)
+
+            d = self.durations.setdefault(
+                c.get("func_name", ""), deque(maxlen=MAX_DURATIONS)
+            )
+            d.append(getattr(r, "duration", 0.0))
+
+    def snapshot(self) -> dict:
+        """
+        :return: the current state of the run
+        :rtype: dict
+        """
+        self.drain()
+
+        now = time.monotonic()
+        completed = self.done + self.failed
+
+        self.samples.append((now, completed, self.bytes_read, self.bytes_written))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+
+        t0, c0, r0, w0 = self.samples[0]
+        dt = max(now - t0, 1e-9)
+        rate = (completed - c0) / dt
+
+        eta = None
+        remaining = self.total - completed
+        if rate > 0:
+            eta = remaining / rate
+        elif remaining == 0:
+            eta = 0.0
+
+        operators = {}
+        for op, durations in self.durations.items():
+            values = sorted(durations)
+            operators[op] = {"count": len(values)}
+            for p in PERCENTILES:
+                operators[op][f"p{p}"] = percentile(values, p)
+
+        return {
+            "elapsed": now - self.start_time,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "running": self.started - self.retried - (completed - self.skipped),
+            "retried": self.retried,
+            "skipped": self.skipped,
+            "commands_per_s": rate,
+            "read_mb_per_s": (self.bytes_read - r0) / dt / 1e6,
+            "write_mb_per_s": (self.bytes_written - w0) / dt / 1e6,
+            "eta": eta,
+            "operators": operators,
+        }
+
+    def format(self, snap: dict) -> str:
+        """
+        :param snap dict: state of the run, see snapshot
+        :return: one line summary
+        :rtype: str
+        """
+        eta = "?" if snap["eta"] is None else format_duration(snap["eta"])
+
+        return (
+            f"cdo-batch: {snap['done']}/{snap['total']} done, "
+            f"{snap['running']} running, {snap['failed']} failed, "
+            f"{snap['commands_per_s']:.1f} cmd/s, "
+            f"read {snap['read_mb_per_s']:.1f} MB/s, "
+            f"wrote {snap['write_mb_per_s']:.1f} MB/s, ETA {eta}"
+        )
+
+    def report(self):
+        snap = self.snapshot()
+
+        if self.stream is not False:
+            self.stream.write(self.format(snap) + "\n")
+            self.stream.flush()
+
+        if self.path is not None:
+            tmp = f"{self.path}.partial"
+            with open(tmp, "w") as f:
+                json.dump(snap, f, indent=2)
+            os.replace(tmp, self.path)
+
+    def report_loop(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+        self.report()
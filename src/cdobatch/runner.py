@@ -0,0 +1,623 @@
+from __future__ import annotations
+
+import io
+import math
+import os
+from threading import Lock
+from typing import TYPE_CHECKING
+
+from .autotune import Autotuner
+from .batch import batch_groups
+from .executor import execute
+from .journal import Journal
+from .operator import CdoResult, get_link_count, writes_prefix
+from .progress import Progress
+from .schedule import CostModel, group_by_input, lpt_order, primary_input
+from .staging import OutputStager, default_scratch_dir
+
+if TYPE_CHECKING:
+    from cdo import Cdo
+
+    from .operator import Operator
+    from .staging import InputCache
+
+
+def get_partial_path(output: str) -> str:
+    """
+    :param output str: output path of a command
+    :return: temporary path next to the output it is written to, renamed to
+    the output once complete
+    :rtype: str
+    """
+    return os.path.join(
+        os.path.dirname(output), f".{os.path.basename(output)}.{os.getpid()}.partial"
+    )
+
+
+class RunOptions:
+    journal: Journal | str | None
+    resume: bool
+    workers: int
+    retries: int
+    backoff: float
+    order: str
+    fuse: bool
+    scratch_dir: str | None
+    dedupe: bool
+    stage_dir: str | None
+    movers: int
+    input_cache: InputCache | None
+    prefetch: int
+    batch: int
+    batch_bytes: int
+    cost_model: CostModel | str | None
+    progress: Progress | str | bool | None
+    autotune: Autotuner | str | bool | None
+
+    def __init__(
+        self,
+        journal: Journal | str | None = None,
+        resume=False,
+        workers=1,
+        retries=0,
+        backoff=1.0,
+        order="default",
+        fuse=False,
+        scratch_dir=None,
+        dedupe=False,
+        stage_dir=None,
+        movers=4,
+        input_cache: InputCache | None = None,
+        prefetch=4,
+        batch=0,
+        batch_bytes=64 * 1024**2,
+        cost_model: CostModel | str | None = None,
+        progress: Progress | str | bool | None = None,
+        autotune: Autotuner | str | bool | None = None,
+    ):
+        """
+        Options of Operator.run_real
+
+        :param journal Journal|str: journal (or path to one) recording the
+        state of each command as it completes
+        :param resume bool: skip commands the journal records as done, failed
+        commands are retried
+        :param workers int: number of cdo commands to run in parallel
+        :param retries int: number of times to retry commands failing with
+        transient (I/O) errors
+        :param backoff float: seconds before the first retry, doubles with
+        each retry
+        :param order str: "default" runs commands in the order they were
+        configured, "input" runs commands reading the same input file back to
+        back on one worker while the file is in the page cache, "cost" runs
+        the commands estimated to take longest first so no long command
+        starts last
+        :param fuse bool: commands sharing an input file (e.g. a vertical fork
+        from vectorize) read a single decoded copy of the input, implies
+        order="input". Fan-outs larger than the commands per worker are split
+        over several workers sharing the copy.
+        :param scratch_dir str: directory for decoded copies, defaults to
+        /dev/shm when available
+        :param dedupe bool: run identical commands only once, see dedupe
+        :param stage_dir str: node local directory (e.g. /tmp or NVMe) to write
+        outputs to, finished outputs are moved into the output node in the
+        background with an atomic rename
+        :param movers int: number of threads moving staged outputs
+        :param input_cache InputCache: local cache to read input files from,
+        commands read the cached copies instead of the node's files
+        :param prefetch int: number of upcoming commands whose inputs are
+        fetched into input_cache ahead of time
+        :param batch int: run up to this many small commands in a single
+        process on each worker, see run_batch. 0 disables batching.
+        :param batch_bytes int: commands reading more than this many bytes are
+        not batched
+        :param cost_model CostModel|str: model (or path to the timings of one)
+        estimating the duration of commands for order="cost". Timings of
+        successful commands are added to it, see cost_report.
+        :param progress Progress|str|bool: reporter (or path of a JSON file
+        to keep the latest report in) of commands done, throughput and time
+        left, reports go to stderr. True reports to stderr only.
+        :param autotune Autotuner|str|bool: adjust the number of commands run
+        at once per operator from the measured throughput and I/O wait, with
+        workers as the upper bound. A path keeps the chosen levels for the
+        next run, see autotune.Autotuner.
+        """
+        self.journal = journal
+        self.resume = resume
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.order = order
+        self.fuse = fuse
+        self.scratch_dir = scratch_dir
+        self.dedupe = dedupe
+        self.stage_dir = stage_dir
+        self.movers = movers
+        self.input_cache = input_cache
+        self.prefetch = prefetch
+        self.batch = batch
+        self.batch_bytes = batch_bytes
+        self.cost_model = cost_model
+        self.progress = progress
+        self.autotune = autotune
+
+
+class Run:
+    op: Operator
+    options: RunOptions
+    cmds: list[dict]
+
+    def __init__(self, op: Operator, cdo: Cdo, options: RunOptions):
+        """
+        One run of the configured commands of an operator. Holds the journal,
+        stager, cost model, progress reporter and autotuner of the run, which
+        are closed when the run ends, even if it fails.
+
+        :param op Operator: configured operator
+        :param cdo Cdo: cdo instance to use
+        :param options RunOptions: execution options
+        """
+        self.op = op
+        self.cdo = cdo
+        self.options = options
+
+        self.cmds = []
+        self.costs = None
+        self.predictions = None
+        self.scratch_dir = options.scratch_dir
+
+        # time chunk commands by the output of their merge
+        self.chunk_cmds = {}
+        for c in op.cdo_cmds:
+            if "chunk_of" in c:
+                self.chunk_cmds.setdefault(c["chunk_of"], []).append(c)
+
+        self.run_order = []
+        self.positions = {}
+
+        self.journal = None
+        self.owns_journal = False
+        self.stager = None
+        self.cost_model = None
+        self.owns_model = False
+        self.progress = None
+        self.autotune = None
+        self.owns_tuner = False
+
+        # outputs linked from a ResultStore, see select
+        self.linked = set()
+
+        # staged outputs still being moved
+        self.moves = []
+
+        # decoded copies of inputs whose fan-out is split over several fused
+        # groups, see run_fused
+        self.decoded = {}
+
+    def open(self):
+        """
+        Open the journal and start the helpers of the run
+        """
+        o = self.options
+
+        self.journal = o.journal
+        self.owns_journal = isinstance(o.journal, str)
+        if self.owns_journal:
+            self.journal = Journal(o.journal)
+        if self.journal is not None:
+            self.journal.open()
+
+        if o.stage_dir is not None:
+            self.stager = OutputStager(o.stage_dir, o.movers)
+
+        self.cost_model = o.cost_model
+        self.owns_model = isinstance(o.cost_model, str)
+        if self.owns_model:
+            self.cost_model = CostModel(o.cost_model)
+        elif o.cost_model is None and o.order == "cost":
+            self.cost_model = CostModel()
+
+        if o.progress is True:
+            self.progress = Progress()
+        elif isinstance(o.progress, str):
+            self.progress = Progress(o.progress)
+        elif o.progress is not False:
+            self.progress = o.progress
+
+        self.owns_tuner = isinstance(o.autotune, str)
+        if o.autotune is True or self.owns_tuner:
+            path = o.autotune if self.owns_tuner else None
+            self.autotune = Autotuner(path, max_workers=o.workers)
+        elif o.autotune is not False:
+            self.autotune = o.autotune
+
+    def close(self):
+        """
+        Wait for staged outputs and stop the helpers, saving what they learned
+        """
+        if self.stager is not None:
+            self.stager.close()
+            self.finish_moved()
+
+        if self.progress is not None:
+            self.progress.stop()
+
+        if self.owns_journal:
+            self.journal.close()
+        elif self.journal is not None:
+            self.journal.sync()
+
+        if self.owns_model:
+            self.cost_model.save()
+
+        if self.autotune is not None:
+            self.autotune.report()
+        if self.owns_tuner:
+            self.autotune.save()
+
+        # copies of groups which didn't run, e.g. failed dependencies
+        for d in self.decoded.values():
+            if d["path"] is not None and os.path.isfile(d["path"]):
+                os.remove(d["path"])
+        self.decoded = {}
+
+    def select(self) -> list[dict]:
+        """
+        :return: the commands to run, without those the journal records as
+        done when resuming
+        :rtype: list[dict]
+        """
+        cmds = []
+        for c in self.op.cdo_cmds:
+            if self.options.resume and self.journal is not None:
+                if self.journal.is_done(self.op.make_cdo_cmd_str(c)):
+                    continue
+
+            cmds.append(c)
+
+        # outputs linked from a store are replaced once the command is done,
+        # writing them in place would change the stored copy
+        for c in cmds:
+            o = c["output"]
+            if o == "" or writes_prefix(c):
+                continue
+            if os.path.islink(o) or get_link_count(o) > 1:
+                self.linked.add(o)
+
+        return cmds
+
+    def staged_output(self, c: dict) -> str | None:
+        """
+        :return: path a command writes its output to instead of its output,
+        None to write it in place
+        :rtype: str | None
+        """
+        if c["output"] == "":
+            return None
+        if self.stager is not None:
+            return self.stager.get_staged_path(c["output"])
+        if c["output"] in self.linked:
+            return get_partial_path(c["output"])
+        return None
+
+    def run_one(self, c: dict, inputs: dict | None = None) -> CdoResult:
+        output = self.staged_output(c)
+        cache = self.options.input_cache
+
+        if cache is None:
+            return self.op.run_command(self.cdo, c, inputs, output)
+
+        self.prefetch_after(c)
+
+        cached = {f: cache.fetch(f) for f in c["files"]}
+        if inputs is not None:
+            cached.update(inputs)
+
+        try:
+            return self.op.run_command(self.cdo, c, cached, output)
+        finally:
+            for f in c["files"]:
+                cache.release(f)
+
+    def run_batch(self, group_cmds: list[dict]) -> list[CdoResult]:
+        if len(group_cmds) == 1:
+            return [self.run_one(group_cmds[0])]
+
+        outputs = [self.staged_output(c) for c in group_cmds]
+        cache = self.options.input_cache
+
+        if cache is None:
+            return self.op.run_batch(self.cdo, group_cmds, None, outputs)
+
+        self.prefetch_after(group_cmds[-1])
+
+        files = [f for c in group_cmds for f in c["files"]]
+        cached = {f: cache.fetch(f) for f in files}
+        try:
+            return self.op.run_batch(self.cdo, group_cmds, cached, outputs)
+        finally:
+            for f in files:
+                cache.release(f)
+
+    def run_fused(self, group_cmds: list[dict]) -> list[CdoResult]:
+        input_path = primary_input(group_cmds[0])
+        d = self.decoded.get(input_path)
+
+        if d is None:
+            return self.op.run_fused(
+                self.cdo, group_cmds, self.scratch_dir, self.run_one
+            )
+
+        # the first group decodes the input, the other groups wait for it.
+        # Retries after the copy was removed read the original.
+        with d["lock"]:
+            if not d["decoded"]:
+                d["path"] = self.op.decode_input(self.cdo, input_path, self.scratch_dir)
+                d["decoded"] = True
+            d["readers"] += 1
+            path = d["path"]
+
+        inputs = None
+        if path is not None:
+            inputs = {input_path: path}
+
+        try:
+            return [self.run_one(c, inputs) for c in group_cmds]
+        finally:
+            with d["lock"]:
+                d["readers"] -= 1
+                d["left"].difference_update(id(c) for c in group_cmds)
+                if d["readers"] == 0 and len(d["left"]) == 0 and path is not None:
+                    os.remove(path)
+                    d["path"] = None
+
+    def prefetch_after(self, c: dict):
+        # fetch the inputs of the next commands in run order
+        i = self.positions[id(c)] + 1
+        for upcoming in self.run_order[i : i + self.options.prefetch]:
+            self.options.input_cache.prefetch(upcoming["files"])
+
+    def skipped(self, c: dict, error: Exception) -> CdoResult:
+        """
+        :return: failed result of a command not run as its inputs failed
+        :rtype: CdoResult
+        """
+        return CdoResult(self.op, None, error, io.StringIO(), io.StringIO(), c)
+
+    def finish(self, r: CdoResult):
+        """
+        Record a final result once its output is in place
+        """
+        if self.journal is not None:
+            state = Journal.DONE
+            if r.error is not None:
+                state = Journal.FAILED
+            self.journal.record(r.cmd_str, state)
+
+        # chunks are only read by their merge, failed merges are rerun from
+        # new chunks
+        for f in r.cmd.get("chunks", []):
+            if os.path.isfile(f):
+                os.remove(f)
+
+        if r.error is not None and self.journal is not None:
+            for c in self.chunk_cmds.get(r.cmd["output"], []):
+                self.journal.record(self.op.make_cdo_cmd_str(c), Journal.FAILED)
+
+        if r.error is None:
+            key = self.op.op_store_keys.get(r.cmd["output"])
+            if key is not None:
+                self.op.op_store.add(key, r.cmd["output"])
+
+        # update the output node with any new output files
+        if self.op.op_out_node is not None:
+            self.op.op_out_node.find_files()
+
+    def finish_moved(self):
+        for m in [m for m in self.moves if m[0].done()]:
+            self.moves.remove(m)
+            f, r = m
+
+            if f.exception() is not None:
+                r.error = f.exception()
+                r.errmsg = str(r.error)
+            elif writes_prefix(r.cmd):
+                r.result = f.result()
+            else:
+                r.result = r.cmd["output"]
+
+            self.finish(r)
+
+    def replace_linked(self, r: CdoResult):
+        """
+        Replace an output linked from a store with the output its command
+        wrote to a temporary name
+        """
+        output = r.cmd["output"]
+        partial = get_partial_path(output)
+
+        if r.error is None:
+            try:
+                if os.path.exists(partial):
+                    os.replace(partial, output)
+                r.result = output
+            except OSError as e:
+                r.error = e
+                r.errmsg = str(e)
+
+        if r.error is not None and os.path.isfile(partial):
+            os.remove(partial)
+
+    def on_result(self, i: int, r: CdoResult):
+        if self.progress is not None:
+            self.progress.on_result(i, r)
+
+        if self.autotune is not None:
+            self.autotune.record(r.cmd, r)
+
+        if self.cost_model is not None:
+            r.predicted = self.predictions[i]
+            if r.error is None:
+                self.cost_model.record(r.cmd, r.duration)
+
+        output = r.cmd["output"]
+        if self.stager is None and output in self.linked:
+            self.replace_linked(r)
+
+        if self.stager is None or output == "":
+            self.finish(r)
+        elif r.error is not None:
+            self.stager.discard(output, writes_prefix(r.cmd))
+            self.finish(r)
+        else:
+            self.moves.append((self.stager.commit(output, writes_prefix(r.cmd)), r))
+
+        self.finish_moved()
+
+    def get_groups(self):
+        """
+        :return: groups of command indices run back to back on one worker, or
+        None for one command at a time, and the function running a group
+        :rtype: tuple[list[list[int]] | None, Callable | None]
+        """
+        o = self.options
+        cmds = self.cmds
+
+        groups = None
+        if o.fuse:
+            # large fan-outs are split so they run on several workers
+            max_group = math.ceil(len(cmds) / max(1, o.workers))
+            groups = group_by_input(cmds, max_group)
+        elif o.order == "input":
+            groups = group_by_input(cmds)
+        elif o.order not in ["default", "cost"]:
+            print("Unknown order", o.order)
+
+        if o.order == "cost":
+            if groups is None:
+                groups = [[i] for i in range(len(cmds))]
+            groups = lpt_order(groups, self.costs)
+
+        run_group = None
+        if o.batch > 0 and o.fuse:
+            print("Batching is not used with fuse")
+        elif o.batch > 0:
+            order_idx = range(len(cmds))
+            if groups is not None:
+                order_idx = [i for g in groups for i in g]
+            groups = batch_groups(cmds, order_idx, o.batch, o.batch_bytes)
+            run_group = self.run_batch
+
+        if o.fuse:
+            if self.scratch_dir is None:
+                self.scratch_dir = default_scratch_dir()
+            os.makedirs(self.scratch_dir, exist_ok=True)
+            run_group = self.run_fused
+
+            # inputs split over several groups are decoded once for all of
+            # them, the copy is removed once every command read it
+            split = {}
+            for g in groups:
+                split.setdefault(primary_input(cmds[g[0]]), []).append(g)
+
+            self.decoded = {
+                path: {
+                    "path": None,
+                    "decoded": False,
+                    "readers": 0,
+                    "left": {id(cmds[i]) for g in split_groups for i in g},
+                    "lock": Lock(),
+                }
+                for path, split_groups in split.items()
+                if len(split_groups) > 1 and path != ""
+            }
+
+        return groups, run_group
+
+    def get_deps(self) -> dict:
+        """
+        :return: indices of the commands each command reads the output of,
+        e.g. the merge of time chunks waits for the chunks
+        :rtype: dict
+        """
+        writers = {c["output"]: i for i, c in enumerate(self.cmds) if c["output"] != ""}
+
+        deps = {}
+        for i, c in enumerate(self.cmds):
+            waits = [writers[f] for f in c.get("files", []) if f in writers]
+            if len(waits) > 0:
+                deps[i] = waits
+
+        return deps
+
+    def run(self) -> list[CdoResult]:
+        """
+        :return: list of results from each run of cdo, commands skipped when
+        resuming or removed as duplicates have no result
+        :rtype: list[CdoResult]
+        """
+        o = self.options
+
+        if o.dedupe:
+            self.op.dedupe()
+
+        try:
+            self.open()
+            self.cmds = self.select()
+
+            if self.cost_model is not None:
+                self.costs = [self.cost_model.estimate(c) for c in self.cmds]
+
+                # estimates are only in seconds once the model has timings
+                self.predictions = [
+                    cost if self.cost_model.has_timings(c) else None
+                    for c, cost in zip(self.cmds, self.costs)
+                ]
+
+            groups, run_group = self.get_groups()
+
+            if groups is None:
+                self.run_order = self.cmds
+            else:
+                self.run_order = [self.cmds[i] for g in groups for i in g]
+            self.positions = {id(c): i for i, c in enumerate(self.run_order)}
+
+            concurrency = None
+            concurrency_key = None
+            if self.autotune is not None:
+                concurrency = self.autotune.limit
+                concurrency_key = self.autotune.get_name
+
+            on_start = None
+            on_retry = None
+            if self.progress is not None:
+                on_start = self.progress.on_start
+                on_retry = self.progress.on_retry
+                self.progress.start(len(self.cmds))
+
+            results = execute(
+                self.cmds,
+                self.run_one,
+                workers=o.workers,
+                retries=o.retries,
+                backoff=o.backoff,
+                on_result=self.on_result,
+                groups=groups,
+                run_group=run_group,
+                deps=self.get_deps(),
+                on_start=on_start,
+                on_retry=on_retry,
+                concurrency=concurrency,
+                skip=self.skipped,
+                concurrency_key=concurrency_key,
+            )
+        finally:
+            self.close()
+
+        # intermediate inputs are kept after failures so they can be rerun
+        failed = any(r is not None and r.error is not None for r in results)
+        node = self.op.op_in_node
+        if node is not None and not failed and node.is_intermediate():
+            node.release(self.op)
+
+        return results
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import heapq
+import json
+import os
+
+
+def primary_input(c: dict) -> str:
+    """
+    :param c dict: cdo command dictionary
+    :return: the file the command reads, the last one if it reads several
+    :rtype: str
+    """
+    files = c.get("files", [])
+    if len(files) == 0:
+        return ""
+
+    return files[-1]
+
+
+def group_by_input(cmds: list[dict], max_group=0) -> list[list[int]]:
+    """
+    Group commands reading the same input file so each input is read while it
+    is still in the page cache. Groups are ordered by the first command using
+    each input, commands keep their order within a group.
+
+    :param cmds list[dict]: cdo command dictionaries
+    :param max_group int: split groups larger than this so long fan-outs are
+    still spread over several workers, 0 for no limit
+    :return: indices of the commands in each group
+    :rtype: list[list[int]]
+    """
+    by_input = OrderedDict()
+    for i, c in enumerate(cmds):
+        by_input.setdefault(primary_input(c), []).append(i)
+
+    groups = []
+    for group in by_input.values():
+        if max_group <= 0:
+            groups.append(group)
+            continue
+
+        for j in range(0, len(group), max_group):
+            groups.append(group[j : j + max_group])
+
+    return groups
+
+
+def simulate_bytes_read(
+    cmds: list[dict], order: list[int], cache_bytes: int, sizes: dict | None = None
+) -> int:
+    """
+    Estimate the bytes read from storage when running commands in the given
+    order with a least recently used page cache of cache_bytes
+
+    :param cmds list[dict]: cdo command dictionaries
+    :param order list[int]: order in which command indices are run
+    :param cache_bytes int: size of the page cache
+    :param sizes dict: size of each input file, read from the filesystem if
+    not given
+    :return: number of bytes read from storage
+    :rtype: int
+    """
+    if sizes is None:
+        sizes = {}
+
+    cache = OrderedDict()
+    cached = 0
+    read = 0
+
+    for i in order:
+        for f in cmds[i].get("files", []):
+            if f not in sizes:
+                sizes[f] = os.path.getsize(f) if os.path.isfile(f) else 0
+
+            if f in cache:
+                cache.move_to_end(f)
+                continue
+
+            read += sizes[f]
+            cache[f] = sizes[f]
+            cached += sizes[f]
+
+            while cached > cache_bytes and len(cache) > 1:
+                _, evicted = cache.popitem(last=False)
+                cached -= evicted
+
+    return read
+
+
+def chain_length(c: dict) -> int:
+    """
+    :param c dict: cdo command dictionary
+    :return: number of operators in the command, including piped ones
+    :rtype: int
+    """
+    piped = [t for t in c["input"].split() if t.startswith("-") and len(t) > 1]
+    return 1 + sum(1 for t in piped if not t[1].isdigit())
+
+
+class CostModel:
+    path: str | None
+    stats: dict
+    sizes: dict
+
+    def __init__(self, path=None):
+        """
+        Estimate the run time of commands from the size of their inputs and
+        the length of their operator chain. Timings of earlier runs are fit
+        per operator name with least squares (seconds = overhead + rate *
+        work) and kept in a JSON file between runs.
+
+        :param path str: JSON file with the timings of earlier runs, created
+        on save
+        """
+        self.path = path
+        self.stats = {}
+        self.sizes = {}
+
+        if path is not None and os.path.isfile(path):
+            with open(path, "r") as f:
+                self.stats = json.load(f)
+
+    def work(self, c: dict) -> float:
+        """
+        :param c dict: cdo command dictionary
+        :return: bytes read by the command times the length of its chain
+        :rtype: float
+        """
+        size = 0
+        for f in c.get("files", []):
+            if f not in self.sizes:
+                self.sizes[f] = os.path.getsize(f) if os.path.isfile(f) else 0
+            size += self.sizes[f]
+
+        return float(size * chain_length(c))
+
+    def fit(self, name: str) -> tuple[float, float] | None:
+        """
+        :param name str: operator name, "" for all operators
+        :return: overhead and rate fit to the timings of an operator, None if
+        there are none
+        :rtype: tuple[float, float] | None
+        """
+        s = self.stats.get(name)
+        if s is None or s["n"] == 0:
+            return None
+
+        n, x, y, xx, xy = s["n"], s["x"], s["y"], s["xx"], s["xy"]
+        denom = n * xx - x * x
+
+        if n > 1 and denom > 0:
+            rate = (n * xy - x * y) / denom
+            if rate >= 0:
+                return (y - rate * x) / n, rate
+
+        # not enough spread in the sizes seen, assume time scales with work
+        if x > 0:
+            return 0.0, y / x
+
+        return y / n, 0.0
+
+    def has_timings(self, c: dict) -> bool:
+        """
+        :param c dict: cdo command dictionary
+        :return: True if estimates of the command are in seconds, from timings
+        of its operator or of any operator
+        :rtype: bool
+        """
+        return self.fit(c["func_name"]) is not None or self.fit("") is not None
+
+    def estimate(self, c: dict) -> float:
+        """
+        :param c dict: cdo command dictionary
+        :return: estimated seconds to run the command, in units of work if
+        nothing has been timed yet
+        :rtype: float
+        """
+        work = self.work(c)
+
+        fit = self.fit(c["func_name"])
+        if fit is None:
+            fit = self.fit("")
+
+        if fit is None:
+            return work
+
+        overhead, rate = fit
+        return max(0.0, overhead) + rate * work
+
+    def record(self, c: dict, seconds: float):
+        """
+        Add the timing of a finished command
+        """
+        work = self.work(c)
+
+        for name in [c["func_name"], ""]:
+            s = self.stats.setdefault(
+                name, {"n": 0, "x": 0.0, "y": 0.0, "xx": 0.0, "xy": 0.0}
+            )
+            s["n"] += 1
+            s["x"] += work
+            s["y"] += seconds
+            s["xx"] += work * work
+            s["xy"] += work * seconds
+
+    def save(self):
+        if self.path is None:
+            return
+
+        tmp = f"{self.path}.{os.getpid()}.partial"
+        with open(tmp, "w") as f:
+            json.dump(self.stats, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def lpt_order(groups: list[list[int]], costs: list[float]) -> list[list[int]]:
+    """
+    Order groups longest processing time first, so the longest commands
+    don't start last while the other workers are idle
+
+    :param groups list[list[int]]: indices of the commands in each group
+    :param costs list[float]: estimated cost of each command
+    :return: the groups, most expensive first
+    :rtype: list[list[int]]
+    """
+    return sorted(groups, key=lambda g: sum(costs[i] for i in g), reverse=True)
+
+
+def simulate_makespan(groups: list[list[int]], costs: list[float], workers: int):
+    """
+    :param groups list[list[int]]: indices of the commands in each group, in
+    run order
+    :param costs list[float]: cost of each command
+    :param workers int: number of workers
+    :return: time until the last group finishes when each group is started
+    on the first idle worker
+    :rtype: float
+    """
+    finish = [0.0] * max(1, workers)
+
+    for g in groups:
+        start = heapq.heappop(finish)
+        heapq.heappush(finish, start + sum(costs[i] for i in g))
+
+    return max(finish)
+
+
+def cost_report(results: list) -> dict:
+    """
+    Compare predicted and actual durations of a run with a cost model
+
+    :param results list[CdoResult]: results returned by Operator.run, results
+    without a prediction (run before the model had timings) are skipped
+    :return: totals for the run and for each operator name, and the mean
+    relative error of the predictions
+    :rtype: dict
+    """
+    report = {"commands": 0, "predicted": 0.0, "actual": 0.0, "error": 0.0}
+    by_op = {}
+    errors = []
+
+    for r in results:
+        if r is None or isinstance(r, str) or r.predicted is None:
+            continue
+
+        entries = [report, by_op.setdefault(r.cmd.get("func_name", ""), {})]
+        for e in entries:
+            e["commands"] = e.get("commands", 0) + 1
+            e["predicted"] = e.get("predicted", 0.0) + r.predicted
+            e["actual"] = e.get("actual", 0.0) + r.duration
+
+        if r.duration > 0:
+            errors.append(abs(r.predicted - r.duration) / r.duration)
+
+    if len(errors) > 0:
+        report["error"] = sum(errors) / len(errors)
+
+    report["by_op"] = by_op
+    return report
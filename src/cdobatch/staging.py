@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import errno
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+
+def default_scratch_dir() -> str:
+    """
+    :return: a RAM backed directory if available, otherwise the temp directory
+    :rtype: str
+    """
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+
+    return tempfile.gettempdir()
+
+
+class OutputStager:
+    scratch_dir: str
+
+    def __init__(self, scratch_dir, movers=4):
+        """
+        Write command outputs to node local scratch space first. Finished
+        outputs are moved to their final location by a pool of mover threads,
+        through a temporary name and an atomic rename so partially written
+        files never appear in the output node.
+
+        :param scratch_dir str: local directory for outputs being written
+        :param movers int: number of threads moving finished outputs
+        """
+        self.scratch_dir = scratch_dir
+        os.makedirs(scratch_dir, exist_ok=True)
+
+        self._pool = ThreadPoolExecutor(max_workers=movers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_staged_path(self, output: str) -> str:
+        """
+        :param output str: final output path of a command
+        :return: path the command writes to instead
+        :rtype: str
+        """
+        key = hashlib.sha1(output.encode()).hexdigest()[:16]
+        return os.path.join(self.scratch_dir, f"{key}_{os.path.basename(output)}")
+
+    def get_staged_files(self, output: str, prefix: bool = False) -> list[str]:
+        """
+        :param output str: final output path of a command
+        :param prefix bool: output is the prefix of the files the command
+        writes, e.g. splityear
+        :return: files the command wrote to scratch space
+        :rtype: list[str]
+        """
+        staged = self.get_staged_path(output)
+        if not prefix:
+            return [staged]
+
+        return sorted(glob.glob(glob.escape(staged) + "*"))
+
+    def commit(self, output: str, prefix: bool = False) -> Future:
+        """
+        Move the staged files of an output to their final location in the
+        background
+
+        :param output str: final output path
+        :param prefix bool: output is the prefix of the files the command
+        wrote, each is moved to output followed by its suffix
+        :return: future completing with the final paths of the moved files
+        once they are in place
+        :rtype: Future
+        """
+        return self._pool.submit(self._move, output, prefix)
+
+    def _move(self, output: str, prefix: bool) -> list[str]:
+        staged = self.get_staged_path(output)
+
+        moved = []
+        for f in self.get_staged_files(output, prefix):
+            dst = output + f[len(staged) :]
+            move_atomic(f, dst)
+            moved.append(dst)
+
+        return moved
+
+    def discard(self, output: str, prefix: bool = False):
+        """
+        Remove the staged files of an output, e.g. after its command failed
+        """
+        for f in self.get_staged_files(output, prefix):
+            if os.path.isfile(f):
+                os.remove(f)
+
+    def close(self):
+        """
+        Wait for all outputs to be moved
+        """
+        self._pool.shutdown(wait=True)
+
+
+def move_atomic(src: str, dst: str):
+    """
+    Move src to dst so dst is either missing or complete. Renames within a
+    filesystem, copies to a temporary name next to dst before renaming
+    otherwise.
+
+    :param src str: file to move
+    :param dst str: final path
+    """
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    tmp = os.path.join(
+        os.path.dirname(dst), f".{os.path.basename(dst)}.{os.getpid()}.partial"
+    )
+
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+        raise
+
+    os.remove(src)
+
+
+class InputCache:
+    cache_dir: str
+    max_bytes: int
+
+    def __init__(self, cache_dir, max_bytes, prefetchers=2):
+        """
+        Bounded cache of input files on local storage. Files are hardlinked
+        when the cache is on the same filesystem and copied otherwise. The
+        least recently used files are evicted once the cache grows past
+        max_bytes, files in use are never evicted. Files already in
+        cache_dir from earlier runs are reused.
+
+        :param cache_dir str: local directory for cached inputs
+        :param max_bytes int: maximum size of the cache
+        :param prefetchers int: number of threads fetching inputs ahead of use
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._fetching = {}
+        self._queued = set()
+        self._pinned = {}
+        self._pool = ThreadPoolExecutor(max_workers=prefetchers)
+
+        # least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+
+        existing = []
+        for f in os.listdir(cache_dir):
+            p = os.path.join(cache_dir, f)
+            if os.path.isfile(p) and not f.endswith(".partial"):
+                st = os.stat(p)
+                existing.append((st.st_atime, p, st.st_size))
+
+        for _, p, size in sorted(existing):
+            self._entries[p] = size
+            self._size += size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_cached_path(self, path: str) -> str:
+        """
+        :param path str: path of an input file
+        :return: path of the file in the cache
+        :rtype: str
+        """
+        key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{key}_{os.path.basename(path)}")
+
+    def fetch(self, path: str, pin=True) -> str:
+        """
+        Copy an input into the cache if it isn't there yet
+
+        :param path str: path of an input file
+        :param pin bool: keep the file in the cache until release is called
+        :return: path to read the input from, the original path if it can't be
+        cached
+        :rtype: str
+        """
+        cached = self.get_cached_path(path)
+
+        with self._lock:
+            if cached in self._entries and not is_newer(path, cached):
+                self._entries.move_to_end(cached)
+                if pin:
+                    self._pinned[cached] = self._pinned.get(cached, 0) + 1
+                return cached
+
+            event = self._fetching.get(cached)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._fetching[cached] = event
+
+        if not owner:
+            # another thread is fetching the same file
+            event.wait()
+            return self.fetch(path, pin)
+
+        try:
+            size = os.path.getsize(path)
+            if size > self.max_bytes:
+                return path
+
+            with self._lock:
+                if cached in self._entries:
+                    # the input changed since it was cached, the copy is
+                    # replaced below as it may be pinned by another command
+                    self._size -= self._entries.pop(cached)
+
+                self._evict(self.max_bytes - size)
+
+            tmp = f"{cached}.{os.getpid()}.partial"
+            try:
+                link_or_copy(path, tmp)
+                os.replace(tmp, cached)
+            except OSError:
+                if os.path.isfile(tmp):
+                    os.remove(tmp)
+                raise
+
+            with self._lock:
+                self._entries[cached] = size
+                self._size += size
+                if pin:
+                    self._pinned[cached] = self._pinned.get(cached, 0) + 1
+        except OSError:
+            return path
+        finally:
+            with self._lock:
+                del self._fetching[cached]
+            event.set()
+
+        return cached
+
+    def release(self, path: str):
+        """
+        Allow the cached copy of an input to be evicted again
+        """
+        cached = self.get_cached_path(path)
+
+        with self._lock:
+            count = self._pinned.get(cached, 0) - 1
+            if count <= 0:
+                self._pinned.pop(cached, None)
+            else:
+                self._pinned[cached] = count
+
+    def prefetch(self, paths: list[str]):
+        """
+        Fetch inputs in the background, inputs already cached or being
+        fetched are skipped
+        """
+        for p in paths:
+            cached = self.get_cached_path(p)
+
+            with self._lock:
+                if cached in self._entries or cached in self._queued:
+                    continue
+                self._queued.add(cached)
+
+            self._pool.submit(self._prefetch_one, p, cached)
+
+    def _prefetch_one(self, path: str, cached: str):
+        try:
+            self.fetch(path, pin=False)
+        finally:
+            with self._lock:
+                self._queued.discard(cached)
+
+    def get_size(self) -> int:
+        return self._size
+
+    def _evict(self, target: int):
+        # caller holds the lock
+        for cached in list(self._entries):
+            if self._size <= target:
+                break
+
+            if cached in self._pinned:
+                continue
+
+            self._size -= self._entries.pop(cached)
+            if os.path.isfile(cached):
+                os.remove(cached)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+def link_or_copy(src: str, dst: str):
+    """
+    Hardlink src to dst, copy through a temporary name if that fails
+    """
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        return
+    except OSError:
+        pass
+
+    tmp = f"{dst}.{os.getpid()}.partial"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def is_newer(src: str, dst: str) -> bool:
+    """
+    :return: True if src was modified after dst was written
+    :rtype: bool
+    """
+    try:
+        return os.path.getmtime(src) > os.path.getmtime(dst)
+    except OSError:
+        return True
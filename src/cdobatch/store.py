@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+
+from .staging import link_or_copy
+
+
+class ResultStore:
+    store_dir: str
+    max_bytes: int | None
+    link: str
+
+    def __init__(self, store_dir: str, max_bytes: int | None = None, link="hard"):
+        """
+        Store of command outputs shared between runs and users. Outputs are
+        keyed by the operator chain of their command and the path, size and
+        modification time of its input files, so a command run again on
+        unchanged inputs is replaced by a link to the stored output. The least
+        recently used outputs are evicted once the store grows past max_bytes.
+
+        :param store_dir str: directory of the store
+        :param max_bytes int: maximum size of the store, unbounded if None
+        :param link str: "hard" links outputs into their nodes (copied across
+        filesystems), "symlink" creates symbolic links, which break once the
+        output is evicted
+        """
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.link = link
+        os.makedirs(store_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+
+        # least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+
+        existing = []
+        for root, _, files in os.walk(store_dir):
+            for f in files:
+                p = os.path.join(root, f)
+                if not f.endswith(".partial"):
+                    st = os.stat(p)
+                    existing.append((st.st_atime, p, st.st_size))
+
+        for _, p, size in sorted(existing):
+            self._entries[p] = size
+            self._size += size
+
+    def get_key(self, c: dict) -> str | None:
+        """
+        :param c dict: cdo command dictionary
+        :return: hash of the command and the fingerprints of its input files,
+        None if an input doesn't exist
+        :rtype: str | None
+        """
+        files = set(c["files"])
+        tokens = []
+
+        for t in c["input"].split(" "):
+            if t in files:
+                try:
+                    st = os.stat(t)
+                except OSError:
+                    return None
+                t = [os.path.realpath(t), st.st_size, st.st_mtime_ns]
+            tokens.append(t)
+
+        parts = [c["func_name"], c["param"], c["options"], tokens]
+        return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+    def get_stored_path(self, key: str, output: str) -> str:
+        """
+        :return: path of the output of a command in the store
+        :rtype: str
+        """
+        ext = os.path.splitext(output)[1]
+        return os.path.join(self.store_dir, key[:2], key + ext)
+
+    def fetch(self, key: str, output: str) -> bool:
+        """
+        Link the stored result of a command to its output path
+
+        :param key str: key of the command, see get_key
+        :param output str: output path of the command
+        :return: True if the result was in the store
+        :rtype: bool
+        """
+        stored = self.get_stored_path(key, output)
+
+        try:
+            st = os.stat(stored)
+        except OSError:
+            return False
+
+        if os.path.exists(output) and os.path.samefile(stored, output):
+            return True
+
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+
+        tmp = f"{output}.{os.getpid()}.partial"
+        if self.link == "symlink":
+            os.symlink(os.path.abspath(stored), tmp)
+        else:
+            link_or_copy(stored, tmp)
+        os.replace(tmp, output)
+
+        # mark as recently used, keeping the modification time
+        os.utime(stored, ns=(time.time_ns(), st.st_mtime_ns))
+
+        with self._lock:
+            if stored in self._entries:
+                self._entries.move_to_end(stored)
+
+        return True
+
+    def add(self, key: str, output: str):
+        """
+        Add a copy of the output of a command which ran successfully, stored
+        files are read only as they are linked into the outputs of later runs
+
+        :param key str: key of the command, see get_key
+        :param output str: output path of the command
+        """
+        stored = self.get_stored_path(key, output)
+
+        with self._lock:
+            if stored in self._entries or not os.path.isfile(output):
+                return
+
+            size = os.path.getsize(output)
+            if self.max_bytes is not None:
+                if size > self.max_bytes:
+                    return
+                self._evict(self.max_bytes - size)
+
+        # copied rather than linked, the output may be written again later
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        tmp = f"{stored}.{os.getpid()}.partial"
+        shutil.copyfile(output, tmp)
+        os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(tmp, stored)
+
+        with self._lock:
+            self._entries[stored] = size
+            self._size += size
+
+    def get_size(self) -> int:
+        return self._size
+
+    def _evict(self, target: int):
+        # caller holds the lock
+        for stored in list(self._entries):
+            if self._size <= target:
+                break
+
+            self._size -= self._entries.pop(stored)
+            if os.path.isfile(stored):
+                os.remove(stored)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import itertools
+import os
+from typing import Any
+
+from .node import Node
+
+# operator member variable modified for each type of variable
+VAR_TYPES = {
+    "ops": "op_name",
+    "params": "op_param",
+    "inputs": "op_input_file",
+    "out_format": "out_name_format",
+}
+
+
+class Dimension:
+    name: str
+    values: list
+    op: Any
+    attr: str
+
+    def __init__(self, name, values, op, attr):
+        """
+        A named list of values applied to one member variable of an operator
+
+        :param name str: name of the dimension, usable in out_name_format
+        :param values list: values of the dimension
+        :param op Operator: operator to modify
+        :param attr str: member variable of op to set to each value
+        """
+        self.name = name
+        self.values = values
+        self.op = op
+        self.attr = attr
+
+
+class Sweep:
+    groups: list[list[Dimension]]
+
+    def __init__(self):
+        """
+        Symbolic parameter sweep over operators of a graph. Groups of zipped
+        dimensions are expanded as a cartesian product only when commands are
+        generated, nothing is copied.
+        """
+        self.groups = []
+
+    def __len__(self):
+        count = 1
+        for g in self.groups:
+            count *= len(g[0].values)
+
+        return count
+
+    def find_group(self, name: str) -> list[Dimension] | None:
+        for g in self.groups:
+            for d in g:
+                if d.name == name:
+                    return g
+
+        return None
+
+    def add(self, op, type: str, values: list | Node, name="", zip_with=None):
+        """
+        Add a dimension to the sweep
+
+        :param op Operator: operator to modify
+        :param type str: variable to modify ("ops", "params", "inputs" or
+        "out_format")
+        :param values list|Node: values of the dimension, a node's files for
+        "inputs"
+        :param name str: name of the dimension, defaults to the variable name
+        :param zip_with str: name of a dimension to zip with instead of
+        creating a new cartesian dimension, values must have the same length
+        """
+        if type not in VAR_TYPES:
+            print("Unknown var", type)
+            return
+
+        if isinstance(values, Node):
+            values = [os.path.join(values.get_root_path(), f) for f in values.files]
+
+        if name == "":
+            name = f"{type}{len(self.groups)}"
+
+        d = Dimension(name, list(values), op, VAR_TYPES[type])
+
+        if zip_with is None:
+            self.groups.append([d])
+            return
+
+        group = self.find_group(zip_with)
+        if group is None:
+            self.groups.append([d])
+        elif len(group[0].values) != len(d.values):
+            print("Sweep zip failed: dimensions have different lengths")
+        else:
+            group.append(d)
+
+    def points(self):
+        """
+        :return: generator of the value index of each group for every point in
+        the sweep
+        """
+        return itertools.product(*[range(len(g[0].values)) for g in self.groups])
+
+    @contextmanager
+    def applied(self, point: tuple):
+        """
+        Set the operator variables of a point in the sweep, restored on exit
+
+        :param point tuple: value index of each group
+        :return: the value of each named dimension
+        :rtype: dict
+        """
+        saved = []
+        named = {}
+
+        for g, i in zip(self.groups, point):
+            for d in g:
+                saved.append((d.op, d.attr, getattr(d.op, d.attr)))
+                setattr(d.op, d.attr, d.values[i])
+                named[d.name] = d.values[i]
+
+        try:
+            yield named
+        finally:
+            for op, attr, v in reversed(saved):
+                setattr(op, attr, v)
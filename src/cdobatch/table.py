@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import csv
+
+import numpy as np
+
+from .log import log
+
+
+def to_table_command(c: dict, tab: str) -> dict:
+    """
+    :param c dict: cdo command dictionary
+    :param tab str: outputtab keys, e.g. "date,value"
+    :return: command printing the result of c as a table with outputtab
+    instead of writing an output file
+    :rtype: dict
+    """
+    op = f"-{c['func_name']}"
+    if c["param"] != "":
+        op += f",{c['param']}"
+
+    t = dict(c)
+    t["func_name"] = "outputtab"
+    t["param"] = tab
+    t["input"] = f"{op} {c['input']}"
+    t["output"] = ""
+    t["reduced"] = c["func_name"]
+
+    return t
+
+
+def get_tokens(lines) -> list[str]:
+    """
+    :param lines list[str]: text printed by cdo
+    :return: whitespace separated values, header lines starting with "#" are
+    skipped
+    :rtype: list[str]
+    """
+    if isinstance(lines, str):
+        lines = [lines]
+
+    return [
+        t for line in lines if not line.lstrip().startswith("#") for t in line.split()
+    ]
+
+
+def parse_column(values: list[str]) -> np.ndarray:
+    """
+    :param values list[str]: text values of a column
+    :return: the values as integers if all are, else as floats if all are,
+    else as strings
+    :rtype: np.ndarray
+    """
+    text = np.array(values, dtype=str)
+
+    for dtype in [np.int64, np.float64]:
+        try:
+            return text.astype(dtype)
+        except ValueError:
+            pass
+
+    return text
+
+
+def results_table(
+    results: list, columns: list[str] | None = None, keys: list[str] | None = None
+) -> np.ndarray:
+    """
+    Collect the printed output of commands into one table. The values each
+    command prints are split into rows of len(columns) values, each row is
+    keyed by the input files, the operator and the operator variables of its
+    command. Failed commands and commands without results are left out.
+
+    :param results list[CdoResult]: results of commands printing values,
+    e.g. showyear, ntime or outputtab
+    :param columns list[str]: names of the values in a row, defaults to a
+    single "value" column
+    :param keys list[str]: operator variables to key rows by, defaults to all
+    variables of the commands
+    :return: structured array with columns file, operator, the keys and the
+    value columns
+    :rtype: np.ndarray
+    """
+    if columns is None:
+        columns = ["value"]
+
+    results = [r for r in results if r is not None and r.error is None]
+
+    if keys is None:
+        keys = []
+        for r in results:
+            keys.extend(k for k in r.vars if k not in keys)
+
+    width = len(columns)
+    text = {n: [] for n in ["file", "operator"] + keys + columns}
+    skipped = 0
+
+    for r in results:
+        tokens = get_tokens(r.result)
+        if len(tokens) % width != 0:
+            skipped += 1
+            continue
+
+        rows = len(tokens) // width
+
+        text["file"].extend([" ".join(r.cmd["files"])] * rows)
+        text["operator"].extend([r.cmd.get("reduced", r.cmd["func_name"])] * rows)
+        for k in keys:
+            text[k].extend([str(r.vars.get(k, ""))] * rows)
+        for i, n in enumerate(columns):
+            text[n].extend(tokens[i::width])
+
+    if skipped > 0:
+        log(f"{skipped} results don't have a multiple of {width} values, skipped")
+
+    arrays = {}
+    for n, values in text.items():
+        if n in ["file", "operator"]:
+            arrays[n] = np.array(values, dtype=str)
+        else:
+            arrays[n] = parse_column(values)
+
+    table = np.empty(len(text["file"]), dtype=[(n, a.dtype) for n, a in arrays.items()])
+    for n, a in arrays.items():
+        table[n] = a
+
+    return table
+
+
+def write_csv(table: np.ndarray, path: str):
+    """
+    :param table np.ndarray: structured array, see results_table
+    :param path str: path of the CSV file
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(table.dtype.names)
+        writer.writerows(table.tolist())
+
+
+def write_parquet(table: np.ndarray, path: str):
+    """
+    Needs pyarrow
+
+    :param table np.ndarray: structured array, see results_table
+    :param path str: path of the Parquet file
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    pq.write_table(pa.table({n: table[n] for n in table.dtype.names}), path)
+
+
+def write_table(table: np.ndarray, path: str):
+    """
+    Write a table as Parquet if path ends in .parquet, otherwise as CSV
+
+    :param table np.ndarray: structured array, see results_table
+    :param path str: path of the table
+    """
+    if path.endswith(".parquet"):
+        write_parquet(table, path)
+    else:
+        write_csv(table, path)
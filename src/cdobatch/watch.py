@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from typing import TYPE_CHECKING, Callable
+
+from .log import log
+from .node import Node
+
+if TYPE_CHECKING:
+    import threading
+
+    from cdo import Cdo
+
+    from .operator import Operator
+
+# inotify event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# wd, mask, cookie, len, followed by len bytes of name
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    Watches a directory tree with Linux inotify through libc. Files are
+    reported once written and closed or moved into the tree, directories
+    created later are watched too.
+    """
+
+    fd: int
+    dirs: dict
+
+    def __init__(self, root: str):
+        """
+        :param root str: directory to watch, with all its subdirectories
+        :raises OSError: if inotify isn't available
+        """
+        name = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(name, use_errno=True)
+
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+        self.root = root
+        self.dirs = {}
+        self.add_tree(root)
+
+    def add_tree(self, path: str) -> list[str]:
+        """
+        Watch a directory and its subdirectories
+
+        :param path str: directory to watch
+        :return: files already in the directories, they may have been written
+        before the watches were added
+        :rtype: list[str]
+        """
+        files = []
+
+        for root, _, names in os.walk(path):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                log(f"can't watch {root}: {os.strerror(ctypes.get_errno())}")
+                continue
+
+            self.dirs[wd] = root
+            files.extend(os.path.join(root, n) for n in names)
+
+        return files
+
+    def read(self, timeout: float) -> tuple[list[str], bool]:
+        """
+        :param timeout float: seconds to wait for the first event
+        :return: paths of files written or moved in, and True if events were
+        lost because the kernel queue overflowed
+        :rtype: tuple[list[str], bool]
+        """
+        paths = []
+        overflow = False
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if len(ready) == 0:
+            return paths, overflow
+
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, size = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size
+                name = os.fsdecode(data[pos : pos + size].rstrip(b"\0"))
+                pos += size
+
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+
+                if wd not in self.dirs:
+                    continue
+
+                path = os.path.join(self.dirs[wd], name)
+
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        paths.extend(self.add_tree(path))
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    paths.append(path)
+
+        return paths, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollWatcher:
+    """
+    Watches a directory tree by comparing the size and modification time of
+    its files, for systems without inotify
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root str: directory to watch
+        """
+        self.root = root
+        self.seen = self.scan()
+
+    def scan(self) -> dict:
+        seen = {}
+        for root, _, names in os.walk(self.root):
+            for n in names:
+                p = os.path.join(root, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                seen[p] = (st.st_size, st.st_mtime_ns)
+
+        return seen
+
+    def read(self, timeout: float) -> tuple[list[str], bool]:
+        time.sleep(timeout)
+
+        seen = self.scan()
+        paths = [p for p, s in seen.items() if self.seen.get(p) != s]
+        self.seen = seen
+
+        return paths, False
+
+    def close(self):
+        pass
+
+
+def get_watcher(root: str) -> Inotify | PollWatcher:
+    """
+    :param root str: directory to watch
+    :return: an inotify watcher, or a polling one if inotify isn't available
+    :rtype: Inotify | PollWatcher
+    """
+    try:
+        return Inotify(root)
+    except OSError as e:
+        log(f"inotify not available ({e}), polling {root}")
+        return PollWatcher(root)
+
+
+def watch(
+    op: Operator,
+    node: Node,
+    cdo: Cdo,
+    debounce=2.0,
+    max_delay=60.0,
+    poll=1.0,
+    batches: int | None = None,
+    stop: threading.Event | None = None,
+    on_batch: Callable[[list[str], list], None] | None = None,
+    config: dict | None = None,
+    **kwargs,
+) -> int:
+    """
+    Process files as they are written into the directory of a node. New and
+    changed .nc files are collected until no more arrive for debounce
+    seconds, then added to the node and the operator is configured and run on
+    just these files, so each burst of files runs with full parallelism.
+    Files belonging to children of the node are ignored.
+
+    :param op Operator: root operator to run on changed files
+    :param node Node: node whose directory is watched
+    :param cdo Cdo: cdo instance to use
+    :param debounce float: seconds without new files before a batch runs
+    :param max_delay float: seconds after the first file of a batch it runs
+    at the latest, even if files keep arriving
+    :param poll float: seconds between checks of the stop event while idle
+    :param batches int: stop after this many batches, None runs until stop
+    is set
+    :param stop threading.Event: stops watching when set
+    :param on_batch Callable: called with the changed files and the results
+    of each batch
+    :param config dict: keyword arguments for configure (e.g. route_mode)
+    :param kwargs: execution options passed to run
+    :return: number of batches run
+    :rtype: int
+    """
+    if node.is_intermediate():
+        print("Can't watch intermediate node", node.name)
+        return 0
+
+    if config is None:
+        config = {}
+
+    root = node.get_root_path()
+    children = [c.path.rstrip(os.sep) + os.sep for c in node.children]
+
+    def is_input(rel):
+        if not rel.endswith(".nc") or rel.startswith(".."):
+            return False
+        return not any(rel.startswith(c) for c in children)
+
+    def rescan():
+        # events were lost, pick up every file the node doesn't know yet
+        known = set(node.files)
+        found = []
+        for r, _, names in os.walk(root):
+            for n in names:
+                rel = os.path.relpath(os.path.join(r, n), root)
+                if is_input(rel) and rel not in known:
+                    found.append(rel)
+        return found
+
+    def run_batch(files):
+        known = set(node.files)
+        node.files.extend(f for f in files if f not in known)
+
+        if node.facets is not None:
+            node.index_facets(node.facets.template, *node.facets.time_facets)
+
+        changed = Node(f"{node.name}_changed", "", files)
+        changed.parent = node
+
+        op.configure(changed, **config)
+        results = op.run(cdo, **kwargs)
+
+        log(f"ran {len(op.cdo_cmds)} commands for {len(files)} changed files")
+
+        if on_batch is not None:
+            on_batch(files, results)
+
+    watcher = get_watcher(root)
+    changed = {}
+    first = None
+    last = None
+    count = 0
+
+    try:
+        while stop is None or not stop.is_set():
+            timeout = poll
+            if first is not None:
+                now = time.monotonic()
+                timeout = min(debounce - (now - last), max_delay - (now - first))
+                timeout = max(0.0, timeout)
+
+            paths, overflow = watcher.read(timeout)
+
+            rels = [os.path.relpath(p, root) for p in paths]
+            if overflow:
+                rels.extend(rescan())
+
+            rels = [r for r in rels if is_input(r)]
+            if len(rels) > 0:
+                last = time.monotonic()
+                if first is None:
+                    first = last
+                changed.update(dict.fromkeys(rels))
+
+            if first is None:
+                continue
+
+            now = time.monotonic()
+            if now - last >= debounce or now - first >= max_delay:
+                run_batch(list(changed))
+                count += 1
+
+                changed = {}
+                first = None
+
+                if batches is not None and count >= batches:
+                    break
+    finally:
+        watcher.close()
+
+    return count
@@ -0,0 +1,544 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from .executor import classify_failure, DETERMINISTIC, TRANSIENT
+from .operator import Operator, CdoResult, writes_prefix
+from .runner import get_partial_path
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    cmd TEXT NOT NULL,
+    state TEXT NOT NULL,
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    failure TEXT,
+    errmsg TEXT,
+    result TEXT,
+    deps TEXT,
+    release TEXT
+)
+"""
+
+# columns added since the first version of the schema
+COLUMNS = {"deps": "TEXT", "release": "TEXT"}
+
+
+class WorkQueue:
+    path: str
+    lease: float
+    retries: int
+
+    def __init__(self, path, lease=600.0, retries=2):
+        """
+        Work queue of cdo commands backed by a SQLite database on a filesystem
+        shared by all workers. Workers claim commands with a lease, commands
+        whose lease expires (e.g. the worker's node died) are handed out again.
+
+        :param path str: path to the queue database
+        :param lease float: seconds a claimed command belongs to a worker
+        before it can be claimed again
+        :param retries int: number of times to requeue commands failing with
+        transient errors
+        """
+        self.path = path
+        self.lease = lease
+        self.retries = retries
+
+        parent = os.path.dirname(path)
+        if parent != "":
+            os.makedirs(parent, exist_ok=True)
+
+        with self._connect() as db:
+            db.execute(SCHEMA)
+
+            existing = [r[1] for r in db.execute("PRAGMA table_info(commands)")]
+            for name, kind in COLUMNS.items():
+                if name not in existing:
+                    db.execute(f"ALTER TABLE commands ADD COLUMN {name} {kind}")
+
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS commands_release "
+                "ON commands (release, state)"
+            )
+
+    def _connect(self):
+        # autocommit, transactions are started explicitly
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        return _Connection(db)
+
+    def get_chunk_dir(self) -> str:
+        """
+        :return: directory next to the queue that time chunks are written to,
+        so a merge can read chunks written on other nodes
+        :rtype: str
+        """
+        return os.path.join(os.path.dirname(os.path.abspath(self.path)), "chunks")
+
+    def prepare(self, op: Operator) -> list[dict]:
+        """
+        :param op Operator: a configured operator
+        :return: copies of the commands of the operator as run by workers.
+        Time chunks are moved to get_chunk_dir and know the key of their
+        merge, commands carry their ResultStore key and the intermediate input
+        node they release.
+        :rtype: list[dict]
+        """
+        chunk_dir = self.get_chunk_dir()
+        moved = {
+            c["output"]: os.path.join(chunk_dir, os.path.basename(c["output"]))
+            for c in op.cdo_cmds
+            if "chunk_of" in c
+        }
+
+        release = None
+        if op.op_in_node is not None and op.op_in_node.is_intermediate():
+            release = op.op_in_node.get_root_path()
+
+        cmds = []
+        for c in op.cdo_cmds:
+            c = dict(c)
+
+            if c["output"] in moved:
+                c["output"] = moved[c["output"]]
+            if "chunks" in c:
+                c["chunks"] = [moved.get(f, f) for f in c["chunks"]]
+                c["files"] = [moved.get(f, f) for f in c["files"]]
+                c["input"] = " ".join(moved.get(t, t) for t in c["input"].split(" "))
+
+            key = op.op_store_keys.get(c["output"])
+            if key is not None:
+                c["store"] = [op.op_store.store_dir, key]
+
+            if release is not None:
+                c["release"] = release
+
+            cmds.append(c)
+
+        merges = {c["output"]: op.make_cdo_cmd_str(c) for c in cmds if "chunks" in c}
+        for c in cmds:
+            if "chunk_of" in c:
+                c["merge_key"] = merges.get(c["chunk_of"])
+
+        return cmds
+
+    def publish(self, op: Operator) -> int:
+        """
+        Add the configured commands of an operator to the queue. Commands
+        already in the queue are not added again. Commands reading the output
+        of another command (e.g. the merge of time chunks) are only claimed
+        once it is done.
+
+        :param op Operator: a configured operator
+        :return: number of new commands
+        :rtype: int
+        """
+        cmds = self.prepare(op)
+
+        writers = {
+            c["output"]: op.make_cdo_cmd_str(c) for c in cmds if c["output"] != ""
+        }
+
+        rows = []
+        for c in cmds:
+            deps = [writers[f] for f in c.get("files", []) if f in writers]
+            rows.append(
+                (
+                    op.make_cdo_cmd_str(c),
+                    json.dumps(c),
+                    PENDING,
+                    json.dumps(deps) if len(deps) > 0 else None,
+                    c.get("release"),
+                )
+            )
+
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            before = db.execute("SELECT COUNT(*) FROM commands").fetchone()[0]
+            db.executemany(
+                "INSERT OR IGNORE INTO commands (key, cmd, state, deps, release) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            after = db.execute("SELECT COUNT(*) FROM commands").fetchone()[0]
+            db.execute("COMMIT")
+
+        return after - before
+
+    def claim(self, worker: str, count=1) -> list[tuple[int, dict]]:
+        """
+        Claim pending commands, or running commands with an expired lease.
+        Commands waiting for other commands are skipped until those are done.
+
+        :param worker str: id of the claiming worker
+        :param count int: maximum number of commands to claim
+        :return: ids and command dictionaries of the claimed commands
+        :rtype: list[tuple[int, dict]]
+        """
+        now = time.time()
+
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT id, cmd FROM commands c "
+                "WHERE (state = ? OR (state = ? AND lease_expires < ?)) "
+                "AND NOT EXISTS (SELECT 1 FROM json_each(COALESCE(c.deps, '[]')) j "
+                "JOIN commands d ON d.key = j.value WHERE d.state != ?) "
+                "ORDER BY id LIMIT ?",
+                (PENDING, RUNNING, now, DONE, count),
+            ).fetchall()
+
+            db.executemany(
+                "UPDATE commands SET state = ?, owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                [(RUNNING, worker, now + self.lease, r[0]) for r in rows],
+            )
+            db.execute("COMMIT")
+
+        return [(r[0], json.loads(r[1])) for r in rows]
+
+    def renew(self, worker: str, ids: list[int]):
+        """
+        Extend the lease on commands still being run by a worker
+        """
+        expires = time.time() + self.lease
+
+        with self._connect() as db:
+            db.executemany(
+                "UPDATE commands SET lease_expires = ? "
+                "WHERE id = ? AND owner = ? AND state = ?",
+                [(expires, i, worker, RUNNING) for i in ids],
+            )
+
+    def complete(self, worker: str, cmd_id: int, result: CdoResult) -> str | None:
+        """
+        Record the result of a command. Transient failures go back to the
+        queue until they run out of retries, commands waiting for a command
+        which failed fail with it. Results from workers which lost their lease
+        are dropped.
+
+        :param worker str: id of the worker which ran the command
+        :param cmd_id int: id of the command
+        :param result CdoResult: result of running the command
+        :return: the state recorded, None if the result was dropped
+        :rtype: str | None
+        """
+        state = DONE
+        if result.error is not None:
+            state = FAILED
+
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT attempts, key FROM commands "
+                "WHERE id = ? AND owner = ? AND state = ?",
+                (cmd_id, worker, RUNNING),
+            ).fetchone()
+
+            if row is None:
+                db.execute("COMMIT")
+                return None
+
+            if state == FAILED and result.failure == TRANSIENT:
+                if row[0] <= self.retries:
+                    state = PENDING
+
+            db.execute(
+                "UPDATE commands SET state = ?, owner = NULL, lease_expires = NULL, "
+                "failure = ?, errmsg = ?, result = ? WHERE id = ?",
+                (
+                    state,
+                    result.failure,
+                    result.errmsg,
+                    _dump_result(result.result),
+                    cmd_id,
+                ),
+            )
+
+            if state == FAILED:
+                self._fail_dependents(db, row[1])
+            db.execute("COMMIT")
+
+        return state
+
+    def _fail_dependents(self, db, key: str):
+        # caller holds the transaction
+        failed = [key]
+        while len(failed) > 0:
+            k = failed.pop()
+            rows = db.execute(
+                "SELECT c.id, c.key FROM commands c, "
+                "json_each(COALESCE(c.deps, '[]')) j WHERE j.value = ? AND c.state = ?",
+                (k, PENDING),
+            ).fetchall()
+
+            db.executemany(
+                "UPDATE commands SET state = ?, failure = ?, errmsg = ? WHERE id = ?",
+                [
+                    (FAILED, DETERMINISTIC, f"dependency failed: {k}", r[0])
+                    for r in rows
+                ],
+            )
+            failed.extend(r[1] for r in rows)
+
+    def get(self, key: str) -> tuple[str, dict] | None:
+        """
+        :param key str: command line of a command
+        :return: state and command dictionary of the command, None if it isn't
+        in the queue
+        :rtype: tuple[str, dict] | None
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT state, cmd FROM commands WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def is_released(self, path: str) -> bool:
+        """
+        :param path str: intermediate input directory of published commands
+        :return: True once every command reading it is done
+        :rtype: bool
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT COUNT(*) FROM commands WHERE release = ? AND state != ?",
+                (path, DONE),
+            ).fetchone()
+
+        return row[0] == 0
+
+    def status(self) -> dict:
+        """
+        :return: number of commands in each state
+        :rtype: dict
+        """
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+
+        with self._connect() as db:
+            for state, count in db.execute(
+                "SELECT state, COUNT(*) FROM commands GROUP BY state"
+            ):
+                counts[state] = count
+
+        return counts
+
+    def results(self, state=None) -> list[dict]:
+        """
+        :param state str: only return commands in this state
+        :return: the recorded state of each command in the queue
+        :rtype: list[dict]
+        """
+        query = (
+            "SELECT key, state, owner, attempts, failure, errmsg, result "
+            "FROM commands"
+        )
+        args = ()
+        if state is not None:
+            query += " WHERE state = ?"
+            args = (state,)
+
+        with self._connect() as db:
+            rows = db.execute(query + " ORDER BY id", args).fetchall()
+
+        names = ["cmd", "state", "owner", "attempts", "failure", "errmsg", "result"]
+        return [dict(zip(names, r)) for r in rows]
+
+
+class _Connection:
+    """
+    Closes the sqlite connection on exit
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, *args):
+        if self.db.in_transaction:
+            self.db.rollback()
+        self.db.close()
+
+
+def _dump_result(result: Any) -> str:
+    try:
+        return json.dumps(result)
+    except TypeError:
+        return json.dumps(str(result))
+
+
+def run_claimed(runner: Operator, cdo: Any, c: dict, dirs: set) -> CdoResult:
+    """
+    Run a claimed command, creating its output directory and writing its
+    output through a temporary name, so a command rerun after its lease
+    expired never leaves a partial output
+
+    :param runner Operator: operator to run the command with
+    :param cdo Cdo: cdo instance to use
+    :param c dict: cdo command dictionary
+    :param dirs set: output directories already created by this worker
+    :return: result of the command
+    :rtype: CdoResult
+    """
+    if c["output"] == "":
+        return runner.run_command(cdo, c)
+
+    d = os.path.dirname(c["output"])
+    if d != "" and d not in dirs:
+        os.makedirs(d, exist_ok=True)
+        dirs.add(d)
+
+    if writes_prefix(c):
+        # the output names the files written, there is no single file to move
+        return runner.run_command(cdo, c)
+
+    partial = get_partial_path(c["output"])
+    r = runner.run_command(cdo, c, None, partial)
+
+    if r.error is None:
+        try:
+            if os.path.exists(partial):
+                os.replace(partial, c["output"])
+            r.result = c["output"]
+        except OSError as e:
+            r.error = e
+            r.errmsg = str(e)
+
+    if r.error is not None and os.path.isfile(partial):
+        os.remove(partial)
+
+    return r
+
+
+def finish_claimed(queue: WorkQueue, c: dict, state: str, stores: dict):
+    """
+    Clean up after a command reached a final state: remove time chunks no
+    longer needed, add the output to its ResultStore and release the
+    intermediate input once every command reading it is done
+
+    :param queue WorkQueue: the shared queue
+    :param c dict: cdo command dictionary
+    :param state str: state recorded for the command
+    :param stores dict: ResultStores by directory opened by this worker
+    """
+    # chunks are removed once merged, or by the chunk which failed the merge
+    chunks = c.get("chunks", [])
+    if c.get("merge_key") is not None:
+        merge = queue.get(c["merge_key"])
+        if merge is not None and merge[0] == FAILED:
+            chunks = merge[1]["chunks"]
+
+    for f in chunks:
+        if os.path.isfile(f):
+            os.remove(f)
+
+    if state != DONE:
+        return
+
+    if "store" in c:
+        from .store import ResultStore
+
+        store_dir, key = c["store"]
+        if store_dir not in stores:
+            stores[store_dir] = ResultStore(store_dir)
+        stores[store_dir].add(key, c["output"])
+
+    if "release" in c and queue.is_released(c["release"]):
+        shutil.rmtree(c["release"], ignore_errors=True)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_worker(
+    queue: WorkQueue,
+    cdo: Any,
+    worker: str | None = None,
+    batch=1,
+    poll=5.0,
+    exit_when_empty=True,
+) -> int:
+    """
+    Claim and run commands from a work queue until it is empty
+
+    :param queue WorkQueue: the shared queue
+    :param cdo Cdo: cdo instance to use
+    :param worker str: id of this worker, defaults to host:pid
+    :param batch int: number of commands to claim at once
+    :param poll float: seconds to wait before checking an empty queue again
+    :param exit_when_empty bool: stop once nothing is pending or running,
+    otherwise keep polling for new commands
+    :return: number of commands run by this worker
+    :rtype: int
+    """
+    if worker is None:
+        worker = default_worker_id()
+
+    runner = Operator()
+    claimed = []
+    stop = threading.Event()
+
+    dirs = set()
+    stores = {}
+
+    def heartbeat():
+        while not stop.wait(queue.lease / 3):
+            ids = list(claimed)
+            if len(ids) > 0:
+                queue.renew(worker, ids)
+
+    t = threading.Thread(target=heartbeat, daemon=True)
+    t.start()
+
+    count = 0
+    try:
+        while True:
+            work = queue.claim(worker, batch)
+
+            if len(work) == 0:
+                s = queue.status()
+                if exit_when_empty and s[PENDING] == 0 and s[RUNNING] == 0:
+                    break
+
+                # other workers may still requeue transient failures
+                time.sleep(poll)
+                continue
+
+            claimed.extend(i for i, _ in work)
+
+            for cmd_id, c in work:
+                r = run_claimed(runner, cdo, c, dirs)
+                if r.error is not None:
+                    r.failure = classify_failure(r.error, r.stdout)
+
+                state = queue.complete(worker, cmd_id, r)
+                claimed.remove(cmd_id)
+                count += 1
+
+                if state in [DONE, FAILED]:
+                    finish_claimed(queue, c, state, stores)
+    finally:
+        stop.set()
+
+    return count
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import defaultdict
+
+import pytest
+from cdo import CDOException
+
+
+class FakeCdo:
+    """
+    Stands in for Cdo in tests. Every operator call is recorded and can be
+    made to fail, take time or write its output.
+    """
+
+    def __init__(
+        self,
+        fail=None,
+        failures=None,
+        write=None,
+        result=None,
+        delay=0.0,
+        echo=False,
+        operators=None,
+    ):
+        """
+        :param fail dict: message to fail with, by a string in the input
+        :param failures dict: messages to fail the first calls with an input
+        with, by input, before succeeding
+        :param write str: text written to the output, formatted with the
+        keyword arguments of the call, e.g. "{input}"
+        :param result Callable: result of a call given the operator name and
+        keyword arguments, defaults to the output path, or [input] without one
+        :param delay float: seconds each call takes
+        :param echo bool: print the input of each call like cdo output
+        :param operators list[str]: operators cdo has, others raise
+        AttributeError. All operators if None.
+        """
+        self.fail = fail or {}
+        self.failures = failures or {}
+        self.write = write
+        self.result = result
+        self.delay = delay
+        self.echo = echo
+        self.operators = operators
+
+        # operator and input, positional and keyword arguments, thread and
+        # input, and input files with their contents of each call
+        self.calls = []
+        self.args = []
+        self.threads = []
+        self.reads = []
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith("__") or (
+            self.operators is not None and name not in self.operators
+        ):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            i = kwargs.get("input", "")
+            if self.echo:
+                print("running", i)
+            time.sleep(self.delay)
+
+            with self.lock:
+                self.calls.append((name, i))
+                self.args.append((name, args, kwargs))
+                self.threads.append((threading.get_ident(), i))
+
+                msgs = self.failures.get(i, [])
+                msg = msgs.pop(0) if len(msgs) > 0 else None
+
+            if msg is None:
+                msg = next((m for s, m in self.fail.items() if s in i), None)
+
+            if msg is not None:
+                print("STDERR:" + msg)
+                raise CDOException("", msg, 1)
+
+            if os.path.isfile(i):
+                with open(i) as f:
+                    self.reads.append((i, f.read()))
+
+            if self.write is not None and "output" in kwargs:
+                with open(kwargs["output"], "w") as f:
+                    f.write(self.write.format_map(defaultdict(str, kwargs)))
+
+            if self.result is not None:
+                return self.result(name, kwargs)
+            if "output" in kwargs:
+                return kwargs["output"]
+            return [i]
+
+        return call
+
+
+@pytest.fixture
+def make_cdo():
+    """
+    :return: FakeCdo, called with its options to make a fake Cdo
+    """
+    return FakeCdo
@@ -0,0 +1,97 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from cdobatch.autotune import Autotuner, read_cpu_times
+from cdobatch.executor import execute
+
+
+def test_read_cpu_times(tmp_path):
+    stat = tmp_path / "stat"
+    stat.write_text("cpu  100 0 50 800 40 5 5 0 0 0\ncpu0 1 2 3 4 5\n")
+
+    assert read_cpu_times(str(stat)) == (40, 1000)
+    assert read_cpu_times(str(tmp_path / "missing")) is None
+
+
+def test_adjust_converges(tmp_path):
+    path = str(tmp_path / "levels.json")
+    tuner = Autotuner(path, max_workers=64, start=2)
+
+    def rate(level):
+        # storage saturates at 8 commands, more only add contention
+        return min(level, 8) - 0.2 * max(0, level - 8)
+
+    for _ in range(20):
+        level = tuner.limit({"func_name": "selname"})
+        tuner.adjust("selname", rate(level))
+
+    assert tuner.best_levels() == {"selname": 8}
+    assert 6 <= tuner.limit({"func_name": "selname"}) <= 10
+
+    tuner.save()
+    assert Autotuner(path).limit({"func_name": "selname"}) == 8
+
+
+def test_adjust_iowait():
+    tuner = Autotuner(max_workers=64, start=8)
+
+    # throughput still rising but the disks are saturated
+    tuner.adjust("selname", 1.0, iowait=0.1)
+    assert tuner.limit({"func_name": "selname"}) == 12
+    tuner.adjust("selname", 2.0, iowait=0.6)
+    assert tuner.limit({"func_name": "selname"}) == 8
+
+
+def test_execute_concurrency():
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def run_one(c, inputs=None):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return SimpleNamespace(error=None)
+
+    cmds = [{"func_name": "selname"} for _ in range(8)]
+    execute(cmds, run_one, workers=8, concurrency=lambda c: 2)
+
+    assert running[1] == 2
+
+
+def test_execute_concurrency_per_operator():
+    lock = threading.Lock()
+    running = {}
+    peak = {}
+
+    def run_one(c, inputs=None):
+        name = c["func_name"]
+        with lock:
+            running[name] = running.get(name, 0) + 1
+            peak[name] = max(peak.get(name, 0), running[name])
+        time.sleep(0.01)
+        with lock:
+            running[name] -= 1
+        return SimpleNamespace(error=None)
+
+    levels = {"selname": 1, "remapbil": 3}
+    cmds = [{"func_name": "selname"} for _ in range(6)]
+    cmds += [{"func_name": "remapbil"} for _ in range(6)]
+    r = execute(cmds, run_one, workers=4, concurrency=lambda c: levels[c["func_name"]])
+
+    # queued selname commands don't hold back remapbil
+    assert all(x is not None for x in r)
+    assert peak == {"selname": 1, "remapbil": 3}
+
+
+def test_tune_piped_operators():
+    tuner = Autotuner(max_workers=8, start=2)
+    c = {"func_name": "yearmean", "input": "-remapbil,r360x180 in.nc"}
+
+    assert tuner.get_name(c) == "yearmean remapbil"
+    tuner.adjust("yearmean remapbil", 1.0)
+    assert tuner.limit(c) == 3
+    assert tuner.limit({"func_name": "yearmean", "input": "in.nc"}) == 2
@@ -0,0 +1,112 @@
+import os
+import stat
+
+from cdobatch.batch import BatchScript, batch_groups, command_argv
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+
+
+class FakeCdo:
+    # stands in for Cdo, only the binary is used when batching
+    def __init__(self, path):
+        self.CDO = path
+        self.silent = False
+
+
+def fake_cdo(tmp_path):
+    # echoes its arguments, writes the last one if it ends in .nc and fails
+    # on inputs named bad*
+    path = tmp_path / "cdo"
+    path.write_text(
+        "#!/bin/sh\n"
+        'echo "$@"\n'
+        'case "$*" in *bad*) echo "cdo: Variable not found!"; exit 1;; esac\n'
+        'for a; do last="$a"; done\n'
+        'case "$last" in *.out.nc) echo "$*" > "$last";; esac\n'
+    )
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def make_cmd(input, output=""):
+    return {
+        "func_name": "showyear",
+        "param": "",
+        "input": input,
+        "output": output,
+        "options": "",
+        "files": [input],
+        "vars": {},
+    }
+
+
+def test_batch_groups(tmp_path):
+    cmds = [make_cmd(f"f{i}.nc") for i in range(5)]
+    sizes = {"f0.nc": 1, "f1.nc": 1, "f2.nc": 100, "f3.nc": 1, "f4.nc": 1}
+
+    groups = batch_groups(cmds, range(5), 2, 10, sizes)
+
+    assert groups == [[0, 1], [2], [3, 4]]
+
+
+def test_command_argv():
+    c = make_cmd("-selname,tas in.nc", "out.nc")
+    c["options"] = "-f nc4"
+    c["param"] = "1"
+
+    argv = command_argv("cdo", c, {"in.nc": "/cache/in.nc"}, "/scratch/out.nc")
+
+    assert argv == [
+        "cdo",
+        "-f",
+        "nc4",
+        "-showyear,1",
+        "-selname,tas",
+        "/cache/in.nc",
+        "/scratch/out.nc",
+    ]
+
+
+def test_batch_script_split():
+    script = BatchScript([["a"], ["b"], ["c"]])
+    m = script.marker
+
+    text = (
+        f"\n{m} begin 0\nline 1\nline 2\n\n{m} end 0 0\n"
+        f"\n{m} begin 1\n\n{m} end 1 3\n"
+        f"\n{m} begin 2\npartial"
+    )
+
+    assert script.split(text) == [("line 1\nline 2\n", 0), ("", 3), ("partial", None)]
+
+
+def test_run_batch(tmp_path):
+    cdo = FakeCdo(fake_cdo(tmp_path))
+    op = Operator("showyear")
+
+    cmds = [make_cmd("a.nc"), make_cmd("bad.nc"), make_cmd("c.nc")]
+    results = op.run_batch(cdo, cmds)
+
+    assert results[0].error is None
+    assert results[0].result == ["-showyear a.nc"]
+    assert results[1].error is not None
+    assert results[1].errmsg == "cdo: Variable not found!"
+    assert results[2].result == ["-showyear c.nc"]
+    assert results[2].cmd_str == "cdo -showyear c.nc"
+
+
+def test_run_batched_outputs(tmp_path):
+    cdo = FakeCdo(fake_cdo(tmp_path))
+
+    inputs = Node("in", str(tmp_path / "in"), [f"f{i}.nc" for i in range(4)])
+    out = Node("out", str(tmp_path / "out"))
+
+    op = Operator("yearmean", out_node=out, out_name_format="{input_basename}.out.nc")
+    op.configure(inputs)
+    results = op.run(cdo, workers=2, batch=2)
+
+    assert [r.error for r in results] == [None] * 4
+    assert sorted(out.files) == [f"f{i}.out.nc" for i in range(4)]
+
+    with open(os.path.join(out.get_root_path(), "f3.out.nc")) as f:
+        assert f.read().strip() == op.make_cdo_cmd_str(op.cdo_cmds[3])[4:]
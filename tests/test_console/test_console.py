@@ -0,0 +1,76 @@
+import json
+import stat
+
+from cdobatch import catalog
+from cdobatch.catalog import CachedCdo
+from cdobatch.console import main
+
+
+def test_plan_and_status(tmp_path, capsys):
+    data = tmp_path / "data"
+    data.mkdir()
+    for f in ["a.nc", "b.nc"]:
+        (data / f).write_text("")
+
+    record = str(tmp_path / "rec.json")
+    plan = str(tmp_path / "plan.json.gz")
+    out = str(tmp_path / "out")
+
+    main(["index", str(data), "-o", record])
+    main(["plan", record, "root", plan, "yearmean", "selname,tas", "--out", out])
+    capsys.readouterr()
+
+    main(["dry-run", plan])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == [
+        f"cdo -yearmean -selname,tas {data}/a.nc {out}/a.nc",
+        f"cdo -yearmean -selname,tas {data}/b.nc {out}/b.nc",
+    ]
+
+    journal = tmp_path / "journal"
+    journal.write_text(json.dumps({"cmd": lines[1], "state": "failed"}) + "\n")
+
+    main(["status", plan, str(journal)])
+    assert capsys.readouterr().out == "2 commands: 0 done, 1 failed, 1 pending\n"
+
+
+def test_cached_catalog(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(catalog, "_catalogs", {})
+
+    # stands in for the cdo binary, counts how often it is probed
+    calls = tmp_path / "calls"
+    cdo = tmp_path / "cdo"
+    cdo.write_text(
+        "#!/bin/sh\n"
+        f'echo "$1" >> {calls}\n'
+        'case "$1" in\n'
+        '  --operators) echo "yearmean  Yearly mean  (1|1)";'
+        ' echo "showyear  Show years  (1|0)";;\n'
+        "  --config) echo '{}';;\n"
+        '  *) echo "Climate Data Operators version 2.0.5 (https://mpimet.mpg.de)";'
+        ' echo "Features: NC4 OpenMP";;\n'
+        "esac\n"
+    )
+    cdo.chmod(cdo.stat().st_mode | stat.S_IEXEC)
+
+    first = CachedCdo(str(cdo))
+    probes = len(calls.read_text().splitlines())
+
+    assert first.operators == {"yearmean": 1, "showyear": 0}
+    assert first.version() == "2.0.5"
+
+    # later instances, also in new processes, don't run the binary
+    monkeypatch.setattr(catalog, "_catalogs", {})
+    second = CachedCdo(str(cdo))
+    assert second.operators == first.operators
+    assert second.libs == first.libs
+    assert len(calls.read_text().splitlines()) == probes
+
+
+def test_unsupported_python_cdo(monkeypatch):
+    assert catalog.is_supported()
+
+    # a python-cdo release renaming the private methods CachedCdo replaces
+    monkeypatch.delattr(catalog.Cdo, "_Cdo__getConfig")
+    assert not catalog.is_supported()
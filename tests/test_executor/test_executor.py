@@ -0,0 +1,280 @@
+import os
+import time
+
+from cdo import CDOException
+
+from cdobatch.executor import (
+    classify_failure,
+    failure_report,
+    DependencyError,
+    TRANSIENT,
+    DETERMINISTIC,
+)
+from cdobatch.journal import Journal
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+
+
+def test_classify_failure():
+    e = CDOException("", "cdo    selname (Abort): Open failed on >x.nc<\n", 1)
+    assert classify_failure(e) == DETERMINISTIC
+
+    e = CDOException("", "Input/output error", 1)
+    assert classify_failure(e) == TRANSIENT
+
+    e = CDOException("", "NetCDF: HDF error", 1)
+    assert classify_failure(e) == TRANSIENT
+
+    e = CDOException("", "", -9)
+    assert classify_failure(e) == TRANSIENT
+
+
+def test_retry_transient(make_cdo):
+    n = Node("root", "in", ["a.nc", "b.nc", "c.nc"])
+    op = Operator("info")
+    op.configure(n)
+
+    cdo = make_cdo(
+        failures={
+            "in/a.nc": ["Input/output error", "Stale file handle"],
+            "in/b.nc": ["Variable not found!"],
+        }
+    )
+    r = op.run(cdo, workers=2, retries=3, backoff=0.01)
+
+    assert [x.result for x in r] == [["in/a.nc"], None, ["in/c.nc"]]
+
+    assert r[0].error is None
+    assert r[0].attempts == 3
+
+    # deterministic errors are not retried
+    assert r[1].failure == DETERMINISTIC
+    assert r[1].attempts == 1
+    assert cdo.calls.count(("info", "in/b.nc")) == 1
+
+
+def test_retry_exhausted(make_cdo):
+    n = Node("root", "in", ["a.nc"])
+    op = Operator("info")
+    op.configure(n)
+
+    cdo = make_cdo(failures={"in/a.nc": ["Input/output error"] * 5})
+    r = op.run(cdo, retries=2, backoff=0.01)
+
+    assert r[0].failure == TRANSIENT
+    assert r[0].attempts == 3
+
+
+def test_parallel_output_capture(make_cdo):
+    files = [f"f{i}.nc" for i in range(16)]
+    n = Node("root", "in", files)
+    op = Operator("info")
+    op.configure(n)
+
+    r = op.run(make_cdo(delay=0.01, echo=True), workers=8)
+
+    # each result only holds the output of its own command
+    for f, x in zip(files, r):
+        assert x.stdout == f"running in/{f}\n"
+
+
+def test_failure_report(make_cdo):
+    n = Node("root", "in", ["a.nc", "b.nc"])
+    root = Operator(out_node=Node("out", "out"))
+    op = Operator("sellonlatbox")
+    op.vectorize(["0,10,0,10", "10,20,0,10"], type="params", dir="vertical", root=root)
+    root.fork_apply(
+        "sellonlatbox", "op_out_name_vars", [{"shelf": "amery"}, {"shelf": "ross"}]
+    )
+    root.fork_apply(
+        "sellonlatbox", "out_name_format", ["{shelf}_{input_basename}.nc"] * 2
+    )
+    root.configure(n)
+
+    cdo = make_cdo(
+        failures={
+            "in/a.nc": ["Variable not found!"],
+            "in/b.nc": ["Variable not found!"],
+        }
+    )
+    r = root.run_real(cdo)
+
+    report = failure_report(r, key="shelf")
+    assert list(report.keys()) == ["amery"]
+    assert [e["vars"]["input_basename"] for e in report["amery"]] == ["a", "b"]
+    assert report["amery"][0]["failure"] == DETERMINISTIC
+    assert report["amery"][0]["errmsg"] == "STDERR:Variable not found!"
+    assert (
+        report["amery"][0]["cmd"]
+        == "cdo -sellonlatbox,0,10,0,10 in/a.nc out/amery_a.nc"
+    )
+
+
+def test_fused_fanout(tmp_path, make_cdo):
+    scratch = tmp_path / "shm"
+
+    root = Operator()
+    op = Operator("sellonlatbox")
+    op.vectorize(["1", "2", "3"], type="params", dir="vertical", root=root)
+    root.configure(Node("root", "in", ["a.nc", "b.nc"]))
+
+    cdo = make_cdo(write="{input}")
+    r = root.run(cdo, workers=2, fuse=True, scratch_dir=str(scratch))
+
+    # each input decoded once
+    copies = sorted(
+        (kw["input"], kw["options"]) for n, _, kw in cdo.args if n == "copy"
+    )
+    assert copies == [("in/a.nc", "-f nc2"), ("in/b.nc", "-f nc2")]
+
+    # every command read the staged copy of its own input
+    assert len(cdo.reads) == 6
+    for staged, original in cdo.reads:
+        assert staged.startswith(str(scratch))
+
+    assert sorted(o for _, o in cdo.reads) == ["in/a.nc"] * 3 + ["in/b.nc"] * 3
+
+    # results refer to the original commands, staged copies are removed
+    assert [x.cmd_str for x in r][:2] == [
+        "cdo -sellonlatbox,1 in/a.nc",
+        "cdo -sellonlatbox,1 in/b.nc",
+    ]
+    assert list(scratch.iterdir()) == []
+
+
+def test_fused_fanout_split(tmp_path, make_cdo):
+    scratch = tmp_path / "shm"
+
+    root = Operator()
+    op = Operator("sellonlatbox")
+    op.vectorize([str(i) for i in range(6)], type="params", dir="vertical", root=root)
+    root.configure(Node("root", "in", ["a.nc"]))
+
+    cdo = make_cdo(write="{input}")
+    r = root.run(cdo, workers=3, fuse=True, scratch_dir=str(scratch))
+
+    # the fan-out runs on several workers reading one decoded copy
+    assert all(x.error is None for x in r)
+    assert [kw["input"] for n, _, kw in cdo.args if n == "copy"] == ["in/a.nc"]
+    assert len(cdo.reads) == 6
+    assert len({staged for staged, _ in cdo.reads}) == 1
+    assert all(staged.startswith(str(scratch)) for staged, _ in cdo.reads)
+    assert list(scratch.iterdir()) == []
+
+
+def test_execute_deps():
+    from cdobatch.executor import execute
+
+    from types import SimpleNamespace
+
+    order = []
+
+    def run_one(c, inputs=None):
+        time.sleep(c["delay"])
+        order.append(c["name"])
+        return SimpleNamespace(name=c["name"], error=None)
+
+    cmds = [
+        {"name": "merge", "delay": 0.0},
+        {"name": "a", "delay": 0.02},
+        {"name": "b", "delay": 0.01},
+    ]
+    r = execute(cmds, run_one, workers=3, deps={0: [1, 2]})
+
+    assert [x.name for x in r] == ["merge", "a", "b"]
+    assert order == ["b", "a", "merge"]
+
+
+def test_time_chunks(tmp_path, make_cdo):
+    out = tmp_path / "out"
+    n = Node("root", "in", ["tas_1950-1959.nc", "pr.nc"])
+    n.index_facets("{var}_{start}-{end}.nc")
+
+    root = Operator("yearmean", out_node=Node("out", str(out)))
+    root.extend([Operator("selname", "tas")])
+    root.configure(n, time_chunks=4)
+
+    # pr.nc has no time span and is not split
+    assert [c["func_name"] for c in root.cdo_cmds] == ["yearmean"] * 3 + [
+        "mergetime",
+        "yearmean",
+    ]
+    assert (
+        root.cdo_cmds[0]["input"]
+        == "-selname,tas -selyear,1950/1953 in/tas_1950-1959.nc"
+    )
+    assert root.cdo_cmds[2]["input"].endswith("-selyear,1958/1959 in/tas_1950-1959.nc")
+
+    cdo = make_cdo(write="{input}")
+    r = root.run(cdo, workers=3)
+
+    assert all(x.error is None for x in r)
+    # the merge runs after all chunks
+    tas = [name for name, i in cdo.calls if "tas_" in i]
+    assert tas[-1] == "mergetime"
+
+    # chunks are removed once merged
+    for f in root.cdo_cmds[3]["chunks"]:
+        assert not os.path.exists(f)
+    assert os.path.isfile(root.cdo_cmds[3]["output"])
+
+
+def test_time_chunks_query(tmp_path, capsys, make_cdo):
+    n = Node("root", "in", ["pr_1950-1959.nc", "tas_1960-1969.nc"])
+    n.index_facets("{var}_{start}-{end}.nc")
+    chunk_dir = tmp_path / "chunks"
+
+    root = Operator("yearmean", out_node=Node("out", str(tmp_path / "out")))
+    root.configure(n.query(var="tas"), time_chunks=4, chunk_dir=str(chunk_dir))
+
+    # years are read from the index of the queried node
+    assert [c["func_name"] for c in root.cdo_cmds] == ["yearmean"] * 3 + ["mergetime"]
+    assert root.cdo_cmds[0]["input"] == "-selyear,1960/1963 in/tas_1960-1969.nc"
+    assert all(c["output"].startswith(str(chunk_dir)) for c in root.cdo_cmds[:3])
+
+    r = root.run(make_cdo(write="{input}"), workers=3)
+    assert all(x.error is None for x in r)
+    assert list(chunk_dir.iterdir()) == []
+
+    # files without a time span are not split
+    capsys.readouterr()
+    root.configure(Node("root", "in", ["tas.nc"]), time_chunks=4)
+    assert len(root.cdo_cmds) == 1
+    assert "no years known" in capsys.readouterr().out
+
+
+def test_time_chunks_failed(tmp_path, make_cdo):
+    out = tmp_path / "out"
+    n = Node("root", "in", ["tas_1950-1959.nc"])
+    n.index_facets("{var}_{start}-{end}.nc")
+
+    root = Operator("yearmean", out_node=Node("out", str(out)))
+    root.configure(n, time_chunks=4)
+    merge = root.cdo_cmds[3]
+
+    cdo = make_cdo(write="{input}", fail={"1954/1957": "Variable not found!"})
+    journal = Journal(str(tmp_path / "run.journal"))
+    r = root.run(cdo, workers=3, journal=journal)
+
+    # the merge fails without running and the other chunks are removed
+    assert [x.error is None for x in r] == [True, False, True, False]
+    assert isinstance(r[3].error, DependencyError)
+    assert r[3].attempts == 0
+    assert "mergetime" not in [name for name, _ in cdo.calls]
+    for f in merge["chunks"]:
+        assert not os.path.exists(f)
+
+    # all chunks run again when resuming
+    r = root.run(make_cdo(write="{input}"), journal=journal, resume=True)
+    assert all(x.error is None for x in r)
+    assert len(r) == 4
+    assert os.path.isfile(merge["output"])
+
+
+def test_time_chunks_not_time_local():
+    n = Node("root", "in", ["tas.nc"])
+
+    op = Operator("timmean")
+    op.configure(n, time_chunks=10, years=(1950, 2000))
+
+    assert len(op.cdo_cmds) == 1
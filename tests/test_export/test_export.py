@@ -0,0 +1,81 @@
+import os
+import shutil
+import stat
+import subprocess
+
+import pytest
+
+from cdobatch.export import export_make, export_ninja
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+
+
+def make_stages(tmp_path):
+    inputs = Node("in", str(tmp_path / "in"), ["a.nc", "b.nc"])
+    shelves = Node("shelves", str(tmp_path / "shelves"))
+    means = Node("means", str(tmp_path / "means"))
+
+    sel = Operator("sellonlatbox", "0,10,0,10", out_node=shelves)
+    sel.configure(inputs)
+    sel.bind_outputs()
+
+    mean = Operator("yearmean", out_node=means)
+    mean.configure(shelves)
+
+    return sel, mean
+
+
+def test_bind_outputs(tmp_path):
+    sel, mean = make_stages(tmp_path)
+
+    assert sel.op_out_node.files == ["a.nc", "b.nc"]
+    assert [c["files"] for c in mean.cdo_cmds] == [
+        [str(tmp_path / "shelves" / "a.nc")],
+        [str(tmp_path / "shelves" / "b.nc")],
+    ]
+
+
+def test_export_ninja(tmp_path):
+    sel, mean = make_stages(tmp_path)
+    path = tmp_path / "build.ninja"
+
+    assert export_ninja([sel, mean, mean], str(path)) == 4
+
+    text = path.read_text()
+    shelf = str(tmp_path / "shelves" / "a.nc").replace(":", "$:")
+    out = str(tmp_path / "means" / "a.nc").replace(":", "$:")
+
+    assert f"build {out}: cdo {shelf}\n" in text
+    assert (
+        f"  cmd = cdo -yearmean {shelf} {out}.partial && mv {out}.partial {out}\n"
+        in text
+    )
+    assert "-sellonlatbox,0,10,0,10" in text
+    assert "restat = 1" in text
+
+
+@pytest.mark.skipif(shutil.which("make") is None, reason="make not installed")
+def test_export_make(tmp_path):
+    (tmp_path / "in").mkdir()
+    for f in ["a.nc", "b.nc"]:
+        (tmp_path / "in" / f).write_text(f)
+
+    # stands in for cdo, copies the last input to the output
+    cdo = tmp_path / "cdo"
+    cdo.write_text(
+        '#!/bin/sh\nfor a; do prev="$last"; last="$a"; done\ncp "$prev" "$last"\n'
+    )
+    cdo.chmod(cdo.stat().st_mode | stat.S_IEXEC)
+
+    sel, mean = make_stages(tmp_path)
+    export_make([sel, mean], str(tmp_path / "Makefile"), cdo_bin=str(cdo))
+
+    subprocess.run(["make", "-s", "-j2", "-C", str(tmp_path)], check=True)
+    assert (tmp_path / "means" / "b.nc").read_text() == "b.nc"
+
+    # nothing is rebuilt when the outputs are up to date
+    p = subprocess.run(
+        ["make", "-q", "-C", str(tmp_path)], stdout=subprocess.PIPE, text=True
+    )
+    assert p.returncode == 0
+    assert not os.path.exists(tmp_path / "means" / "b.nc.partial")
@@ -0,0 +1,129 @@
+import sys
+
+from cdobatch.graph import GraphIndex
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+
+
+def test_graph_index():
+    root = Operator("root")
+    a = Operator("a")
+    b = Operator("b")
+    c = Operator("c")
+    root.append(a)
+    root.append(b)
+    # diamond, c is shared by both forks
+    a.append(c)
+    b.append(c)
+
+    g = GraphIndex(root)
+    assert g.ops[0] is root
+    assert g.ops[-1] is c
+    assert len(g.ops) == 4
+    assert [g.ops[i] for i in g.leaves] == [c]
+
+    paths = [[o.op_name for o in p] for p in g.iter_paths()]
+    assert paths == [["root", "a", "c"], ["root", "b", "c"]]
+
+
+def test_graph_index_invalidated():
+    root = Operator("root")
+    a = Operator("a")
+    root.append(a)
+
+    g = root.get_graph()
+    assert root.get_graph() is g
+    assert root.get_leaves() == [a]
+
+    # changes anywhere in the graph rebuild the index
+    b = Operator("b")
+    a.append(b)
+    assert root.get_graph() is not g
+    assert root.get_leaves() == [b]
+
+
+def test_long_chain():
+    years = [str(y) for y in range(3 * sys.getrecursionlimit())]
+
+    op = Operator("mergetime")
+    op.vectorize_on(
+        [Operator("eca_cfd"), Operator("selyear"), Operator("selname", "tmin")],
+        dimensions=[1, len(years)],
+        op_idx=1,
+        type="params",
+        vars=years,
+    )
+    op.vector_apply("selname", var_name="op_input_file", var="in.nc")
+
+    assert len(op.get_leaves()) == 1
+    assert len(op.get_commands([], [])[0]) == 3 * len(years) + 1
+
+    op.configure(Node("root", "in", ["a.nc"]), use_input_file=False)
+    assert op.cdo_cmds[0]["input"].endswith("-selname,tmin in.nc")
+
+
+def test_deep_node_tree():
+    root = Node("n0", "p")
+    n = root
+    for i in range(1, 2 * sys.getrecursionlimit()):
+        c = Node(f"n{i}", "p")
+        n.add_child(c)
+        n = c
+
+    assert root.find_node(n.name) is n
+    assert n.get_root_path().count("p") == 2 * sys.getrecursionlimit()
+
+    d = root.to_dict()
+    copied = Node.from_dict(d)
+    assert copied.find_node(n.name).get_root_path() == n.get_root_path()
+
+
+def make_diamonds(n):
+    # chain of n diamonds, 2^n paths from root to the last operator
+    root = Operator("mergetime", out_node=Node("out", "out"))
+    last = root
+    for i in range(n):
+        a = Operator("selyear", str(i))
+        b = Operator("selmon", str(i))
+        join = Operator("selname", "tas")
+        last.append(a)
+        last.append(b)
+        a.append(join)
+        b.append(join)
+        last = join
+
+    return root
+
+
+def test_plan_size_exact():
+    n = Node("root", "in", ["a.nc", "bb.nc", "ccc.nc"])
+
+    root = make_diamonds(4)
+    count, chars = root.plan_size(n)
+
+    root.configure(n)
+    cmds = root.run_dry()
+    assert count == len(cmds) == 3 * 2**4
+    assert chars == sum(len(c) for c in cmds)
+
+    count, chars = root.plan_size(n, route_mode="file_fork_mapped")
+    assert count == 3
+
+
+def test_plan_size_guard():
+    n = Node("root", "in", ["a.nc"])
+    root = make_diamonds(60)
+
+    count, _ = root.plan_size(n)
+    assert count == 2**60
+
+    try:
+        root.configure(n, max_commands=10**6)
+    except ValueError as e:
+        assert "use iter_commands" in str(e)
+    else:
+        assert False
+
+    # huge plans can still be streamed
+    cmds = root.iter_commands(n)
+    assert next(cmds)["input"].startswith("-selyear,0 -selname,tas -selyear,1")
@@ -0,0 +1,66 @@
+import json
+
+from cdobatch.journal import Journal
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+
+
+def test_journal_record_load(tmp_path):
+    path = str(tmp_path / "run.journal")
+
+    with Journal(path, sync_every=2) as j:
+        j.record("cdo -a x.nc", Journal.DONE)
+        j.record("cdo -b x.nc", Journal.FAILED)
+        j.record("cdo -b x.nc", Journal.DONE)
+        j.record("cdo -c x.nc", Journal.FAILED)
+
+    with open(path) as f:
+        lines = [json.loads(l) for l in f]
+
+    # append only, every state change is kept
+    assert len(lines) == 4
+
+    j = Journal(path)
+    j.load()
+    assert j.is_done("cdo -a x.nc")
+    assert j.is_done("cdo -b x.nc")
+    assert not j.is_done("cdo -c x.nc")
+    assert j.get_state("cdo -c x.nc") == Journal.FAILED
+    assert j.get_state("cdo -d x.nc") is None
+
+
+def test_journal_torn_line(tmp_path):
+    path = tmp_path / "run.journal"
+    path.write_text('{"cmd": "cdo -a x.nc", "state": "done"}\n{"cmd": "cdo -b')
+
+    j = Journal(str(path))
+    j.load()
+    assert j.states == {"cdo -a x.nc": Journal.DONE}
+
+
+def test_run_resume(tmp_path, make_cdo):
+    path = str(tmp_path / "run.journal")
+    n = Node("root", "in", ["a.nc", "b.nc", "c.nc"])
+
+    op = Operator("info")
+    op.configure(n)
+
+    with Journal(path) as j:
+        j.record("cdo -info in/a.nc", Journal.DONE)
+        j.record("cdo -info in/b.nc", Journal.FAILED)
+
+    cdo = make_cdo()
+    results = op.run(cdo, journal=path, resume=True)
+
+    # done command skipped, failed command retried
+    assert cdo.calls == [("info", "in/b.nc"), ("info", "in/c.nc")]
+    assert len(results) == 2
+
+    j = Journal(path)
+    j.load()
+    assert all(j.is_done(c) for c in op.run_dry())
+
+    # nothing left to do
+    cdo = make_cdo()
+    assert op.run(cdo, journal=path, resume=True) == []
+    assert cdo.calls == []
@@ -1,4 +1,8 @@
+import os
+
+from cdobatch import node
 from cdobatch.node import Node
+from cdobatch.operator import Operator, intermediate_options
 
 
 def test_create_node():
@@ -131,3 +135,92 @@ def test_node_serialization_leaf():
 
     deserialized_n = Node.from_dict(d)
     assert deserialized_n.files == files
+
+
+def test_intermediate_node(tmp_path, monkeypatch):
+    monkeypatch.setattr(node, "scratch_root", lambda: str(tmp_path))
+
+    n = Node("shelves", "/out/shelves", intermediate=True)
+    c = Node("a", "a")
+    n.add_child(c)
+
+    assert n.get_root_path() == os.path.join(str(tmp_path), "out/shelves")
+    assert c.get_root_path() == os.path.join(str(tmp_path), "out/shelves/a")
+
+    d = n.to_dict()
+    assert d["intermediate"]
+    assert "intermediate" not in d["children"][0]
+    assert Node.from_dict(d).intermediate
+
+
+def test_intermediate_options():
+    assert intermediate_options("-z zip_6 -f nc4 -O") == "-f nc2 -O"
+    assert intermediate_options("") == "-f nc2"
+
+
+def test_intermediate_cleanup(tmp_path, monkeypatch, make_cdo):
+    monkeypatch.setattr(node, "scratch_root", lambda: str(tmp_path / "scratch"))
+
+    src = tmp_path / "in"
+    src.mkdir()
+    (src / "a.nc").write_text("")
+
+    inputs = Node("in", str(src), ["a.nc"])
+    stage = Node("stage", "stage", intermediate=True)
+    final = Node("final", str(tmp_path / "final"))
+
+    first = Operator("copy", out_node=stage, options="-z zip_6 -f nc4")
+    first.configure(inputs)
+    first.run(make_cdo(write="{options}"))
+
+    assert stage.files == ["a.nc"]
+    staged = os.path.join(stage.get_root_path(), "a.nc")
+    with open(staged) as f:
+        assert f.read() == "-f nc2"
+
+    yearly = Operator("yearmean", out_node=final, options="-z zip_6")
+    monthly = Operator("monmean", out_node=final, out_name_format="m.nc")
+    yearly.configure(stage)
+    monthly.configure(stage)
+
+    yearly.run(make_cdo(write="{options}"))
+    assert os.path.isfile(staged)
+
+    monthly.run(make_cdo(write="{options}"))
+    assert not os.path.exists(stage.get_root_path())
+    assert stage.files == []
+
+    with open(tmp_path / "final" / "a.nc") as f:
+        assert f.read() == "-z zip_6"
+
+
+def test_facet_query():
+    template = "{var}/{var}_{freq}_{model}_{scenario}_{member}_{start}-{end}.nc"
+    files = [
+        "tas/tas_Amon_CESM2_ssp585_r1i1p1f1_201501-206412.nc",
+        "tas/tas_Amon_CESM2_ssp585_r1i1p1f1_206501-210012.nc",
+        "tas/tas_Amon_MIROC6_historical_r1i1p1f1_185001-201412.nc",
+        "pr/pr_Amon_CESM2_ssp585_r1i1p1f1_201501-210012.nc",
+        "pr/README.txt",
+        "pr/tas_Amon_CESM2_ssp585_r1i1p1f1_201501-210012.nc",
+    ]
+    n = Node("cmip", "/data/cmip6", files)
+    n.index_facets(template)
+
+    assert n.facets.values("model") == ["CESM2", "MIROC6"]
+    assert n.facets.unmatched == [4, 5]
+
+    q = n.query(var="tas", model="CESM2")
+    assert q.name == "cmip_tas_CESM2"
+    assert q.files == files[:2]
+    assert q.get_root_path() == "/data/cmip6/"
+    assert n.children == []
+
+    # files overlapping 2000-2020, any precision
+    assert n.query(start="2000", end="2020").files == [files[0], files[2], files[3]]
+    assert n.query(start="206501").files == [files[1], files[3]]
+    assert n.query(var=["tas", "pr"], scenario="ssp585", end="2015").files == [
+        files[0],
+        files[3],
+    ]
+    assert n.query(model="NorESM2").files == []
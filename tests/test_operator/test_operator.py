@@ -43,6 +43,43 @@ def test_operator_output_naming():
     assert op.get_output_name(files[0]) == ""
 
 
+def test_operator_output_names():
+    op = Operator(
+        "test_op",
+        out_node=Node("output", "out"),
+        out_name_format="{shelf}/{input_basename}.nc",
+        out_name_vars={"shelf": "amery"},
+    )
+
+    names = op.get_output_names(["in/a.nc", "in/b.nc"], {"shelf": "ross"})
+    assert names == ["out/ross/a.nc", "out/ross/b.nc"]
+
+
+def test_preprocess(tmp_path):
+    out = tmp_path / "out"
+    n = Node("root", "in", ["a.nc", "b.nc", "c.nc"])
+
+    root = Operator(out_node=Node("output", str(out)))
+    op = Operator("sellonlatbox")
+    op.vectorize(["1", "2"], type="params", dir="vertical", root=root)
+    root.fork_apply(
+        "sellonlatbox",
+        "op_out_name_vars",
+        [{"shelf": "amery/deep"}, {"shelf": "ross"}],
+    )
+    root.fork_apply(
+        "sellonlatbox",
+        "out_name_format",
+        ["{shelf}/{input_basename}.nc", "{shelf}/x.nc"],
+    )
+    root.configure(n)
+
+    # ross/x.nc is written three times, each directory is created once
+    assert root.preprocess() == 2
+    assert (out / "amery" / "deep").is_dir()
+    assert (out / "ross").is_dir()
+
+
 def test_operator_run_single_op_dry():
     cdo = Cdo()
     files = ["a1.nc", "a2.nc", "a3.nc"]
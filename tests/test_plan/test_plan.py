@@ -0,0 +1,114 @@
+import pytest
+
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.plan import command_key, dedupe_commands
+
+
+def test_command_key():
+    n = Node("root", "in", ["a.nc"])
+    a = Operator("selname", "tas", out_node=Node("out", "out"))
+    b = Operator("selname", "tas", out_node=Node("other", "other"))
+    a.configure(n)
+    b.configure(n)
+
+    # output is not part of what the command computes
+    assert command_key(a.cdo_cmds[0]) == command_key(b.cdo_cmds[0])
+
+    b.op_options = "-z zip"
+    b.configure(n)
+    assert command_key(a.cdo_cmds[0]) != command_key(b.cdo_cmds[0])
+
+
+def test_dedupe(capsys):
+    out = Node("out", "out")
+    n = Node("root", "in", ["a.nc", "b.nc"])
+
+    op = Operator("selname", "tas", out_node=out)
+    op.configure(n)
+    first = op.cdo_cmds
+
+    # overlapping node configured again, and a different writer to out/b.nc
+    op.configure(Node("root", "in", ["b.nc", "c.nc"]))
+    other = Operator("selname", "pr", out_node=out)
+    other.configure(Node("root", "in", ["b.nc"]))
+
+    op.cdo_cmds = first + op.cdo_cmds + other.cdo_cmds
+    report = op.dedupe()
+
+    assert op.run_dry() == [
+        "cdo -selname,tas in/a.nc out/a.nc",
+        "cdo -selname,tas in/b.nc out/b.nc",
+        "cdo -selname,tas in/c.nc out/c.nc",
+        "cdo -selname,pr in/b.nc out/b.nc",
+    ]
+    assert report["commands"] == 5
+    assert report["duplicates"] == 1
+    assert list(report["conflicts"]) == ["out/b.nc"]
+
+    logged = capsys.readouterr().out
+    assert "removed 1 duplicate commands, 4 of 5 left" in logged
+    assert "2 different commands write out/b.nc" in logged
+
+
+def test_dedupe_no_output():
+    n = Node("root", "in", ["a.nc", "a.nc"])
+    op = Operator("showyear")
+    op.configure(n)
+
+    cmds, report = dedupe_commands(op.cdo_cmds)
+    assert len(cmds) == 1
+    assert report["conflicts"] == {}
+
+
+def make_sweep():
+    root = Operator("yearmean", out_node=Node("out", "out"))
+    sel = Operator("selname")
+    root.append(sel)
+    root.permute_on(sel, params=["tas", "pr"], name="var")
+    root.out_name_format = "{var}_{input_basename}.nc"
+    return root
+
+
+def test_plan_reload(tmp_path, monkeypatch):
+    path = str(tmp_path / "plan.json.gz")
+    n = Node("root", "in", ["a.nc", "b.nc"])
+
+    root = make_sweep()
+    root.configure(n, plan=path)
+    cmds = root.cdo_cmds
+
+    # a fresh graph loads the saved commands instead of creating them
+    reloaded = make_sweep()
+    monkeypatch.setattr(reloaded, "iter_commands", None)
+    reloaded.configure(n, plan=path)
+    assert reloaded.cdo_cmds == cmds
+
+    worker = Operator.from_plan(path)
+    assert worker.cdo_cmds == cmds
+    assert worker.op_in_node.files == n.files
+    assert worker.op_out_node.get_root_path() == "out"
+    assert worker.run_dry()[0] == "cdo -yearmean -selname,tas in/a.nc out/tas_a.nc"
+
+
+def test_plan_stale(tmp_path, capsys):
+    path = str(tmp_path / "plan.json.gz")
+
+    root = make_sweep()
+    root.configure(Node("root", "in", ["a.nc"]), plan=path)
+
+    changed = Node("root", "in", ["a.nc", "b.nc"])
+    with pytest.raises(ValueError):
+        Operator.from_plan(path, changed)
+
+    root.configure(changed, plan=path)
+    assert "stale" in capsys.readouterr().out
+    assert len(root.cdo_cmds) == 4
+
+    # changing the graph also invalidates the plan
+    other = make_sweep()
+    other.op_options = "-z zip"
+    other.configure(changed, plan=path)
+    assert "stale" in capsys.readouterr().out
+    assert other.cdo_cmds[0]["options"] == "-z zip"
+    assert Operator.from_plan(path, changed).cdo_cmds == other.cdo_cmds
@@ -0,0 +1,88 @@
+import io
+import json
+
+import pytest
+
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.progress import Progress, percentile
+
+
+def test_percentile():
+    values = list(range(101))
+
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 90) == 0.0
+
+
+def test_progress_report(tmp_path, make_cdo):
+    (tmp_path / "a.nc").write_bytes(b"x" * 1000)
+    (tmp_path / "bad.nc").write_bytes(b"x" * 10)
+
+    n = Node("root", str(tmp_path))
+    n.find_files()
+    op = Operator("showyear")
+    op.configure(n)
+
+    stream = io.StringIO()
+    path = tmp_path / "progress.json"
+    progress = Progress(str(path), interval=60.0, stream=stream)
+
+    op.run(make_cdo(fail={"bad": "Variable not found!"}), workers=2, progress=progress)
+
+    # final report written when the run ends
+    assert stream.getvalue().startswith("cdo-batch: 1/2 done, 0 running, 1 failed")
+
+    snap = json.loads(path.read_text())
+    assert snap["done"] == 1
+    assert snap["failed"] == 1
+    assert snap["running"] == 0
+    assert snap["eta"] == 0.0
+    assert snap["operators"]["showyear"]["count"] == 2
+    assert snap["read_mb_per_s"] > 0
+
+
+def test_progress_failed_dependency(tmp_path, make_cdo):
+    n = Node("root", "in", ["tas_1950-1959.nc"])
+    n.index_facets("{var}_{start}-{end}.nc")
+
+    op = Operator("yearmean", out_node=Node("out", str(tmp_path / "out")))
+    op.configure(n, time_chunks=4)
+
+    path = tmp_path / "progress.json"
+    progress = Progress(str(path), interval=60.0, stream=False)
+
+    cdo = make_cdo(write="{input}", fail={"1954/1957": "Variable not found!"})
+    op.run(cdo, workers=2, progress=progress)
+
+    # the merge of the failed chunk is skipped without running
+    snap = json.loads(path.read_text())
+    assert snap["done"] == 2
+    assert snap["failed"] == 2
+    assert snap["skipped"] == 1
+    assert snap["running"] == 0
+    assert snap["operators"]["yearmean"]["count"] == 3
+    assert "mergetime" not in snap["operators"]
+
+
+def test_progress_stopped_on_error(tmp_path, make_cdo):
+    (tmp_path / "a.nc").write_bytes(b"x")
+
+    n = Node("root", str(tmp_path))
+    n.find_files()
+    op = Operator("showyear")
+    op.configure(n)
+
+    stream = io.StringIO()
+    progress = Progress(interval=60.0, stream=stream)
+
+    with pytest.raises(AttributeError):
+        # cdo without the configured operator
+        op.run(
+            make_cdo(operators=[]), progress=progress, journal=str(tmp_path / "j.log")
+        )
+
+    # reporter stopped with a final report even though the run failed
+    assert progress.thread is None
+    assert stream.getvalue().startswith("cdo-batch: 0/1 done")
@@ -0,0 +1,127 @@
+import pytest
+
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.schedule import (
+    CostModel,
+    chain_length,
+    cost_report,
+    group_by_input,
+    lpt_order,
+    simulate_bytes_read,
+    simulate_makespan,
+)
+
+
+def make_fanout(files, params):
+    root = Operator()
+    op = Operator("sellonlatbox")
+    op.vectorize(params, type="params", dir="vertical", root=root)
+    root.configure(Node("root", "in", files))
+    return root
+
+
+def test_group_by_input():
+    root = make_fanout(["a.nc", "b.nc"], ["1", "2", "3"])
+
+    # configure orders commands by operator path first
+    assert [c["files"] for c in root.cdo_cmds[:2]] == [["in/a.nc"], ["in/b.nc"]]
+
+    groups = group_by_input(root.cdo_cmds)
+    assert groups == [[0, 2, 4], [1, 3, 5]]
+    assert [root.cdo_cmds[i]["files"][0] for i in groups[1]] == ["in/b.nc"] * 3
+
+    assert group_by_input(root.cdo_cmds, max_group=2) == [[0, 2], [4], [1, 3], [5]]
+
+
+def test_bytes_read_reduced():
+    files = [f"f{i}.nc" for i in range(4)]
+    root = make_fanout(files, [str(p) for p in range(10)])
+    sizes = {f"in/{f}": 100 for f in files}
+
+    default = list(range(len(root.cdo_cmds)))
+    grouped = [i for g in group_by_input(root.cdo_cmds) for i in g]
+
+    # page cache only holds 2 of the 4 inputs
+    assert simulate_bytes_read(root.cdo_cmds, default, 200, sizes) == 4000
+    assert simulate_bytes_read(root.cdo_cmds, grouped, 200, sizes) == 400
+
+
+def test_run_ordered_by_input(make_cdo):
+    root = make_fanout(["a.nc", "b.nc"], ["1", "2", "3"])
+    cdo = make_cdo()
+
+    r = root.run(cdo, workers=2, order="input")
+
+    # results stay in configured order
+    assert [x.cmd["param"] for x in r] == ["1", "1", "2", "2", "3", "3"]
+
+    threads = {}
+    for t, i in cdo.threads:
+        threads.setdefault(i, set()).add(t)
+
+    # each input is read on a single worker
+    assert all(len(t) == 1 for t in threads.values())
+
+
+def test_cost_model_fit(tmp_path):
+    model = CostModel(str(tmp_path / "costs.json"))
+    model.sizes = {"a.nc": 100, "b.nc": 300}
+
+    a = {"func_name": "yearmean", "input": "a.nc", "files": ["a.nc"]}
+    b = {"func_name": "yearmean", "input": "-selname,tas b.nc", "files": ["b.nc"]}
+    assert chain_length(b) == 2
+
+    # unknown operators are estimated by their work until timed
+    assert model.estimate(b) == 600
+
+    model.record(a, 2.0)
+    model.record(b, 7.0)
+    model.save()
+
+    # 1s overhead, 0.01s per unit of work
+    loaded = CostModel(str(tmp_path / "costs.json"))
+    loaded.sizes = model.sizes
+    assert abs(loaded.estimate(b) - 7.0) < 1e-9
+
+    # other operators fall back to the fit over all operators
+    c = dict(a, func_name="timmean")
+    assert abs(loaded.estimate(c) - 2.0) < 1e-9
+
+
+def test_lpt_makespan():
+    costs = [1, 1, 1, 1, 4]
+    groups = [[i] for i in range(len(costs))]
+
+    assert simulate_makespan(groups, costs, 2) == 6
+    assert lpt_order(groups, costs)[0] == [4]
+    assert simulate_makespan(lpt_order(groups, costs), costs, 2) == 4
+
+
+def test_run_cost_order(tmp_path, make_cdo):
+    for f, size in [("a.nc", 10), ("b.nc", 1000), ("c.nc", 100)]:
+        (tmp_path / f).write_bytes(b"0" * size)
+
+    op = Operator("yearmean")
+    op.configure(Node("in", str(tmp_path), ["a.nc", "b.nc", "c.nc"]))
+    cdo = make_cdo()
+
+    r = op.run(cdo, order="cost", cost_model=str(tmp_path / "costs.json"))
+
+    assert [i.split("/")[-1] for _, i in cdo.calls] == ["b.nc", "c.nc", "a.nc"]
+    # estimates in bytes are not reported as predictions
+    assert [x.predicted for x in r] == [None] * 3
+    assert cost_report(r)["commands"] == 0
+    assert CostModel(str(tmp_path / "costs.json")).stats["yearmean"]["n"] == 3
+
+    # with timings of 1 ms per byte predictions are in seconds
+    model = CostModel()
+    for c in op.cdo_cmds[:2]:
+        model.record(c, model.work(c) / 1000)
+    r = op.run(cdo, order="cost", cost_model=model)
+
+    assert [x.predicted for x in r] == pytest.approx([0.01, 1.0, 0.1])
+
+    report = cost_report(r)
+    assert report["commands"] == 3
+    assert report["by_op"]["yearmean"]["predicted"] == pytest.approx(1.11)
@@ -0,0 +1,182 @@
+import errno
+import os
+
+from cdo import CDOException
+
+from cdobatch import staging
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.staging import InputCache, OutputStager, move_atomic
+
+
+def test_staged_outputs(tmp_path, make_cdo):
+    scratch = tmp_path / "scratch"
+    out = Node("out", str(tmp_path / "out"))
+
+    op = Operator("selname", "tas", out_node=out)
+    op.configure(Node("root", "in", ["a.nc", "b.nc", "bad.nc"]))
+
+    cdo = make_cdo(write="{input}", fail={"bad": "Variable not found!"})
+    r = op.run(cdo, workers=2, stage_dir=str(scratch), movers=2)
+
+    # commands wrote to scratch, not to the output node
+    assert all(kw["output"].startswith(str(scratch)) for _, _, kw in cdo.args)
+
+    assert (tmp_path / "out" / "a.nc").read_text() == "in/a.nc"
+    assert (tmp_path / "out" / "b.nc").read_text() == "in/b.nc"
+    assert not (tmp_path / "out" / "bad.nc").exists()
+    assert r[2].error is not None
+
+    # results refer to the moved outputs
+    assert [x.result for x in r[:2]] == [
+        str(tmp_path / "out" / f) for f in ["a.nc", "b.nc"]
+    ]
+
+    assert list(scratch.iterdir()) == []
+    assert sorted(out.files) == ["a.nc", "b.nc"]
+
+
+def write_years(name, kwargs):
+    # like splityear, writes one file per year named after the output prefix
+    for year in ["1990", "1991"]:
+        with open(kwargs["output"] + f"{year}.nc", "w") as f:
+            f.write(year)
+
+    if "bad" in kwargs["input"]:
+        raise CDOException("", "Variable not found!", 1)
+    return [kwargs["output"] + "1990.nc", kwargs["output"] + "1991.nc"]
+
+
+def test_staged_split_outputs(tmp_path, make_cdo):
+    scratch = tmp_path / "scratch"
+    out = Node("out", str(tmp_path / "out"))
+
+    op = Operator("splityear", out_node=out)
+    op.configure(Node("root", "in", ["a.nc", "bad.nc"]))
+
+    r = op.run(make_cdo(result=write_years), stage_dir=str(scratch))
+
+    # every file written with the prefix is moved
+    prefix = str(tmp_path / "out" / "a.nc")
+    assert r[0].result == [prefix + "1990.nc", prefix + "1991.nc"]
+    assert (tmp_path / "out" / "a.nc1991.nc").read_text() == "1991"
+    # files of the failed command are discarded
+    assert r[1].error is not None
+    assert list(scratch.iterdir()) == []
+    assert sorted(out.files) == ["a.nc1990.nc", "a.nc1991.nc"]
+
+
+def test_staged_path(tmp_path):
+    s = OutputStager(str(tmp_path))
+    a = s.get_staged_path("out/x/a.nc")
+
+    assert a.endswith("_a.nc")
+    assert a == s.get_staged_path("out/x/a.nc")
+    assert a != s.get_staged_path("out/y/a.nc")
+    s.close()
+
+
+def test_move_across_filesystems(tmp_path, monkeypatch):
+    src = tmp_path / "src.nc"
+    dst = tmp_path / "dst.nc"
+    src.write_text("data")
+
+    replace = os.replace
+    renamed = []
+
+    def cross_device_replace(a, b):
+        # renaming the staged file fails as if it were on another device
+        if a == str(src):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        renamed.append(os.path.basename(a))
+        replace(a, b)
+
+    monkeypatch.setattr(staging.os, "replace", cross_device_replace)
+    move_atomic(str(src), str(dst))
+
+    assert dst.read_text() == "data"
+    assert not src.exists()
+    # copied under a temporary name first
+    assert renamed[0].endswith(".partial")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dst.nc"]
+
+
+def make_inputs(path, names, size):
+    path.mkdir()
+    for n in names:
+        (path / n).write_text(n[0] * size)
+
+
+def test_input_cache_eviction(tmp_path):
+    make_inputs(tmp_path / "in", ["a.nc", "b.nc", "c.nc"], 100)
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=250)
+
+    a = cache.fetch(str(tmp_path / "in" / "a.nc"))
+    b = cache.fetch(str(tmp_path / "in" / "b.nc"))
+    assert a.startswith(str(tmp_path / "cache"))
+    assert cache.get_size() == 200
+
+    # a is pinned, b is released and is evicted first
+    cache.release(str(tmp_path / "in" / "b.nc"))
+    cache.fetch(str(tmp_path / "in" / "c.nc"))
+
+    assert os.path.isfile(a)
+    assert not os.path.isfile(b)
+    assert cache.get_size() == 200
+
+    # too large to cache, read from the original location
+    big = tmp_path / "in" / "big.nc"
+    big.write_text("x" * 300)
+    assert cache.fetch(str(big)) == str(big)
+    cache.close()
+
+    # cached files are reused by later runs
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=250)
+    assert cache.get_size() == 200
+    cache.close()
+
+
+def test_input_cache_refresh_pinned(tmp_path, monkeypatch):
+    make_inputs(tmp_path / "in", ["a.nc"], 10)
+    a = tmp_path / "in" / "a.nc"
+
+    def no_link(src, dst):
+        # the cache is on another filesystem, inputs are copied
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(staging.os, "link", no_link)
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=100)
+
+    cached = cache.fetch(str(a))
+    reader = open(cached)
+
+    # the input changes while the cached copy is pinned and being read
+    a.write_text("b" * 10)
+    os.utime(a, (os.path.getatime(cached) + 10, os.path.getmtime(cached) + 10))
+
+    assert cache.fetch(str(a)) == cached
+    assert reader.read() == "a" * 10
+    reader.close()
+
+    with open(cached) as f:
+        assert f.read() == "b" * 10
+    assert cache.get_size() == 10
+    assert sorted(os.listdir(tmp_path / "cache")) == [os.path.basename(cached)]
+    cache.close()
+
+
+def test_input_cache_run(tmp_path, make_cdo):
+    make_inputs(tmp_path / "in", ["a.nc", "b.nc", "c.nc"], 10)
+
+    op = Operator("info")
+    op.configure(Node("root", str(tmp_path / "in"), ["a.nc", "b.nc", "c.nc"]))
+
+    cdo = make_cdo()
+    with InputCache(str(tmp_path / "cache"), max_bytes=1000) as cache:
+        r = op.run(cdo, workers=2, input_cache=cache, prefetch=2)
+
+    assert all(i.startswith(str(tmp_path / "cache")) for i, _ in cdo.reads)
+    assert sorted(d for _, d in cdo.reads) == ["a" * 10, "b" * 10, "c" * 10]
+
+    # results and journals keep the original command lines
+    assert r[0].cmd_str == f"cdo -info {tmp_path}/in/a.nc"
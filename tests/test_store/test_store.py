@@ -0,0 +1,101 @@
+import os
+
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.store import ResultStore
+
+
+def make_op(tmp_path, out):
+    op = Operator("sellonlatbox", "0,10,0,10", out_node=Node("out", str(out)))
+    n = Node("root", str(tmp_path / "in"), ["a.nc", "b.nc"])
+    return op, n
+
+
+def make_cmd(tmp_path, f):
+    return {
+        "func_name": "sellonlatbox",
+        "param": "0,10,0,10",
+        "input": str(tmp_path / "in" / f),
+        "options": "",
+        "files": [str(tmp_path / "in" / f)],
+    }
+
+
+def test_store_reuse(tmp_path, make_cdo):
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "a.nc").write_text("a")
+    (tmp_path / "in" / "b.nc").write_text("b")
+    store = ResultStore(str(tmp_path / "store"))
+
+    op, n = make_op(tmp_path, tmp_path / "out1")
+    op.configure(n, store=store)
+    cdo = make_cdo(write="first")
+    op.run(cdo)
+
+    assert len(cdo.calls) == 2
+    assert store.get_size() > 0
+
+    # another run on the same inputs links the stored outputs
+    op, n = make_op(tmp_path, tmp_path / "out2")
+    assert op.configure(n, store=str(tmp_path / "store")) is None
+    assert op.cdo_cmds == []
+    stored = store.get_stored_path(store.get_key(make_cmd(tmp_path, "a.nc")), "a.nc")
+    assert os.path.samefile(stored, tmp_path / "out2" / "a.nc")
+    # the store holds a copy, not the output of the first run
+    assert not os.path.samefile(stored, tmp_path / "out1" / "a.nc")
+
+    # changed inputs run again
+    (tmp_path / "in" / "b.nc").write_text("bb")
+    op, n = make_op(tmp_path, tmp_path / "out3")
+    op.configure(n, store=store)
+    assert [c["files"] for c in op.cdo_cmds] == [[str(tmp_path / "in" / "b.nc")]]
+
+    # outputs shared with the store are replaced when a command reruns
+    op, n = make_op(tmp_path, tmp_path / "out2")
+    op.configure(n, store=store)
+    op.run(make_cdo(write="second"))
+
+    assert (tmp_path / "out1" / "b.nc").read_text() == "first"
+    assert (tmp_path / "out2" / "b.nc").read_text() == "second"
+
+
+def test_store_rerun_without_store(tmp_path, make_cdo):
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "a.nc").write_text("a")
+    (tmp_path / "in" / "b.nc").write_text("b")
+    store = ResultStore(str(tmp_path / "store"))
+
+    op, n = make_op(tmp_path, tmp_path / "out")
+    op.configure(n, store=store)
+    op.run(make_cdo(write="first"))
+
+    op, n = make_op(tmp_path, tmp_path / "linked")
+    op.configure(n, store=store)
+
+    # another command writing the outputs linked from the store
+    op = Operator("selname", "tas", out_node=Node("linked", str(tmp_path / "linked")))
+    op.configure(n)
+    r = op.run(make_cdo(write="second"))
+
+    # written to a temporary name replacing the links
+    assert [x.result for x in r] == [
+        str(tmp_path / "linked" / f) for f in ["a.nc", "b.nc"]
+    ]
+    assert sorted(os.listdir(tmp_path / "linked")) == ["a.nc", "b.nc"]
+    assert (tmp_path / "linked" / "a.nc").read_text() == "second"
+    for key in [store.get_key(make_cmd(tmp_path, f)) for f in ["a.nc", "b.nc"]]:
+        with open(store.get_stored_path(key, "a.nc")) as f:
+            assert f.read() == "first"
+
+
+def test_store_eviction(tmp_path):
+    store = ResultStore(str(tmp_path / "store"), max_bytes=25)
+
+    for i in range(3):
+        out = tmp_path / f"o{i}.nc"
+        out.write_text("x" * 10)
+        store.add(f"{i:02d}key", str(out))
+
+    assert store.get_size() == 20
+    assert not os.path.exists(store.get_stored_path("00key", "o.nc"))
+    assert store.fetch("02key", str(tmp_path / "copy.nc"))
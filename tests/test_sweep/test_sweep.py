@@ -0,0 +1,89 @@
+import itertools
+
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.sweep import Sweep
+
+
+def test_sweep_points():
+    op_a = Operator("op_a")
+    op_b = Operator("op_b")
+
+    s = Sweep()
+    s.add(op_a, "params", ["1", "2", "3"], name="a")
+    s.add(op_b, "params", ["x", "y"], name="b")
+    s.add(op_b, "ops", ["op_c", "op_d"], name="b_op", zip_with="b")
+
+    assert len(s) == 6
+
+    seen = []
+    for point in s.points():
+        with s.applied(point) as named:
+            seen.append((op_a.op_param, op_b.op_name, op_b.op_param))
+            assert named["a"] == op_a.op_param
+
+    assert seen[:3] == [("1", "op_c", "x"), ("1", "op_d", "y"), ("2", "op_c", "x")]
+
+    # operators are restored after each point
+    assert op_b.op_name == "op_b"
+    assert op_b.op_param == ""
+
+
+def test_permute_on():
+    n = Node("root", "in", ["a.nc", "b.nc"])
+    out = Node("out", "out")
+
+    op = Operator("selmon", out_node=out, out_name_format="{input_basename}_{m}_{r}.nc")
+    box = Operator("sellonlatbox")
+    op.extend([box])
+
+    op.permute_on(op, params=["1", "2"], name="m")
+    op.permute_on(box, params=["0,10,0,10", "10,20,0,10", "20,30,0,10"], name="r")
+
+    assert op.count_commands(n) == 12
+    op.configure(n)
+
+    cmds = op.run_dry()
+    assert len(cmds) == 12
+    assert cmds[:4] == [
+        "cdo -selmon,1 -sellonlatbox,0,10,0,10 in/a.nc out/a_1_0,10,0,10.nc",
+        "cdo -selmon,1 -sellonlatbox,10,20,0,10 in/a.nc out/a_1_10,20,0,10.nc",
+        "cdo -selmon,1 -sellonlatbox,20,30,0,10 in/a.nc out/a_1_20,30,0,10.nc",
+        "cdo -selmon,2 -sellonlatbox,0,10,0,10 in/a.nc out/a_2_0,10,0,10.nc",
+    ]
+    assert op.cdo_cmds[0]["vars"]["m"] == "1"
+
+
+def test_fork_on():
+    n = Node("root", "in", ["a.nc"])
+
+    op = Operator("sellonlatbox")
+    op.fork_on(op, params=["0,10,0,10", "10,20,0,10"], name="box")
+    op.fork_on(op, ops=["sellonlatbox", "masklonlatbox"])
+
+    op.configure(n)
+    assert op.run_dry() == [
+        "cdo -sellonlatbox,0,10,0,10 in/a.nc",
+        "cdo -masklonlatbox,10,20,0,10 in/a.nc",
+    ]
+
+
+def test_large_sweep_streamed():
+    # 50 models x 8 scenarios of input files, 12 months x 60 regions swept
+    files = [f"tas_{m}_{s}.nc" for m in range(50) for s in range(8)]
+    n = Node("root", "in", files)
+
+    op = Operator("selmon", out_node=Node("out", "out"))
+    op.out_name_format = "{input_basename}_{month}_{region}.nc"
+    box = Operator("sellonlatbox")
+    op.extend([box])
+
+    op.permute_on(op, params=[str(m) for m in range(1, 13)], name="month")
+    op.permute_on(
+        box, params=[f"{r},{r + 6},-90,-60" for r in range(60)], name="region"
+    )
+
+    assert op.count_commands(n) == 50 * 8 * 12 * 60
+
+    first = list(itertools.islice(op.iter_commands(n), 2))
+    assert first[1]["output"] == "out/tas_0_0_1_1,7,-90,-60.nc"
@@ -0,0 +1,81 @@
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.table import results_table, write_csv
+
+
+def print_table(name, kwargs):
+    # a table for outputtab and years otherwise
+    if name == "outputtab":
+        return ["#   date     value", "1990-01-01 1.5", "1990-02-01 2.5"]
+    return ["1990 1991 1992"]
+
+
+def test_showyear_table(tmp_path, make_cdo):
+    n = Node("root", "in", ["a.nc", "b.nc"])
+    op = Operator("showyear")
+    op.configure(n)
+
+    table = op.run_table(
+        make_cdo(result=print_table),
+        keys=["input_basename"],
+        path=str(tmp_path / "years.csv"),
+    )
+
+    assert table.dtype.names == ("file", "operator", "input_basename", "value")
+    assert table["value"].dtype.kind == "i"
+    assert list(table["value"]) == [1990, 1991, 1992] * 2
+    assert list(table["file"]) == ["in/a.nc"] * 3 + ["in/b.nc"] * 3
+
+    lines = (tmp_path / "years.csv").read_text().splitlines()
+    assert lines[0] == "file,operator,input_basename,value"
+    assert lines[1] == "in/a.nc,showyear,a,1990"
+
+
+def test_outputtab_table(tmp_path, make_cdo):
+    n = Node("root", "in", ["a.nc"])
+    op = Operator("fldmean", out_node=Node("out", str(tmp_path / "out")))
+    op.configure(n)
+
+    cdo = make_cdo(result=print_table)
+    table = op.run_table(cdo, tab="date,value", keys=[])
+
+    # no output files are written
+    name, args, kwargs = cdo.args[0]
+    assert name == "outputtab"
+    assert args == ("date,value",)
+    assert kwargs["input"] == "-fldmean in/a.nc"
+    assert "output" not in kwargs
+    assert op.cdo_cmds[0]["func_name"] == "fldmean"
+
+    assert table.dtype.names == ("file", "operator", "date", "value")
+    assert list(table["operator"]) == ["fldmean"] * 2
+    assert list(table["date"]) == ["1990-01-01", "1990-02-01"]
+    assert table["value"].dtype.kind == "f"
+
+    write_csv(table, str(tmp_path / "t.csv"))
+    assert (tmp_path / "t.csv").read_text().splitlines()[1] == (
+        "in/a.nc,fldmean,1990-01-01,1.5"
+    )
+
+
+def test_outputtab_without_output(make_cdo):
+    n = Node("root", "in", ["a.nc"])
+    op = Operator("showyear")
+    op.configure(n)
+
+    cdo = make_cdo(result=print_table)
+    table = op.run_table(cdo, tab="date,value", columns=["value"], keys=[])
+
+    # commands printing their results are run as configured
+    assert cdo.args[0][0] == "showyear"
+    assert list(table["value"]) == [1990, 1991, 1992]
+
+
+def test_results_table_uneven():
+    class R:
+        error = None
+        vars = {}
+        cmd = {"func_name": "x", "files": ["a.nc"]}
+        result = ["1 2 3"]
+
+    assert len(results_table([R()], ["date", "value"])) == 0
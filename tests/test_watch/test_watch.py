@@ -0,0 +1,59 @@
+import threading
+
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.watch import PollWatcher, watch
+
+
+def test_watch(tmp_path, make_cdo):
+    (tmp_path / "old.nc").write_text("")
+    (tmp_path / "sub").mkdir()
+
+    n = Node("root", str(tmp_path))
+    n.find_files()
+
+    op = Operator("showyear")
+    cdo = make_cdo()
+    batches = []
+
+    def write():
+        (tmp_path / "a.nc").write_text("")
+        (tmp_path / "notes.txt").write_text("")
+        (tmp_path / "new").mkdir()
+        (tmp_path / "new" / "b.nc").write_text("")
+        (tmp_path / "sub" / "c.nc").write_text("")
+
+    timer = threading.Timer(0.2, write)
+    timer.start()
+
+    count = watch(
+        op,
+        n,
+        cdo,
+        debounce=0.3,
+        poll=0.05,
+        batches=1,
+        on_batch=lambda files, r: batches.append(sorted(files)),
+    )
+    timer.join()
+
+    assert count == 1
+    assert batches == [["a.nc", "new/b.nc", "sub/c.nc"]]
+
+    # only the new files are processed, the node knows all of them
+    assert sorted(i for _, i in cdo.calls) == [
+        str(tmp_path / "a.nc"),
+        str(tmp_path / "new/b.nc"),
+        str(tmp_path / "sub/c.nc"),
+    ]
+    assert sorted(n.files) == ["a.nc", "new/b.nc", "old.nc", "sub/c.nc"]
+
+
+def test_poll_watcher(tmp_path):
+    w = PollWatcher(str(tmp_path))
+    (tmp_path / "a.nc").write_text("x")
+
+    paths, overflow = w.read(0.0)
+
+    assert paths == [str(tmp_path / "a.nc")]
+    assert w.read(0.0) == ([], False)
@@ -0,0 +1,206 @@
+import multiprocessing
+import os
+
+from cdobatch import node
+from cdobatch.node import Node
+from cdobatch.operator import Operator
+from cdobatch.store import ResultStore
+from cdobatch.workqueue import (
+    WorkQueue,
+    finish_claimed,
+    run_claimed,
+    run_worker,
+    DONE,
+    FAILED,
+    PENDING,
+    RUNNING,
+)
+
+
+def make_op(files):
+    op = Operator("info")
+    op.configure(Node("root", "in", files))
+    return op
+
+
+def worker_main(path, cdo, worker):
+    run_worker(WorkQueue(path, retries=1), cdo, worker=worker, batch=2, poll=0.01)
+
+
+def test_publish_claim(tmp_path):
+    q = WorkQueue(str(tmp_path / "queue.db"), lease=60)
+    op = make_op(["a.nc", "b.nc", "c.nc"])
+
+    assert q.publish(op) == 3
+    # publishing again does not duplicate commands
+    assert q.publish(op) == 0
+
+    claimed = q.claim("w0", 2)
+    assert [c["input"] for _, c in claimed] == ["in/a.nc", "in/b.nc"]
+    assert q.status() == {PENDING: 1, RUNNING: 2, DONE: 0, FAILED: 0}
+
+    # claimed commands are not handed out twice
+    claimed = q.claim("w1", 5)
+    assert [c["input"] for _, c in claimed] == ["in/c.nc"]
+    assert q.claim("w1", 5) == []
+
+
+def test_expired_lease(tmp_path, make_cdo):
+    q = WorkQueue(str(tmp_path / "queue.db"), lease=-1)
+    q.publish(make_op(["a.nc"]))
+
+    first = q.claim("w0")
+    # lease already expired, another worker takes over
+    second = q.claim("w1")
+    assert first[0][0] == second[0][0]
+
+    r = Operator().run_command(make_cdo(), second[0][1])
+    q.complete("w1", second[0][0], r)
+
+    # results from the worker that lost the lease are dropped
+    q.complete("w0", first[0][0], r)
+    assert q.results()[0]["owner"] is None
+    assert q.status()[DONE] == 1
+
+
+def test_workers(tmp_path, make_cdo):
+    path = str(tmp_path / "queue.db")
+    q = WorkQueue(path)
+
+    files = [f"f{i}.nc" for i in range(40)] + ["bad.nc"]
+    q.publish(make_op(files))
+
+    cdo = make_cdo(fail={"bad": "Input/output error"})
+    procs = [
+        multiprocessing.Process(target=worker_main, args=(path, cdo, f"w{i}"))
+        for i in range(4)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    assert q.status() == {PENDING: 0, RUNNING: 0, DONE: 40, FAILED: 1}
+
+    failed = q.results(FAILED)
+    assert failed[0]["cmd"] == "cdo -info in/bad.nc"
+    # one retry for the transient error
+    assert failed[0]["attempts"] == 2
+    assert failed[0]["failure"] == "transient"
+
+    done = q.results(DONE)
+    assert done[0]["result"] == '["in/f0.nc"]'
+
+
+def make_yearly(tmp_path, years, time_chunks=0, store=None):
+    (tmp_path / "in").mkdir(exist_ok=True)
+    f = tmp_path / "in" / f"tas_{years}.nc"
+    if not f.exists():
+        f.write_text(years)
+
+    n = Node("root", str(tmp_path / "in"), [f"tas_{years}.nc"])
+    n.index_facets("{var}_{start}-{end}.nc")
+
+    out = Node("out", str(tmp_path / "out" / "yearly" / "tas"))
+    op = Operator("yearmean", out_node=out)
+    op.configure(n, time_chunks=time_chunks, store=store)
+    return op
+
+
+def test_worker_nested_outputs(tmp_path, make_cdo):
+    q = WorkQueue(str(tmp_path / "queue.db"))
+    cdo = make_cdo(write="{input}")
+    q.publish(make_yearly(tmp_path, "1960-1969"))
+
+    run_worker(q, cdo, worker="w0", poll=0.01)
+
+    # output directories are created by the worker
+    assert os.listdir(tmp_path / "out" / "yearly" / "tas") == ["tas_1960-1969.nc"]
+    assert q.results(DONE)[0]["result"] == '"{}"'.format(
+        tmp_path / "out" / "yearly" / "tas" / "tas_1960-1969.nc"
+    )
+
+
+def test_worker_deps(tmp_path, make_cdo):
+    q = WorkQueue(str(tmp_path / "queue.db"))
+    cdo = make_cdo(write="{input}", fail={"1954": "Variable not found!"})
+    assert q.publish(make_yearly(tmp_path, "1960-1969", time_chunks=4)) == 4
+    assert q.publish(make_yearly(tmp_path, "1950-1959", time_chunks=4)) == 4
+
+    # the merges wait for the chunks they read
+    claimed = q.claim("w0", 10)
+    assert [c["func_name"] for _, c in claimed] == ["yearmean"] * 6
+    assert q.claim("w0", 10) == []
+
+    for cmd_id, c in claimed:
+        q.complete("w0", cmd_id, run_claimed(Operator(), cdo, c, set()))
+
+    # the failed chunk fails its merge without running it
+    merges = q.claim("w0", 10)
+    assert [os.path.basename(c["output"]) for _, c in merges] == ["tas_1960-1969.nc"]
+
+    failed = q.results(FAILED)
+    assert ["-yearmean" in r["cmd"] for r in failed] == [True, False]
+    assert "-mergetime" in failed[1]["cmd"]
+    assert failed[1]["errmsg"].startswith("dependency failed")
+
+
+def test_worker_chunks(tmp_path, make_cdo):
+    q = WorkQueue(str(tmp_path / "queue" / "queue.db"))
+    cdo = make_cdo(write="{input}", fail={"1954": "Variable not found!"})
+    q.publish(make_yearly(tmp_path, "1960-1969", time_chunks=4))
+    q.publish(make_yearly(tmp_path, "1950-1959", time_chunks=4))
+
+    # chunks are written next to the queue so any node can merge them
+    chunk_dir = str(tmp_path / "queue" / "chunks")
+    claimed = q.claim("w0", 10)
+    assert all(c["output"].startswith(chunk_dir) for _, c in claimed)
+    for cmd_id, c in claimed:
+        state = q.complete("w0", cmd_id, run_claimed(Operator(), cdo, c, set()))
+        finish_claimed(q, c, state, {})
+
+    run_worker(q, cdo, worker="w0", poll=0.01)
+    assert os.listdir(tmp_path / "out" / "yearly" / "tas") == ["tas_1960-1969.nc"]
+
+    # no chunks are left behind, whether their merge ran or failed
+    assert os.listdir(chunk_dir) == []
+
+
+def test_worker_store(tmp_path, make_cdo):
+    store = ResultStore(str(tmp_path / "store"))
+    q = WorkQueue(str(tmp_path / "queue.db"))
+    cdo = make_cdo(write="{input}")
+    q.publish(make_yearly(tmp_path, "1960-1969", time_chunks=4, store=store))
+
+    run_worker(q, cdo, worker="w0", poll=0.01)
+
+    # the merged output is stored, configuring it again links it
+    store = ResultStore(str(tmp_path / "store"))
+    assert store.get_size() > 0
+    op = make_yearly(tmp_path, "1960-1969", time_chunks=4, store=store)
+    assert op.cdo_cmds == []
+
+
+def test_worker_release(tmp_path, monkeypatch, make_cdo):
+    monkeypatch.setattr(node, "scratch_root", lambda: str(tmp_path / "scratch"))
+
+    stage = Node("stage", str(tmp_path / "stage"), ["a.nc", "b.nc"], intermediate=True)
+    os.makedirs(stage.get_root_path())
+    for f in stage.files:
+        open(os.path.join(stage.get_root_path(), f), "w").close()
+
+    op = Operator("yearmean", out_node=Node("out", str(tmp_path / "out")))
+    op.configure(stage)
+
+    q = WorkQueue(str(tmp_path / "queue.db"))
+    cdo = make_cdo(write="{input}")
+    q.publish(op)
+
+    cmd_id, c = q.claim("w0")[0]
+    state = q.complete("w0", cmd_id, run_claimed(Operator(), cdo, c, set()))
+    finish_claimed(q, c, state, {})
+    assert os.path.isdir(stage.get_root_path())
+
+    # removed once every command reading it is done
+    run_worker(q, cdo, worker="w0", poll=0.01)
+    assert not os.path.exists(stage.get_root_path())